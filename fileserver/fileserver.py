@@ -32,6 +32,15 @@ def download(path):
     return send_from_directory(app.config["UPLOAD_FOLDER"], path)
 
 
+@app.route("/<path:path>", methods=["DELETE"])
+def delete(path):
+    target = Path(safe_join(app.config["UPLOAD_FOLDER"], path))
+    if not target.is_file():
+        return ("", 404)
+    target.unlink()
+    return (json.dumps([path]), 200)
+
+
 def main():
     parser = ArgumentParser(description=__doc__)
     parser.add_argument(
@@ -0,0 +1,325 @@
+from apierrors.base import BaseError
+
+
+class NotSupported(BaseError):
+    _default_code = 400
+    _default_subcode = 1
+    _default_msg = "Endpoint is not supported"
+
+
+class RequestPathHasInvalidVersion(BaseError):
+    _default_code = 400
+    _default_subcode = 2
+    _default_msg = "Request path has invalid version"
+
+
+class InvalidHeaders(BaseError):
+    _default_code = 400
+    _default_subcode = 5
+    _default_msg = "Invalid headers"
+
+
+class ImpersonationError(BaseError):
+    _default_code = 400
+    _default_subcode = 6
+    _default_msg = "Impersonation error"
+
+
+class InvalidId(BaseError):
+    _default_code = 400
+    _default_subcode = 10
+    _default_msg = "Invalid object id"
+
+
+class MissingRequiredFields(BaseError):
+    _default_code = 400
+    _default_subcode = 11
+    _default_msg = "Missing required fields"
+
+
+class ValidationError(BaseError):
+    _default_code = 400
+    _default_subcode = 12
+    _default_msg = "Validation error"
+
+
+class FieldsNotAllowedForRole(BaseError):
+    _default_code = 400
+    _default_subcode = 13
+    _default_msg = "Fields not allowed for role"
+
+
+class InvalidFields(BaseError):
+    _default_code = 400
+    _default_subcode = 14
+    _default_msg = "Fields not defined for object"
+
+
+class FieldsConflict(BaseError):
+    _default_code = 400
+    _default_subcode = 15
+    _default_msg = "Conflicting fields"
+
+
+class FieldsValueError(BaseError):
+    _default_code = 400
+    _default_subcode = 16
+    _default_msg = "Invalid value for fields"
+
+
+class BatchContainsNoItems(BaseError):
+    _default_code = 400
+    _default_subcode = 17
+    _default_msg = "Batch request contains no items"
+
+
+class BatchValidationError(BaseError):
+    _default_code = 400
+    _default_subcode = 18
+    _default_msg = "Batch request validation error"
+
+
+class InvalidLuceneSyntax(BaseError):
+    _default_code = 400
+    _default_subcode = 19
+    _default_msg = "Malformed lucene query"
+
+
+class FieldsTypeError(BaseError):
+    _default_code = 400
+    _default_subcode = 20
+    _default_msg = "Invalid type for fields"
+
+
+class InvalidRegexError(BaseError):
+    _default_code = 400
+    _default_subcode = 21
+    _default_msg = "Malformed regular expression"
+
+
+class InvalidEmailAddress(BaseError):
+    _default_code = 400
+    _default_subcode = 22
+    _default_msg = "Malformed email address"
+
+
+class InvalidDomainName(BaseError):
+    _default_code = 400
+    _default_subcode = 23
+    _default_msg = "Malformed domain name"
+
+
+class NotPublicObject(BaseError):
+    _default_code = 400
+    _default_subcode = 24
+    _default_msg = "Object is not public"
+
+
+class TaskError(BaseError):
+    _default_code = 400
+    _default_subcode = 100
+    _default_msg = "General task error"
+
+
+class InvalidTaskId(BaseError):
+    _default_code = 400
+    _default_subcode = 101
+    _default_msg = "Invalid task id"
+
+
+class TaskValidationError(BaseError):
+    _default_code = 400
+    _default_subcode = 102
+    _default_msg = "Task validation error"
+
+
+class InvalidTaskStatus(BaseError):
+    _default_code = 400
+    _default_subcode = 110
+    _default_msg = "Invalid task status"
+
+
+class TaskNotStarted(BaseError):
+    _default_code = 400
+    _default_subcode = 111
+    _default_msg = "Task not started (invalid task status)"
+
+
+class TaskInProgress(BaseError):
+    _default_code = 400
+    _default_subcode = 112
+    _default_msg = "Task in progress (invalid task status)"
+
+
+class TaskPublished(BaseError):
+    _default_code = 400
+    _default_subcode = 113
+    _default_msg = "Task published (invalid task status)"
+
+
+class TaskStatusUnknown(BaseError):
+    _default_code = 400
+    _default_subcode = 114
+    _default_msg = "Task unknown (invalid task status)"
+
+
+class InvalidTaskExecutionProgress(BaseError):
+    _default_code = 400
+    _default_subcode = 120
+    _default_msg = "Invalid task execution progress"
+
+
+class FailedChangingTaskStatus(BaseError):
+    _default_code = 400
+    _default_subcode = 121
+    _default_msg = "Failed changing task status. probably someone changed it before you"
+
+
+class MissingTaskFields(BaseError):
+    _default_code = 400
+    _default_subcode = 122
+    _default_msg = "Task is missing expected fields"
+
+
+class TaskCannotBeDeleted(BaseError):
+    _default_code = 400
+    _default_subcode = 123
+    _default_msg = "Task cannot be deleted"
+
+
+class TaskHasJobsRunning(BaseError):
+    _default_code = 400
+    _default_subcode = 125
+    _default_msg = "Task has jobs that haven't completed yet"
+
+
+class InvalidTaskType(BaseError):
+    _default_code = 400
+    _default_subcode = 126
+    _default_msg = "Invalid task type for this operations"
+
+
+class InvalidTaskInput(BaseError):
+    _default_code = 400
+    _default_subcode = 127
+    _default_msg = "Invalid task output"
+
+
+class InvalidTaskOutput(BaseError):
+    _default_code = 400
+    _default_subcode = 128
+    _default_msg = "Invalid task output"
+
+
+class TaskPublishInProgress(BaseError):
+    _default_code = 400
+    _default_subcode = 129
+    _default_msg = "Task publish in progress"
+
+
+class TaskNotFound(BaseError):
+    _default_code = 400
+    _default_subcode = 130
+    _default_msg = "Task not found"
+
+
+class ModelError(BaseError):
+    _default_code = 400
+    _default_subcode = 200
+    _default_msg = "General task error"
+
+
+class InvalidModelId(BaseError):
+    _default_code = 400
+    _default_subcode = 201
+    _default_msg = "Invalid model id"
+
+
+class ModelNotReady(BaseError):
+    _default_code = 400
+    _default_subcode = 202
+    _default_msg = "Model is not ready"
+
+
+class ModelIsReady(BaseError):
+    _default_code = 400
+    _default_subcode = 203
+    _default_msg = "Model is ready"
+
+
+class InvalidModelUri(BaseError):
+    _default_code = 400
+    _default_subcode = 204
+    _default_msg = "Invalid model uri"
+
+
+class ModelInUse(BaseError):
+    _default_code = 400
+    _default_subcode = 205
+    _default_msg = "Model is used by tasks"
+
+
+class ModelCreatingTaskExists(BaseError):
+    _default_code = 400
+    _default_subcode = 206
+    _default_msg = "Task that created this model exists"
+
+
+class InvalidUser(BaseError):
+    _default_code = 400
+    _default_subcode = 300
+    _default_msg = "Invalid user"
+
+
+class InvalidUserId(BaseError):
+    _default_code = 400
+    _default_subcode = 301
+    _default_msg = "Invalid user id"
+
+
+class UserIdExists(BaseError):
+    _default_code = 400
+    _default_subcode = 302
+    _default_msg = "User id already exists"
+
+
+class InvalidPreferencesUpdate(BaseError):
+    _default_code = 400
+    _default_subcode = 305
+    _default_msg = "Malformed key and/or value"
+
+
+class InvalidProjectId(BaseError):
+    _default_code = 400
+    _default_subcode = 401
+    _default_msg = "Invalid project id"
+
+
+class ProjectHasTasks(BaseError):
+    _default_code = 400
+    _default_subcode = 402
+    _default_msg = "Project has associated tasks"
+
+
+class ProjectNotFound(BaseError):
+    _default_code = 400
+    _default_subcode = 403
+    _default_msg = "Project not found"
+
+
+class ProjectHasModels(BaseError):
+    _default_code = 400
+    _default_subcode = 405
+    _default_msg = "Project has associated models"
+
+
+class DataValidationError(BaseError):
+    _default_code = 400
+    _default_subcode = 800
+    _default_msg = "Data validation error"
+
+
+class ExpectedUniqueData(BaseError):
+    _default_code = 400
+    _default_subcode = 801
+    _default_msg = "Value combination already exists"
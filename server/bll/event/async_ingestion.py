@@ -0,0 +1,145 @@
+import threading
+import time
+from queue import Queue, Full
+from typing import Callable, Tuple, Sequence, Optional
+
+import attr
+
+import database.utils as dbutils
+from config import config
+
+log = config.logger(__file__)
+
+
+class TicketStatus(object):
+    queued = "queued"
+    completed = "completed"
+    failed = "failed"
+
+
+@attr.s
+class IngestionTicket(object):
+    """
+    Tracks a batch of events accepted for asynchronous ingestion
+    """
+
+    id = attr.ib(type=str)
+    company = attr.ib(type=str)
+    events = attr.ib(type=int)
+    created = attr.ib(type=float, factory=time.time)
+    status = attr.ib(type=str, default=TicketStatus.queued)
+    added = attr.ib(type=int, default=0)
+    errors = attr.ib(type=int, default=0)
+    error_msg = attr.ib(type=str, default=None)
+    completed = attr.ib(type=float, default=None)
+
+    def to_dict(self):
+        return attr.asdict(self, filter=lambda a, _: a.name != "company")
+
+
+WriteFunc = Callable[[], Tuple[int, Sequence]]
+
+
+class AsyncIngestionQueue(object):
+    """
+    Bounded in-process buffer of prepared event batches, drained into ES by background writer threads.
+    Tickets are kept in-process, so they can only be polled through the same server process that accepted
+    the batch.
+    """
+
+    def __init__(
+        self,
+        workers: int = None,
+        max_pending_batches: int = None,
+        enqueue_timeout_sec: float = None,
+        ticket_ttl_sec: float = None,
+    ):
+        conf = config.get("services.events.async_ingestion", {})
+        self.workers = workers or conf.get("workers", 4)
+        self.enqueue_timeout_sec = (
+            enqueue_timeout_sec
+            if enqueue_timeout_sec is not None
+            else conf.get("enqueue_timeout_sec", 5)
+        )
+        self.ticket_ttl_sec = ticket_ttl_sec or conf.get("ticket_ttl_sec", 600)
+        self._queue = Queue(
+            maxsize=max_pending_batches or conf.get("max_pending_batches", 1000)
+        )
+        self._tickets = {}
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def submit(self, company_id: str, events: int, write: WriteFunc) -> IngestionTicket:
+        """
+        Queue a batch for writing and return its ticket.
+        If the buffer stays full for longer than the enqueue timeout, the batch is written in the calling
+        thread so that no data is dropped and the caller gets natural back-pressure.
+        """
+        self._start_workers()
+        ticket = IngestionTicket(id=dbutils.id(), company=company_id, events=events)
+        with self._lock:
+            self._prune_tickets()
+            self._tickets[ticket.id] = ticket
+
+        try:
+            self._queue.put((ticket, write), timeout=self.enqueue_timeout_sec)
+        except Full:
+            log.warning(
+                f"Ingestion buffer is full, writing {events} events synchronously"
+            )
+            self._process(ticket, write)
+
+        return ticket
+
+    def get_ticket(self, company_id: str, ticket_id: str) -> Optional[IngestionTicket]:
+        with self._lock:
+            ticket = self._tickets.get(ticket_id)
+        if not ticket or ticket.company != company_id:
+            return None
+        return ticket
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _start_workers(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._worker, name=f"events_ingestion_{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _worker(self):
+        while True:
+            ticket, write = self._queue.get()
+            try:
+                self._process(ticket, write)
+            finally:
+                self._queue.task_done()
+
+    @staticmethod
+    def _process(ticket: IngestionTicket, write: WriteFunc):
+        try:
+            added, errors = write()
+            ticket.added = added
+            ticket.errors = len(errors)
+            ticket.status = TicketStatus.completed
+        except Exception as ex:
+            log.exception(f"Failed writing events batch for ticket {ticket.id}")
+            ticket.error_msg = str(ex)
+            ticket.status = TicketStatus.failed
+        finally:
+            ticket.completed = time.time()
+
+    def _prune_tickets(self):
+        expired = time.time() - self.ticket_ttl_sec
+        for ticket_id in [
+            t.id for t in self._tickets.values() if t.completed and t.completed < expired
+        ]:
+            del self._tickets[ticket_id]
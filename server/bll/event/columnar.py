@@ -0,0 +1,92 @@
+import base64
+import binascii
+import sys
+from array import array
+from typing import Sequence, Union
+
+from apierrors import errors
+
+ColumnValue = Union[str, Sequence[float]]
+
+
+def decode_float64_column(name: str, value: ColumnValue) -> Sequence[float]:
+    """
+    Decode a column of numbers sent either as a JSON array or as a base64 encoded
+    buffer of little-endian float64 values
+    """
+    if isinstance(value, str):
+        try:
+            buffer = base64.b64decode(value, validate=True)
+        except (binascii.Error, ValueError) as ex:
+            raise errors.bad_request.FieldsValueError(
+                f"invalid base64 buffer: {ex}", field=name
+            )
+        if len(buffer) % 8:
+            raise errors.bad_request.FieldsValueError(
+                "base64 buffer length should be a multiple of 8 bytes (float64)",
+                field=name,
+            )
+        column = array("d")
+        column.frombytes(buffer)
+        if sys.byteorder != "little":
+            column.byteswap()
+        return column
+
+    if not isinstance(value, (list, tuple)):
+        raise errors.bad_request.FieldsValueError(
+            "expected an array of numbers or a base64 string", field=name
+        )
+    if not all(
+        isinstance(v, (int, float)) and not isinstance(v, bool) for v in value
+    ):
+        raise errors.bad_request.FieldsValueError(
+            "array items should be numbers", field=name
+        )
+    return value
+
+
+SERIES_ENCODINGS = {"float64": "d", "float32": "f"}
+""" Response encodings of number series and their array typecodes """
+
+
+def encode_column(values: Sequence[float], encoding: str = "float64") -> str:
+    """ Encode a column of numbers as a base64 buffer of little-endian float64 or float32 values """
+    column = array(SERIES_ENCODINGS[encoding], values)
+    if sys.byteorder != "little":
+        column.byteswap()
+    return base64.b64encode(column.tobytes()).decode("ascii")
+
+
+def encode_series(metrics: dict, encoding: str) -> dict:
+    """
+    Encode every {"x": [...], "y": [...]} series of a two level histogram dictionary (e.g. metric -> variant
+    -> series). The y values are encoded using the requested encoding. The x values are encoded as float64 and
+    every distinct x axis is encoded once: the series reference it by its key in the returned axes
+    """
+    axes = {}
+    axis_keys = {}
+    encoded = {}
+    for key, series_by_key in metrics.items():
+        encoded_by_key = encoded[key] = {}
+        for series_key, series in series_by_key.items():
+            x = tuple(series["x"])
+            axis_key = axis_keys.get(x)
+            if axis_key is None:
+                axis_key = axis_keys[x] = str(len(axis_keys))
+                axes[axis_key] = encode_column(x)
+            encoded_by_key[series_key] = {
+                **{k: v for k, v in series.items() if k not in ("x", "y")},
+                "x_axis": axis_key,
+                "y": encode_column(series["y"], encoding),
+            }
+    return dict(metrics=encoded, axes=axes, encoding=encoding)
+
+
+def decode_int_column(name: str, value: ColumnValue) -> Sequence[int]:
+    """ Decode a column of integral numbers (sent as float64 when base64 encoded) """
+    column = decode_float64_column(name, value)
+    if not all(float(v).is_integer() for v in column):
+        raise errors.bad_request.FieldsValueError(
+            "values should be integers", field=name
+        )
+    return [int(v) for v in column]
@@ -0,0 +1,47 @@
+from typing import Sequence, Tuple
+
+import numpy as np
+
+
+def downsample_min_max(
+    x: Sequence, y: Sequence[float], max_points: int
+) -> Tuple[list, list]:
+    """
+    Reduce a series sorted by x to at most max_points points while preserving its shape.
+    The x range is split into equal width buckets and the points with the min and max value in
+    each bucket are kept, together with the first and last points of the series.
+    """
+    if not max_points or len(x) <= max_points:
+        return list(x), list(y)
+    if max_points < 4:
+        return [x[0], x[-1]][:max_points], [y[0], y[-1]][:max_points]
+
+    xs = np.asarray(x)
+    ys = np.asarray(y, dtype=float)
+    buckets = (max_points - 2) // 2
+    span = xs[-1] - xs[0] + 1
+    bucket_ids = np.minimum((xs - xs[0]) * buckets // span, buckets - 1).astype(int)
+
+    # sort by bucket and then by value, so that each bucket starts with its min and ends with its max
+    order = np.lexsort((ys, bucket_ids))
+    sorted_ids = bucket_ids[order]
+    firsts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    lasts = np.r_[firsts[1:] - 1, len(order) - 1]
+
+    keep = np.unique(np.concatenate((order[firsts], order[lasts], [0, len(xs) - 1])))
+    return xs[keep].tolist(), ys[keep].tolist()
+
+
+def downsample_metrics(metrics: dict, max_points: int) -> dict:
+    """
+    Downsample in place every {"x": [...], "y": [...]} series of a two level histogram dictionary
+    (e.g. metric -> variant -> series)
+    """
+    if not max_points:
+        return metrics
+    for series_by_key in metrics.values():
+        for series in series_by_key.values():
+            series["x"], series["y"] = downsample_min_max(
+                series["x"], series["y"], max_points
+            )
+    return metrics
@@ -1,7 +1,12 @@
+import math
+import time
 from collections import defaultdict
 from contextlib import closing
 from datetime import datetime
-from operator import attrgetter
+from functools import partial
+from itertools import islice
+from operator import attrgetter, itemgetter
+from typing import Iterable, Iterator, Optional, Sequence, Tuple
 
 import attr
 import six
@@ -14,12 +19,32 @@ from nested_dict import nested_dict
 import database.utils as dbutils
 import es_factory
 from apierrors import errors
+from .async_ingestion import AsyncIngestionQueue, IngestionTicket
+from .columnar import ColumnValue, decode_float64_column, decode_int_column
+from .downsampling import downsample_metrics
+from .index_catalog import IndexCatalog
+from .index_rollover import WriteAliases, get_read_index, get_write_index
+from .log_chunks import LINE_FIELDS, LogChunker, get_chunk_id, unpack_log_events
+from .log_export import iter_sliced_scroll
+from .log_tail import log_tail_notifier
+from .plot_store import PlotStore
+from .refresh_policy import RefreshPolicy, RefreshTracker
+from .scalar_rollup import ROLLUP_EVENT_TYPE, ScalarRollup
+from .search_cursor import decode_cursor, encode_cursor, is_cursor
 from bll.task import TaskBLL
+from bll.task.stats_aggregator import (
+    MetricCatalogStats,
+    MetricStats,
+    task_stats_aggregator,
+)
+from config import config
 from database.errors import translate_errors_context
+from database.model.task.metrics_catalog import TaskMetric
 from database.model.task.task import Task
-from database.model.task.metrics import MetricEvent
 from timing_context import TimingContext
 
+log = config.logger(__file__)
+
 
 class EventType(Enum):
     metrics_scalar = "training_stats_scalar"
@@ -40,21 +65,230 @@ class TaskEventsResult(object):
     next_scroll_id = attr.ib(type=str, default=None)
 
 
+@attr.s
+class SearchRequest(object):
+    """
+    A single search of a multi_search batch. Searches of indices that do not exist are not sent
+    and return an empty result
+    """
+
+    index = attr.ib(type=str)
+    body = attr.ib(type=dict)
+    routing = attr.ib(type=str, default=None)
+
+
+@attr.s
+class EventsBatchStats(object):
+    """
+    Per-task statistics collected while converting a batch of events into ES actions
+    """
+
+    events = attr.ib(type=int, default=0)
+    task_ids = attr.ib(type=set, factory=set)
+    task_iteration = attr.ib(type=dict, factory=lambda: defaultdict(lambda: 0))
+    task_last_events = attr.ib(
+        type=dict, factory=lambda: nested_dict(3, dict)
+    )  # task_id -> metric_hash -> variant_hash -> MetricEvent
+    task_metric_stats = attr.ib(
+        type=dict, factory=lambda: defaultdict(dict)
+    )  # task_id -> (metric_hash, variant_hash) -> MetricStats
+    task_metric_catalog = attr.ib(
+        type=dict, factory=lambda: defaultdict(dict)
+    )  # task_id -> (event_type, metric, variant) -> MetricCatalogStats
+
+
 class EventBLL(object):
     id_fields = ["task", "iter", "metric", "variant", "key"]
+    bulk_chunk_size = 500
+    log_search_matches = ("term", "phrase", "regex")
 
     def __init__(self, events_es=None):
         self.es = events_es if events_es is not None else es_factory.connect("events")
+        self._ingestion_queue = None
+        self.refresh_tracker = RefreshTracker(self.es)
+        self.index_catalog = IndexCatalog(self.es)
+        self.write_aliases = WriteAliases(self.es)
+        self.plot_store = PlotStore()
+        log_storage = config.get("services.events.log_storage", {})
+        log_mode = log_storage.get("mode", "events")
+        if log_mode not in ("events", "chunks"):
+            raise ValueError(f"Invalid events log storage mode: {log_mode}")
+        self.log_chunks = log_mode == "chunks"
+        self.log_chunk_max_lines = log_storage.get("max_chunk_lines", 500)
+        self.log_chunk_max_bytes = log_storage.get("max_chunk_bytes", 65536)
+        self.log_indexed = log_storage.get("indexed", False)
+        if self.log_indexed and self.log_chunks:
+            raise ValueError("Indexed log storage requires the events log storage mode")
+        self.scalar_rollup = ScalarRollup()
+        self.watermark_grace_ms = int(
+            config.get("services.events.watermark_grace_sec", 5) * 1000
+        )
 
-    def add_events(self, company_id, events, worker):
-        actions = []
-        task_ids = set()
-        task_iteration = defaultdict(lambda: 0)
-        task_last_events = nested_dict(
-            3, dict
-        )  # task_id -> metric_hash -> variant_hash -> MetricEvent
+    @property
+    def ingestion_queue(self) -> AsyncIngestionQueue:
+        if self._ingestion_queue is None:
+            self._ingestion_queue = AsyncIngestionQueue()
+        return self._ingestion_queue
+
+    def add_events(self, company_id, events: Iterable[dict], worker):
+        """
+        Write the events into ES and update the statistics of the related tasks.
+        Events are consumed one at a time and written in chunks, so the events can be streamed from the request
+        body. An invalid event stops the ingestion, however chunks preceding it may have already been written
+        (and are reflected in the task statistics).
+        :return: number of added events and list of bulk errors
+        """
+        stats = EventsBatchStats()
+        actions = self._iter_actions(company_id, events, worker, stats)
+        return self._write_events(company_id, actions, stats)
+
+    def add_events_async(self, company_id, events, worker) -> IngestionTicket:
+        """
+        Validate the events and queue them for writing by the background ingestion workers.
+        The returned ticket can be polled for the final added/errors counts.
+        """
+        stats = EventsBatchStats()
+        actions = list(self._iter_actions(company_id, events, worker, stats))
+        return self.ingestion_queue.submit(
+            company_id,
+            events=stats.events,
+            write=partial(self._write_events, company_id, actions, stats),
+        )
+
+    def get_ingestion_ticket(self, company_id, ticket_id) -> IngestionTicket:
+        ticket = self.ingestion_queue.get_ticket(company_id, ticket_id)
+        if not ticket:
+            raise errors.bad_request.InvalidId(
+                "unknown ingestion ticket", ticket=ticket_id
+            )
+        return ticket
+
+    def add_scalars(
+        self,
+        company_id,
+        task_id,
+        metric,
+        variant,
+        iterations: ColumnValue,
+        values: ColumnValue,
+        timestamps: ColumnValue = None,
+        worker=None,
+    ):
+        """
+        Add a series of scalar events of a single task metric/variant sent in columnar form.
+        Columns are either arrays of numbers or base64 encoded buffers of little-endian float64 values,
+        and should all be of the same length. If no timestamps are sent, the current time is used.
+        Task statistics are taken from the series tail instead of being tracked per event.
+        :return: number of added events and list of bulk errors
+        """
+        iterations = decode_int_column("iter", iterations)
+        values = decode_float64_column("values", values)
+        columns = dict(iter=len(iterations), values=len(values))
+        if timestamps is not None:
+            timestamps = decode_int_column("timestamps", timestamps)
+            columns["timestamps"] = len(timestamps)
+        if len(set(columns.values())) != 1:
+            raise errors.bad_request.FieldsValueError(
+                "columns should be of the same length", **columns
+            )
+        if not iterations:
+            return 0, []
+
+        TaskBLL.assert_exists_cached(company_id, task_id)
+
+        event_type = EventType.metrics_scalar.value
+        index_name = EventBLL.get_write_index_name(company_id, event_type)
+        now = es_factory.get_timestamp_millis()
+        es_timestamp = es_factory.get_es_timestamp_str()
+        metric_variant = self.get_metric_variant(dict(metric=metric, variant=variant))
+
+        def make_event(i):
+            return {
+                "type": event_type,
+                "task": task_id,
+                "iter": iterations[i],
+                "metric": metric,
+                "variant": variant,
+                "metric_variant": metric_variant,
+                "value": values[i],
+                "timestamp": timestamps[i] if timestamps is not None else now,
+                "worker": worker,
+                # @timestamp indicates the time the event is written, not when it happened
+                "@timestamp": es_timestamp,
+            }
 
-        for event in events:
+        actions = (
+            {
+                "_op_type": "index",
+                "_index": index_name,
+                "_type": "event",
+                "_id": self._get_event_id(event),
+                "_routing": task_id,
+                "_source": event,
+            }
+            for event in map(make_event, range(len(iterations)))
+        )
+
+        stats = EventsBatchStats(events=len(iterations), task_ids={task_id})
+        stats.task_iteration[task_id] = max(iterations)
+        self._update_last_metric_event_for_task(
+            task_last_events=stats.task_last_events,
+            task_id=task_id,
+            event=make_event(len(iterations) - 1),
+        )
+        metric_stats = MetricStats(
+            min_value=min(values),
+            max_value=max(values),
+            last_values=list(zip(iterations, values)),
+        )
+        metric_stats.last_values = metric_stats.get_last_values()
+        stats.task_metric_stats[task_id][
+            (dbutils.hash_field_name(metric), dbutils.hash_field_name(variant))
+        ] = metric_stats
+        stats.task_metric_catalog[task_id][
+            (event_type, metric, variant)
+        ] = MetricCatalogStats(
+            first_iter=min(iterations), last_iter=max(iterations), count=len(iterations)
+        )
+
+        return self._write_events(company_id, actions, stats)
+
+    def _iter_verified_events(self, company_id, events: Iterable[dict]) -> Iterator[dict]:
+        """
+        Yield the events, verifying the tasks of every chunk of events with a single lookup
+        before any of the chunk events is yielded
+        """
+        verified_task_ids = set()
+        events = iter(events)
+        while True:
+            chunk = list(islice(events, self.bulk_chunk_size))
+            if not chunk:
+                return
+            task_ids = {
+                event.get("task") for event in chunk if isinstance(event, dict)
+            } - verified_task_ids
+            task_ids.discard(None)
+            if task_ids:
+                TaskBLL.assert_exists_cached(company_id, task_ids)
+                verified_task_ids.update(task_ids)
+            yield from chunk
+
+    def _iter_actions(
+        self, company_id, events: Iterable[dict], worker, stats: EventsBatchStats
+    ) -> Iterator[dict]:
+        """
+        Normalize the events and yield the ES actions, counting the events on the way.
+        In the log chunks storage mode, task log events are packed into chunk documents.
+        Raises if an event is invalid or references an unknown task.
+        """
+        chunker = (
+            LogChunker(
+                max_lines=self.log_chunk_max_lines, max_bytes=self.log_chunk_max_bytes
+            )
+            if self.log_chunks
+            else None
+        )
+        for event in self._iter_verified_events(company_id, events):
             # remove spaces from event type
             if "type" not in event:
                 raise errors.BadRequest("Event must have a 'type' field", event=event)
@@ -94,7 +328,11 @@ class EventBLL(object):
                 event["value"] = event["values"]
                 del event["values"]
 
-            index_name = EventBLL.get_index_name(company_id, event_type)
+            metric_variant = self.get_metric_variant(event)
+            if metric_variant:
+                event["metric_variant"] = metric_variant
+
+            index_name = EventBLL.get_write_index_name(company_id, event_type)
             es_action = {
                 "_op_type": "index",  # overwrite if exists with same ID
                 "_index": index_name,
@@ -109,85 +347,171 @@ class EventBLL(object):
                 es_action["_id"] = dbutils.id()
 
             task_id = event.get("task")
-            if task_id is not None:
-                es_action["_routing"] = task_id
-                task_ids.add(task_id)
-                if iter is not None:
-                    task_iteration[task_id] = max(iter, task_iteration[task_id])
-
-                if event_type == EventType.metrics_scalar.value:
-                    self._update_last_metric_event_for_task(
-                        task_last_events=task_last_events, task_id=task_id, event=event
-                    )
-            else:
-                es_action["_routing"] = task_id
-
-            actions.append(es_action)
-
-        if task_ids:
-            # verify task_ids
-            with translate_errors_context(), TimingContext("mongo", "task_by_ids"):
-                res = Task.objects(id__in=task_ids, company=company_id).only("id")
-                if len(res) < len(task_ids):
-                    invalid_task_ids = tuple(set(task_ids) - set(r.id for r in res))
-                    raise errors.bad_request.InvalidTaskId(
-                        company=company_id, ids=invalid_task_ids
-                    )
+            es_action["_routing"] = task_id
 
-        errors_in_bulk = []
-        added = 0
-        chunk_size = 500
-        with translate_errors_context(), TimingContext("es", "events_add_batch"):
-            # TODO: replace it with helpers.parallel_bulk in the future once the parallel pool leak is fixed
-            with closing(
-                helpers.streaming_bulk(
-                    self.es,
-                    actions,
-                    chunk_size=chunk_size,
-                    # thread_count=8,
-                    refresh=True,
-                )
-            ) as it:
-                for success, info in it:
-                    if success:
-                        added += chunk_size
-                    else:
-                        errors_in_bulk.append(info)
-
-            last_metrics = {
-                t.id: t.to_proper_dict().get("last_metrics", {})
-                for t in Task.objects(id__in=task_ids, company=company_id).only(
-                    "last_metrics"
-                )
-            }
+            # plot bodies are stored per task, only once the task is known to exist
+            if event_type == EventType.metrics_plot.value and task_id is not None:
+                self.plot_store.offload(event)
 
-            remaining_tasks = set()
-            now = datetime.utcnow()
-            for task_id in task_ids:
-                # Update related tasks. For reasons of performance, we prefer to update all of them and not only those
-                #  who's events were successful
-
-                updated = self._update_task(
-                    company_id=company_id,
-                    task_id=task_id,
-                    now=now,
-                    iter=task_iteration.get(task_id),
-                    last_events=task_last_events.get(task_id),
-                    last_metrics=last_metrics.get(task_id),
-                )
+            stats.events += 1
+            if chunker and event_type == EventType.task_log.value and task_id is not None:
+                for log_chunk in chunker.add(event):
+                    yield self._get_log_chunk_action(index_name, log_chunk)
+                continue
 
-                if not updated:
-                    remaining_tasks.add(task_id)
-                    continue
+            yield es_action
 
-            if remaining_tasks:
-                TaskBLL.set_last_update(remaining_tasks, company_id, last_update=now)
+        if chunker:
+            for log_chunk in chunker.flush():
+                yield self._get_log_chunk_action(
+                    EventBLL.get_write_index_name(company_id, log_chunk["type"]),
+                    log_chunk,
+                )
 
-        # Compensate for always adding chunk_size on success (last chunk is probably smaller)
-        added = min(added, len(actions))
+    @staticmethod
+    def _get_log_chunk_action(index_name, log_chunk: dict) -> dict:
+        return {
+            "_op_type": "index",
+            "_index": index_name,
+            "_type": "event",
+            "_id": get_chunk_id(),
+            "_routing": log_chunk["task"],
+            "_source": log_chunk,
+        }
+
+    def _write_events(
+        self, company_id, actions: Iterable[dict], stats: EventsBatchStats
+    ):
+        """
+        Write the actions into ES in chunks and update the statistics of the related tasks.
+        Only a single chunk of actions is held in memory at any time.
+        If the actions iteration fails (an invalid event), the chunks that were already written
+        are still accounted for in the task statistics, the indices catalog and the refresh tracking
+        """
+        errors_in_bulk = []
+        added = 0
+        index_tasks = defaultdict(lambda: defaultdict(set))  # policy -> index -> task IDs
+        log_task_ids = set()
+
+        try:
+            with translate_errors_context(), TimingContext("es", "events_add_batch"):
+                actions = iter(actions)
+                while True:
+                    chunk = list(islice(actions, self.bulk_chunk_size))
+                    if not chunk:
+                        break
+
+                    actions_by_policy = defaultdict(list)
+                    for action in chunk:
+                        source = action["_source"]
+                        policy = self.refresh_tracker.get_policy(source["type"])
+                        actions_by_policy[policy].append(action)
+                        index_tasks[policy][action["_index"]].add(action["_routing"])
+                        if source["type"] == EventType.task_log.value:
+                            log_task_ids.add(action["_routing"])
+                        for event in unpack_log_events(source):
+                            self._add_event_stats(stats, event)
+
+                    for index in {action["_index"] for action in chunk}:
+                        self.write_aliases.ensure(index)
+
+                    for policy, policy_actions in actions_by_policy.items():
+                        # TODO: replace it with helpers.parallel_bulk in the future once the parallel pool leak is fixed
+                        with closing(
+                            helpers.streaming_bulk(
+                                self.es,
+                                policy_actions,
+                                chunk_size=self.bulk_chunk_size,
+                                # thread_count=8,
+                                # "true" policy is applied once for the whole batch and not for every chunk
+                                refresh=(
+                                    RefreshPolicy.wait_for
+                                    if policy == RefreshPolicy.wait_for
+                                    else RefreshPolicy.none
+                                ),
+                            )
+                        ) as it:
+                            # results are returned in the order of the actions
+                            for action, (success, info) in zip(policy_actions, it):
+                                if success:
+                                    added += action["_source"].get("line_count", 1)
+                                else:
+                                    errors_in_bulk.append(info)
+
+                    scalar_events = [
+                        action["_source"]
+                        for action in chunk
+                        if action["_source"]["type"] == EventType.metrics_scalar.value
+                    ]
+                    if scalar_events:
+                        self._write_scalar_rollups(company_id, scalar_events)
+        finally:
+            self._events_written(company_id, stats, index_tasks, log_task_ids)
 
         return added, errors_in_bulk
 
+    def _events_written(
+        self, company_id, stats: EventsBatchStats, index_tasks: dict, log_task_ids: set
+    ):
+        """
+        Update the indices catalog, the refresh tracking, the log followers and the related tasks
+        with the written events
+        """
+        for policy, indices in index_tasks.items():
+            for index in indices:
+                self.index_catalog.index_written(index)
+            if policy == RefreshPolicy.true:
+                self.refresh_tracker.refresh(sorted(indices))
+            for index, index_task_ids in indices.items():
+                self.refresh_tracker.writes_done(index, index_task_ids, policy)
+
+        # the written log events are visible to the followers through the refresh tracker
+        log_tail_notifier.notify(log_task_ids)
+
+        # Update related tasks. For reasons of performance, we prefer to update all of them and not only those
+        #  who's events were successful
+        now = datetime.utcnow()
+        for task_id in stats.task_ids:
+            task_stats_aggregator.add(
+                company_id=company_id,
+                task_id=task_id,
+                last_update=now,
+                last_iteration=stats.task_iteration.get(task_id),
+                last_events=stats.task_last_events.get(task_id),
+                metric_stats=stats.task_metric_stats.get(task_id),
+                metric_catalog=stats.task_metric_catalog.get(task_id),
+            )
+
+    def _write_scalar_rollups(self, company_id, events: Sequence[dict]):
+        """
+        Merge the scalar events into the rollup buckets. Rollup failures do not fail the events
+        ingestion, the affected tasks are read from the raw events instead
+        """
+        index = EventBLL.get_index_name(company_id, ROLLUP_EVENT_TYPE)
+        actions = self.scalar_rollup.get_actions(index, events)
+        if not actions:
+            return
+
+        failed = 0
+        with TimingContext("es", "events_scalar_rollup"), closing(
+            helpers.streaming_bulk(
+                self.es,
+                actions,
+                chunk_size=self.bulk_chunk_size,
+                raise_on_error=False,
+                raise_on_exception=False,
+            )
+        ) as it:
+            for success, _ in it:
+                failed += not success
+        if failed:
+            log.warning(f"Failed updating {failed} scalar rollup buckets")
+
+        self.index_catalog.index_written(index)
+        self.refresh_tracker.writes_done(
+            index, {action["_routing"] for action in actions}, RefreshPolicy.none
+        )
+
     def _update_last_metric_event_for_task(self, task_last_events, task_id, event):
         """
         Update task_last_events structure for the provided task_id with the provided event details if this event is more
@@ -210,44 +534,76 @@ class EventBLL(object):
         if timestamp is None or timestamp < event["timestamp"]:
             last_events[metric_hash][variant_hash] = event
 
-    def _update_task(
-        self, company_id, task_id, now, iter=None, last_events=None, last_metrics=None
-    ):
+    @staticmethod
+    def _update_metric_stats_for_task(task_metric_stats, task_id, event):
         """
-        Update task information in DB with aggregated results after handling event(s) related to this task.
-
-        This updates the task with the highest iteration value encountered during the last events update, as well
-        as the latest metric/variant scalar values reported (according to the report timestamp) and the task's last
-        update time.
+        Update the min/max and latest values of the event's metric/variant in the task_metric_stats structure.
+        task_metric_stats contains [(hashed_metric_name, hashed_variant_name) -> MetricStats]
         """
-        fields = {}
-
-        if iter is not None:
-            fields["last_iteration"] = iter
+        metric = event.get("metric")
+        variant = event.get("variant")
+        value = event.get("value")
+        if not (metric and variant) or not isinstance(value, (int, float)):
+            return
 
-        if last_events:
+        key = (dbutils.hash_field_name(metric), dbutils.hash_field_name(variant))
+        metric_stats = task_metric_stats[task_id].get(key)
+        if metric_stats is None:
+            task_metric_stats[task_id][key] = MetricStats.from_value(event.get("iter"), value)
+        else:
+            metric_stats.add(event.get("iter"), value)
 
-            def get_metric_event(ev):
-                me = MetricEvent.from_dict(**ev)
-                if "timestamp" in ev:
-                    me.timestamp = datetime.utcfromtimestamp(ev["timestamp"] / 1000)
-                return me
+    def _add_event_stats(self, stats: EventsBatchStats, event: dict):
+        """ Add a written event to the statistics of its task """
+        task_id = event.get("task")
+        if task_id is None:
+            return
 
-            new_last_metrics = nested_dict(2, MetricEvent)
-            new_last_metrics.update(last_metrics)
+        stats.task_ids.add(task_id)
+        iter = event.get("iter")
+        if iter is not None:
+            stats.task_iteration[task_id] = max(iter, stats.task_iteration[task_id])
 
-            for metric_hash, variants in last_events.items():
-                for variant_hash, event in variants.items():
-                    new_last_metrics[metric_hash][variant_hash] = get_metric_event(
-                        event
-                    )
+        if event.get("metric_variant"):
+            self._update_metric_catalog_for_task(
+                task_metric_catalog=stats.task_metric_catalog,
+                task_id=task_id,
+                event=event,
+            )
 
-            fields["last_metrics"] = new_last_metrics.to_dict()
+        if event["type"] == EventType.metrics_scalar.value:
+            self._update_last_metric_event_for_task(
+                task_last_events=stats.task_last_events, task_id=task_id, event=event
+            )
+            self._update_metric_stats_for_task(
+                task_metric_stats=stats.task_metric_stats, task_id=task_id, event=event
+            )
 
-        if not fields:
-            return False
+    @staticmethod
+    def _update_metric_catalog_for_task(task_metric_catalog, task_id, event):
+        """
+        Update the iterations range and events count of the event's type and metric/variant in the
+        task_metric_catalog structure, along with the url of debug image events
+        """
+        key = (event["type"], event["metric"], event["variant"])
+        catalog_stats = task_metric_catalog[task_id].get(key)
+        if catalog_stats is None:
+            catalog_stats = task_metric_catalog[task_id][key] = MetricCatalogStats()
+        catalog_stats.add(event.get("iter"))
+        if (
+            event["type"] == EventType.metrics_image.value
+            and event.get("iter") is not None
+            and event.get("url")
+        ):
+            catalog_stats.images[event["iter"]] = event["url"]
 
-        return TaskBLL.update_statistics(task_id, company_id, last_update=now, **fields)
+    @staticmethod
+    def get_metric_variant(event: dict) -> Optional[str]:
+        """ Combined metric/variant key, indexed so that events can be grouped by it without scripts """
+        metric, variant = event.get("metric"), event.get("variant")
+        if metric is None or variant is None:
+            return None
+        return f"{metric}/{variant}"
 
     def _get_event_id(self, event):
         id_values = (str(event[field]) for field in self.id_fields if field in event)
@@ -261,34 +617,359 @@ class EventBLL(object):
         event_type=None,
         batch_size=10000,
         scroll_id=None,
+        only_fields: Sequence[str] = None,
     ):
+        """
+        Return a page of the task events sorted by timestamp, along with a cursor for the next page.
+        Pages are fetched with search_after, so no search context is kept open on the cluster.
+        Log chunk documents are unpacked into their lines and the page size counts lines. A chunk that
+        does not fit in the page is continued in the next page, using the lines offset kept in the cursor.
+        Legacy scroll IDs are still continued (and cleared once exhausted).
+        :param only_fields: event fields projection, see _get_source_filter
+        """
+        if scroll_id and not is_cursor(scroll_id):
+            es_res = self._continue_legacy_scroll(scroll_id)
+            events = [
+                event
+                for hit in es_res["hits"]["hits"]
+                for event in unpack_log_events(hit["_source"])
+            ]
+            self.plot_store.rehydrate(events)
+            return events, es_res.get("_scroll_id"), es_res["hits"]["total"]
+
+        size = min(batch_size, 10000)
+        if event_type is None:
+            event_type = "*"
+
+        es_index = EventBLL.get_index_name(company_id, event_type)
+
+        if not self.index_catalog.exists(es_index):
+            return [], None, 0
+
+        self.refresh_tracker.ensure_visible(es_index, [task_id])
+
+        search_after, offset = None, 0
         if scroll_id:
-            with translate_errors_context(), TimingContext("es", "task_log_events"):
-                es_res = self.es.scroll(scroll_id=scroll_id, scroll="1h")
-        else:
-            size = min(batch_size, 10000)
-            if event_type is None:
-                event_type = "*"
+            search_after = decode_cursor(scroll_id)
+            # cursors into the middle of a log chunk hold the chunk's lines offset last
+            if len(search_after) % 2:
+                *search_after, offset = search_after
 
-            es_index = EventBLL.get_index_name(company_id, event_type)
+        es_req = {
+            # chunks are written in order, so the tiebreaker follows the timestamp order
+            "sort": [{"timestamp": {"order": order}}, {"_uid": {"order": order}}],
+            "query": {"bool": {"must": [{"term": {"task": task_id}}]}},
+            "aggs": {"lines": {"sum": {"field": "line_count", "missing": 1}}},
+        }
+        source = self._get_source_filter(only_fields)
+        if source:
+            es_req["_source"] = source
+
+        events = []
+        next_cursor = scroll_id
+        total_events = None
+        lines_per_doc = self.log_chunk_max_lines if self.log_chunks else 1
+        while len(events) < size:
+            docs = min(10000, math.ceil((size - len(events) + offset) / lines_per_doc))
+            es_req["size"] = docs
+            if search_after:
+                es_req["search_after"] = search_after
+            with translate_errors_context(), TimingContext("es", "scroll_task_events"):
+                es_res = self.es.search(
+                    index=EventBLL.get_search_index_name(company_id, event_type),
+                    body=es_req,
+                    routing=task_id,
+                )
+            if total_events is None:
+                total_events = int(es_res["aggregations"]["lines"]["value"])
+                es_req.pop("aggs")
+
+            hits = es_res["hits"]["hits"]
+            doc_lines = 0
+            for hit in hits:
+                doc_events = unpack_log_events(hit["_source"], reverse=(order == "desc"))
+                doc_lines += len(doc_events)
+                remaining = size - len(events)
+                events.extend(doc_events[offset:offset + remaining])
+                if offset + remaining < len(doc_events):
+                    offset += remaining
+                    next_cursor = encode_cursor([*(search_after or []), offset])
+                    break
+                search_after, offset = hit["sort"], 0
+                next_cursor = encode_cursor(search_after)
+            else:
+                if len(hits) < docs:
+                    break
+                lines_per_doc = max(1, doc_lines // len(hits))
+                continue
+            break
 
-            if not self.es.indices.exists(es_index):
-                return [], None, 0
+        self.plot_store.rehydrate(events)
+        return events, next_cursor, total_events
 
-            es_req = {
-                "size": size,
-                "sort": {"timestamp": {"order": order}},
-                "query": {"bool": {"must": [{"term": {"task": task_id}}]}},
+    def get_task_log_tail(
+        self,
+        company_id,
+        task_id,
+        cursor: str = None,
+        batch_size: int = 500,
+        timeout_sec: float = 0,
+    ) -> Tuple[Sequence[dict], Optional[str]]:
+        """
+        Return the task log events following the cursor, sorted by timestamp, along with the cursor
+        to follow them with. If there are none, wait up to timeout_sec for new log events of the task
+        to be written. Waiting followers are woken by the ingestion of this server process, and are
+        not searched for again until then (see LogTailNotifier).
+        Without a cursor, the last batch_size log events are returned.
+        """
+        if not cursor:
+            return self._get_task_log_last_events(company_id, task_id, batch_size)
+        if not is_cursor(cursor):
+            raise errors.bad_request.FieldsValueError("invalid cursor", cursor=cursor)
+
+        deadline = time.time() + timeout_sec
+        while True:
+            version = log_tail_notifier.version(task_id)
+            if not log_tail_notifier.is_end(task_id, version, cursor):
+                events, next_cursor, _ = self.scroll_task_events(
+                    company_id,
+                    task_id,
+                    order="asc",
+                    event_type="log",
+                    batch_size=batch_size,
+                    scroll_id=cursor,
+                )
+                if events:
+                    return events, next_cursor
+                log_tail_notifier.mark_end(task_id, version, cursor)
+
+            remaining = deadline - time.time()
+            if remaining <= 0 or not log_tail_notifier.wait(
+                task_id, version, remaining
+            ):
+                return [], cursor
+
+    def _get_task_log_last_events(
+        self, company_id, task_id, batch_size: int
+    ) -> Tuple[Sequence[dict], Optional[str]]:
+        """
+        Return the last log events of the task sorted by timestamp, along with the cursor following them.
+        Log chunk documents are never appended to, so the cursor follows the last document as a whole
+        """
+        # a cursor to the start of the log, with no search_after values and no lines offset
+        start_cursor = encode_cursor([0])
+        es_index = EventBLL.get_index_name(company_id, "log")
+        if not self.index_catalog.exists(es_index):
+            return [], start_cursor
+
+        self.refresh_tracker.ensure_visible(es_index, [task_id])
+        lines_per_doc = self.log_chunk_max_lines if self.log_chunks else 1
+        es_req = {
+            "size": min(10000, math.ceil(batch_size / lines_per_doc)),
+            "sort": [{"timestamp": {"order": "desc"}}, {"_uid": {"order": "desc"}}],
+            "query": {"term": {"task": task_id}},
+        }
+        with translate_errors_context(), TimingContext("es", "task_log_tail"):
+            es_res = self.es.search(index=es_index, body=es_req, routing=task_id)
+
+        hits = es_res["hits"]["hits"]
+        if not hits:
+            return [], start_cursor
+
+        events = []
+        for hit in hits:
+            events.extend(unpack_log_events(hit["_source"], reverse=True))
+            if len(events) >= batch_size:
+                break
+        events = events[:batch_size]
+        events.reverse()
+        return events, encode_cursor(hits[0]["sort"])
+
+    def search_task_log(
+        self,
+        company_id,
+        task_id,
+        query: str,
+        match: str = "phrase",
+        levels: Sequence[str] = None,
+        from_timestamp: int = None,
+        to_timestamp: int = None,
+        context_lines: int = 0,
+        batch_size: int = 100,
+        cursor: str = None,
+    ) -> Tuple[Sequence[dict], Optional[str], int]:
+        """
+        Search the task log messages, in the indexed log storage mode.
+        Return the matching log events sorted by timestamp, each with the highlighted message and up to
+        context_lines log events before and after it, along with the cursor for the next page
+        and the total number of matches
+        :param match: 'term' matches messages containing all the query terms, 'phrase' matches the query
+            terms in order and 'regex' matches whole messages against the (Lucene syntax) regular expression
+        :param levels: if specified, only log events of these levels are matched
+        :param from_timestamp: if specified, only log events at this time (epoch milliseconds) and later are matched
+        :param to_timestamp: if specified, only log events at this time (epoch milliseconds) and earlier are matched
+        """
+        if match not in self.log_search_matches:
+            raise errors.bad_request.FieldsValueError("invalid match", match=match)
+        if cursor and not is_cursor(cursor):
+            raise errors.bad_request.FieldsValueError("invalid cursor", cursor=cursor)
+
+        es_index = EventBLL.get_index_name(company_id, "log")
+        if not self.index_catalog.exists(es_index):
+            return [], cursor, 0
+
+        self.refresh_tracker.ensure_visible(es_index, [task_id])
+
+        if match == "regex":
+            msg_query = {"regexp": {"msg.raw": query}}
+        elif match == "term":
+            msg_query = {"match": {"msg": {"query": query, "operator": "and"}}}
+        else:
+            msg_query = {"match_phrase": {"msg": query}}
+
+        filters = [{"term": {"task": task_id}}]
+        if levels:
+            filters.append({"terms": {"level": levels}})
+        if from_timestamp is not None or to_timestamp is not None:
+            time_range = {
+                bound: value
+                for bound, value in (("gte", from_timestamp), ("lte", to_timestamp))
+                if value is not None
             }
+            filters.append({"range": {"timestamp": time_range}})
 
-            with translate_errors_context(), TimingContext("es", "scroll_task_events"):
-                es_res = self.es.search(index=es_index, body=es_req, scroll="1h")
+        es_req = {
+            "size": min(batch_size, 10000),
+            "sort": self._get_cursor_sort([{"timestamp": {"order": "asc"}}]),
+            "query": {"bool": {"must": [msg_query], "filter": filters}},
+            "highlight": {
+                "fields": {
+                    "msg": {"number_of_fragments": 0},
+                    "msg.raw": {"number_of_fragments": 0},
+                }
+            },
+        }
+        if cursor:
+            es_req["search_after"] = decode_cursor(cursor)
+
+        try:
+            with translate_errors_context(), TimingContext("es", "search_task_log"):
+                es_res = self.es.search(index=es_index, body=es_req, routing=task_id)
+        except errors.server_error.DataError as ex:
+            if match == "regex":
+                raise errors.bad_request.InvalidRegexError(
+                    "invalid log search regex", query=query
+                ) from ex
+            raise
+
+        hits = es_res["hits"]["hits"]
+        contexts = self._get_log_search_contexts(
+            es_index, task_id, hits, context_lines
+        )
+        results = []
+        for hit, (before, after) in zip(hits, contexts):
+            highlight = hit.get("highlight", {})
+            highlighted = highlight.get("msg") or highlight.get("msg.raw")
+            results.append(
+                dict(
+                    event=hit["_source"],
+                    highlight=highlighted[0] if highlighted else None,
+                    context_before=before,
+                    context_after=after,
+                )
+            )
 
-        events = [hit["_source"] for hit in es_res["hits"]["hits"]]
-        next_scroll_id = es_res.get("_scroll_id")
-        total_events = es_res["hits"]["total"]
+        next_cursor = self._get_next_cursor(es_res, cursor)
+        return results, next_cursor, es_res["hits"]["total"]
+
+    def _get_log_search_contexts(
+        self, es_index, task_id, hits: Sequence[dict], context_lines: int
+    ) -> Sequence[Tuple[Sequence[dict], Sequence[dict]]]:
+        """
+        Return the log events before and after each of the hits, fetched in a single round trip
+        """
+        if not context_lines:
+            return [([], []) for _ in hits]
+
+        searches = [
+            SearchRequest(
+                index=es_index,
+                body={
+                    "size": context_lines,
+                    "sort": [{"timestamp": {"order": order}}, {"_uid": {"order": order}}],
+                    "query": {"term": {"task": task_id}},
+                    "search_after": hit["sort"],
+                },
+                routing=task_id,
+            )
+            for hit in hits
+            for order in ("desc", "asc")
+        ]
+        results = [
+            [doc["_source"] for doc in res.get("hits", {}).get("hits", [])]
+            for res in self.multi_search(searches, timing_key="log_search_context")
+        ]
+        return [
+            (before[::-1], after) for before, after in zip(results[::2], results[1::2])
+        ]
+
+    def get_task_log_line_count(self, company_id, task_id) -> int:
+        """ Return the number of the task log lines """
+        es_index = EventBLL.get_index_name(company_id, "log")
+        if not self.index_catalog.exists(es_index):
+            return 0
+
+        self.refresh_tracker.ensure_visible(es_index, [task_id])
+        es_req = {
+            "size": 0,
+            "query": {"term": {"task": task_id}},
+            "aggs": {"lines": {"sum": {"field": "line_count", "missing": 1}}},
+        }
+        with translate_errors_context(), TimingContext("es", "task_log_line_count"):
+            es_res = self.es.search(index=es_index, body=es_req, routing=task_id)
+        return int(es_res["aggregations"]["lines"]["value"])
+
+    def iter_task_log_events(
+        self, company_id, task_id, offset: int = 0
+    ) -> Iterator[dict]:
+        """
+        Return all the task log events sorted by timestamp, for exporting the task log.
+        The events are read using a sliced scroll, with the slices fetched in parallel and merged
+        by timestamp. Log chunk documents before the offset are skipped without being unpacked
+        :param offset: the number of log lines to skip
+        """
+        es_index = EventBLL.get_index_name(company_id, "log")
+        if not self.index_catalog.exists(es_index):
+            return
 
-        return events, next_scroll_id, total_events
+        self.refresh_tracker.ensure_visible(es_index, [task_id])
+        conf = config.get("services.events.log_export", {})
+        es_req = {
+            "size": conf.get("page_size", 5000),
+            "sort": [{"timestamp": {"order": "asc"}}, {"_uid": {"order": "asc"}}],
+            "query": {"term": {"task": task_id}},
+        }
+        hits = iter_sliced_scroll(
+            self.es,
+            index=es_index,
+            body=es_req,
+            routing=task_id,
+            sort_key=lambda hit: hit["sort"],
+            slices=max(1, conf.get("slices", 4)),
+            prefetch_pages=conf.get("prefetch_pages", 2),
+        )
+        with closing(hits):
+            for hit in hits:
+                doc = hit["_source"]
+                if offset:
+                    line_count = doc.get("line_count", 1)
+                    if offset >= line_count:
+                        offset -= line_count
+                        continue
+                    yield from unpack_log_events(doc)[offset:]
+                    offset = 0
+                    continue
+                yield from unpack_log_events(doc)
 
     def get_task_events(
         self,
@@ -301,20 +982,32 @@ class EventBLL(object):
         sort=None,
         size=500,
         scroll_id=None,
+        since_iter=None,
+        since_timestamp=None,
+        only_fields: Sequence[str] = None,
     ):
-
-        if scroll_id:
-            with translate_errors_context(), TimingContext("es", "get_task_events"):
-                es_res = self.es.scroll(scroll_id=scroll_id, scroll="1h")
+        """
+        Return the events of the task(s).
+        :param since_iter: if specified, only events of this iteration and later are returned
+        :param since_timestamp: if specified, only events written at this time (epoch milliseconds)
+            and later are returned
+        Both filters apply to the first page, the scroll continues the same query.
+        :param only_fields: event fields projection, see _get_source_filter
+        """
+        if scroll_id and not is_cursor(scroll_id):
+            es_res = self._continue_legacy_scroll(scroll_id)
         else:
             task_ids = [task_id] if isinstance(task_id, six.string_types) else task_id
             if event_type is None:
                 event_type = "*"
 
             es_index = EventBLL.get_index_name(company_id, event_type)
-            if not self.es.indices.exists(es_index):
+            if not self.index_catalog.exists(es_index):
                 return TaskEventsResult()
 
+            self.refresh_tracker.ensure_visible(es_index, task_ids)
+            search_index = EventBLL.get_search_index_name(company_id, event_type)
+
             query = {"bool": defaultdict(list)}
 
             if metric or variant:
@@ -329,12 +1022,10 @@ class EventBLL(object):
                 must.append({"terms": {"task": task_ids}})
             else:
                 should = query["bool"]["should"]
-                for i, task_id in enumerate(task_ids):
-                    last_iters = self.get_last_iters(
-                        es_index, task_id, event_type, last_iter_count
-                    )
-                    if not last_iters:
-                        continue
+                task_last_iters = self._get_last_iters_per_task(
+                    search_index, task_ids, event_type, last_iter_count
+                )
+                for task_id, last_iters in task_last_iters.items():
                     should.append(
                         {
                             "bool": {
@@ -348,23 +1039,41 @@ class EventBLL(object):
                 if not should:
                     return TaskEventsResult()
 
+            since_filters = self._get_since_filters(since_iter, since_timestamp)
+            if since_filters:
+                query["bool"]["filter"] = since_filters
+                if "should" in query["bool"]:
+                    query["bool"]["minimum_should_match"] = 1
+
             if sort is None:
                 sort = [{"timestamp": {"order": "asc"}}]
 
-            es_req = {"sort": sort, "size": min(size, 10000), "query": query}
+            es_req = {
+                "sort": self._get_cursor_sort(sort),
+                "size": min(size, 10000),
+                "query": query,
+            }
+            source = self._get_source_filter(only_fields)
+            if source:
+                es_req["_source"] = source
+            if scroll_id:
+                es_req["search_after"] = decode_cursor(scroll_id)
 
             routing = ",".join(task_ids)
 
             with translate_errors_context(), TimingContext("es", "get_task_events"):
                 es_res = self.es.search(
-                    index=es_index,
-                    body=es_req,
-                    ignore=404,
-                    routing=routing,
-                    scroll="1h",
+                    index=search_index, body=es_req, ignore=404, routing=routing
                 )
-
-        events = [doc["_source"] for doc in es_res.get("hits", {}).get("hits", [])]
+            if "hits" in es_res:
+                es_res["_scroll_id"] = self._get_next_cursor(es_res, scroll_id)
+
+        events = [
+            event
+            for doc in es_res.get("hits", {}).get("hits", [])
+            for event in unpack_log_events(doc["_source"])
+        ]
+        self.plot_store.rehydrate(events)
         next_scroll_id = es_res.get("_scroll_id")
         total_events = es_res["hits"]["total"]
 
@@ -372,11 +1081,280 @@ class EventBLL(object):
             events=events, next_scroll_id=next_scroll_id, total_events=total_events
         )
 
+    def get_debug_images_for_iteration(
+        self, company_id, task_id, iteration=None, navigate=None
+    ) -> dict:
+        """
+        Return the debug image grid of the task at the given iteration: the latest image of every
+        metric/variant reported at this iteration or before it. The images are looked up in the sorted
+        and de-duplicated per metric/variant image arrays maintained by events ingestion, so ES is not
+        searched. The arrays are filtered by the iterations range on the server, and only a single
+        iteration (or image) is returned per metric/variant.
+        :param iteration: the grid iteration. If not specified, the task's last image iteration is used
+        :param navigate: "next" or "previous" to return the grid of the first image iteration after
+            or before the given one (any metric/variant) instead
+        :return: the resolved iteration, the iteration range of all the task images and the images
+        """
+        ranges = self._aggregate_task_images(
+            company_id,
+            task_id,
+            first={"$arrayElemAt": ["$images.iter", 0]},
+            last={"$arrayElemAt": ["$images.iter", -1]},
+        )
+        ranges = [r for r in ranges if r.get("last") is not None]
+        if not ranges:
+            return dict(iteration=None, min_iteration=None, max_iteration=None, images=[])
+
+        min_iteration = min(r["first"] for r in ranges)
+        max_iteration = max(r["last"] for r in ranges)
+
+        if iteration is None:
+            iteration = max_iteration
+        if navigate in ("next", "previous"):
+            following = navigate == "next"
+            neighbours = [
+                r["iter"]
+                for r in self._aggregate_task_images(
+                    company_id,
+                    task_id,
+                    iter={
+                        "$arrayElemAt": [
+                            self._filter_images_expr(
+                                "$images.iter",
+                                "$gt" if following else "$lt",
+                                iteration,
+                                field=None,
+                            ),
+                            0 if following else -1,
+                        ]
+                    },
+                )
+                if r.get("iter") is not None
+            ]
+            iteration = (
+                (min(neighbours) if following else max(neighbours))
+                if neighbours
+                else None
+            )
+
+        images = []
+        if iteration is not None:
+            results = self._aggregate_task_images(
+                company_id,
+                task_id,
+                image={
+                    "$arrayElemAt": [
+                        self._filter_images_expr("$images", "$lte", iteration), -1
+                    ]
+                },
+            )
+            images = [
+                dict(metric=r["metric"], variant=r["variant"], **r["image"])
+                for r in sorted(results, key=itemgetter("metric", "variant"))
+                if r.get("image")
+            ]
+
+        return dict(
+            iteration=iteration,
+            min_iteration=min_iteration,
+            max_iteration=max_iteration,
+            images=images,
+        )
+
+    @staticmethod
+    def _filter_images_expr(images: str, op: str, iteration: int, field="iter") -> dict:
+        """ Return the expression filtering the images array (or its iterations) by iteration """
+        value = f"$$image.{field}" if field else "$$image"
+        return {
+            "$filter": {
+                "input": images,
+                "as": "image",
+                "cond": {op: [value, iteration]},
+            }
+        }
+
+    @staticmethod
+    def _aggregate_task_images(company_id, task_id, **projection) -> Sequence[dict]:
+        """
+        Return the metric, variant and the given projected expressions of the task debug images
+        catalog entries
+        """
+        with translate_errors_context(), TimingContext("mongo", "task_debug_images"):
+            return list(
+                TaskMetric.objects(
+                    company=company_id,
+                    task=task_id,
+                    type=EventType.metrics_image.value,
+                ).aggregate(
+                    {
+                        "$project": {
+                            "_id": 0,
+                            "metric": 1,
+                            "variant": 1,
+                            **projection,
+                        }
+                    }
+                )
+            )
+
+    def get_last_iters_events(
+        self,
+        company_id,
+        task_ids: Sequence[str],
+        event_type,
+        iters,
+        only_fields: Sequence[str] = None,
+    ) -> TaskEventsResult:
+        """
+        Return the events of the last iters iterations of every task metric/variant, sorted by
+        iteration in descending order. The events are de-duplicated in ES by collapsing them on the
+        metric/variant key, so only the returned events are fetched. A collapsed search is sent per task,
+        all in a single msearch request.
+        The latest 10K events are returned instead for tasks with events that have no metric_variant
+        (written before it was indexed or lacking a variant), to be de-duplicated by the caller
+        :param only_fields: event fields projection, see _get_source_filter. Should include the iteration
+        """
+        es_index = EventBLL.get_index_name(company_id, event_type)
+        if not self.index_catalog.exists(es_index):
+            return TaskEventsResult()
+
+        self.refresh_tracker.ensure_visible(es_index, task_ids)
+
+        source = self._get_source_filter(only_fields)
+
+        def get_request(task_id: str) -> dict:
+            return {
+                # number of metric/variant groups
+                "size": 10000,
+                "_source": False,
+                "query": {"term": {"task": task_id}},
+                "sort": [{"iter": {"order": "desc"}}],
+                "collapse": {
+                    "field": "metric_variant",
+                    "inner_hits": {
+                        "name": "last_iters",
+                        "size": iters,
+                        "sort": [{"iter": {"order": "desc"}}],
+                        "_source": source if source else True,
+                    },
+                },
+                "aggs": {"not_indexed": {"missing": {"field": "metric_variant"}}},
+            }
+
+        results = self.multi_search(
+            [
+                SearchRequest(index=es_index, body=get_request(task_id), routing=task_id)
+                for task_id in task_ids
+            ],
+            timing_key="task_last_iters_events",
+        )
+
+        events = []
+        total_events = 0
+        legacy_task_ids = []
+        for task_id, es_res in zip(task_ids, results):
+            if not es_res:
+                continue
+            if es_res["aggregations"]["not_indexed"]["doc_count"]:
+                legacy_task_ids.append(task_id)
+                continue
+            total_events += es_res["hits"]["total"]
+            for hit in es_res["hits"]["hits"]:
+                events.extend(
+                    inner_hit["_source"]
+                    for inner_hit in hit["inner_hits"]["last_iters"]["hits"]["hits"]
+                )
+        self.plot_store.rehydrate(events)
+
+        if legacy_task_ids:
+            result = self.get_task_events(
+                company_id,
+                legacy_task_ids,
+                event_type=event_type,
+                sort=[{"iter": {"order": "desc"}}],
+                size=10000,
+                only_fields=only_fields,
+            )
+            events.extend(result.events)
+            total_events += result.total_events
+
+        events.sort(key=itemgetter("iter"), reverse=True)
+        return TaskEventsResult(events=events, total_events=total_events)
+
+    @staticmethod
+    def _get_source_filter(only_fields: Sequence[str]) -> Optional[dict]:
+        """
+        Translate an event fields projection into an ES _source filter. Field names can be nested
+        using '.', fields prefixed with '-' are excluded
+        Log line fields are also applied to the lines of log chunk documents
+        """
+        if not only_fields:
+            return None
+        includes = [f for f in only_fields if not f.startswith("-")]
+        excludes = [f[1:] for f in only_fields if f.startswith("-")]
+        for fields in (includes, excludes):
+            # offloaded plot bodies are loaded using their reference
+            if "plot_str" in fields:
+                fields.append("plot_ref")
+            fields.extend(f"lines.{f}" for f in LINE_FIELDS if f in fields)
+        source = {}
+        if includes:
+            source["includes"] = includes
+        if excludes:
+            source["excludes"] = excludes
+        return source
+
+    @staticmethod
+    def _get_cursor_sort(sort: Sequence[dict]) -> list:
+        """ Add a unique tiebreaker to the sort, so that search_after never skips or repeats events """
+        sort = list(sort)
+        if not any("_uid" in s for s in sort):
+            sort.append({"_uid": {"order": "asc"}})
+        return sort
+
+    @staticmethod
+    def _get_next_cursor(es_res: dict, cursor: Optional[str]) -> Optional[str]:
+        """
+        Return the cursor of the page following the returned one. Once no more events are returned the
+        current cursor is returned again, so that callers that keep paging get empty pages.
+        """
+        hits = es_res["hits"]["hits"]
+        if not hits:
+            return cursor
+        return encode_cursor(hits[-1]["sort"])
+
+    def _continue_legacy_scroll(self, scroll_id: str) -> dict:
+        """ Continue a scroll opened by a previous server version, clearing it once exhausted """
+        with translate_errors_context(), TimingContext("es", "task_events_scroll"):
+            es_res = self.es.scroll(scroll_id=scroll_id, scroll="5m")
+            if not es_res["hits"]["hits"]:
+                self.es.clear_scroll(scroll_id=es_res.get("_scroll_id", scroll_id), ignore=404)
+                es_res["_scroll_id"] = None
+        return es_res
+
     def get_metrics_and_variants(self, company_id, task_id, event_type):
+        """
+        Return the task metrics and their variants reported with the given event type, as maintained
+        in the task metrics catalog by events ingestion. Tasks with no catalog entries (reported by
+        previous server versions) are aggregated from the events
+        """
+        with translate_errors_context(), TimingContext("mongo", "task_metrics_catalog"):
+            entries = TaskMetric.objects(
+                company=company_id, task=task_id, type=event_type
+            ).only("metric", "variant")
+            metrics = defaultdict(list)
+            for entry in entries:
+                metrics[entry.metric].append(entry.variant)
+
+        if metrics:
+            return {metric: sorted(variants) for metric, variants in metrics.items()}
+
+        return self._aggregate_metrics_and_variants(company_id, task_id, event_type)
 
+    def _aggregate_metrics_and_variants(self, company_id, task_id, event_type):
         es_index = EventBLL.get_index_name(company_id, event_type)
 
-        if not self.es.indices.exists(es_index):
+        if not self.index_catalog.exists(es_index):
             return {}
 
         es_req = {
@@ -404,11 +1382,131 @@ class EventBLL(object):
 
         return metrics
 
+    def multi_search(self, searches: Sequence[SearchRequest], timing_key="multi_search") -> list:
+        """
+        Send the searches in a single _msearch request and return their results in the same order.
+        A search of a missing index returns an empty dict
+        """
+        results = [{} for _ in searches]
+        body = []
+        sent = []
+        for i, search in enumerate(searches):
+            if not self.index_catalog.exists(search.index):
+                continue
+            header = {"index": search.index}
+            if search.routing:
+                header["routing"] = search.routing
+            body.extend((header, search.body))
+            sent.append(i)
+
+        if not sent:
+            return results
+
+        with translate_errors_context(), TimingContext("es", timing_key):
+            es_res = self.es.msearch(body=body)
+
+        for i, res in zip(sent, es_res["responses"]):
+            error = res.get("error")
+            if error:
+                if res.get("status") == 404:
+                    # the index was deleted after it was cached
+                    self.index_catalog.invalidate()
+                    continue
+                raise errors.server_error.DataError(
+                    "events search failed", index=searches[i].index, error=error
+                )
+            results[i] = res
+        return results
+
+    def get_task_summary(self, company_id, task_id) -> dict:
+        """
+        Return the metrics/variants of the task scalars, plots and debug images with the number of events
+        and last iteration of each. The latest value is returned for scalars and the latest url for images.
+        All the event types are searched in a single round trip
+        """
+        sections = (
+            ("scalars", EventType.metrics_scalar.value, {"last_value": "value"}),
+            ("plots", EventType.metrics_plot.value, {}),
+            ("images", EventType.metrics_image.value, {"url": "url"}),
+        )
+
+        def get_request(latest_fields: dict) -> dict:
+            variant_aggs = {"last_iter": {"max": {"field": "iter"}}}
+            if latest_fields:
+                variant_aggs["latest"] = {
+                    "top_hits": {
+                        "size": 1,
+                        "sort": [
+                            {"iter": {"order": "desc"}},
+                            {"timestamp": {"order": "desc"}},
+                        ],
+                        "_source": {"includes": list(latest_fields.values())},
+                    }
+                }
+            return {
+                "size": 0,
+                "query": {"term": {"task": task_id}},
+                "aggs": {
+                    "metrics": {
+                        "terms": {"field": "metric", "size": 200},
+                        "aggs": {
+                            "variants": {
+                                "terms": {"field": "variant", "size": 500},
+                                "aggs": variant_aggs,
+                            }
+                        },
+                    }
+                },
+            }
+
+        searches = []
+        for _, event_type, latest_fields in sections:
+            es_index = EventBLL.get_index_name(company_id, event_type)
+            self.refresh_tracker.ensure_visible(es_index, [task_id])
+            searches.append(
+                SearchRequest(
+                    index=es_index, body=get_request(latest_fields), routing=task_id
+                )
+            )
+
+        results = self.multi_search(searches, timing_key="task_summary")
+
+        summary = {}
+        for (section, _, latest_fields), es_res in zip(sections, results):
+            metrics = []
+            metric_buckets = (
+                es_res.get("aggregations", {}).get("metrics", {}).get("buckets", [])
+            )
+            for metric_bucket in sorted(metric_buckets, key=itemgetter("key")):
+                variants = []
+                for variant_bucket in sorted(
+                    metric_bucket["variants"]["buckets"], key=itemgetter("key")
+                ):
+                    variant = dict(
+                        name=variant_bucket["key"],
+                        count=variant_bucket["doc_count"],
+                        last_iter=variant_bucket["last_iter"]["value"],
+                    )
+                    if variant["last_iter"] is not None:
+                        variant["last_iter"] = int(variant["last_iter"])
+                    if latest_fields:
+                        hits = variant_bucket["latest"]["hits"]["hits"]
+                        latest = hits[0]["_source"] if hits else {}
+                        variant.update(
+                            (name, latest.get(field))
+                            for name, field in latest_fields.items()
+                        )
+                    variants.append(variant)
+                metrics.append(dict(name=metric_bucket["key"], variants=variants))
+            summary[section] = metrics
+
+        return summary
+
     def get_task_latest_scalar_values(self, company_id, task_id):
         es_index = EventBLL.get_index_name(company_id, "training_stats_scalar")
 
-        if not self.es.indices.exists(es_index):
-            return {}
+        if not self.index_catalog.exists(es_index):
+            return [], 0
 
         es_req = {
             "size": 0,
@@ -488,9 +1586,62 @@ class EventBLL(object):
             metrics.append(metric_summary)
         return metrics, max_timestamp
 
+    @staticmethod
+    def get_task_scalar_values_summary(task: Task):
+        """
+        Return the latest value, average of the last 10 values and min/max values of each task
+        scalar metric/variant, as maintained in the task's last metrics summary by events ingestion.
+        The fields of the previous (ES based) version are also returned, so that its clients keep working.
+        Also return the last time (epoch milliseconds) a scalar was reported
+        """
+        epoch = datetime.utcfromtimestamp(0)
+        metrics = defaultdict(list)
+        max_timestamp = 0
+        for variants in (task.last_metrics or {}).values():
+            for event in variants.values():
+                if not event.metric or not event.variant:
+                    continue
+                last_values = [v.value for v in event.last_values or []] or [event.value]
+                if event.timestamp:
+                    max_timestamp = max(
+                        max_timestamp,
+                        int((event.timestamp - epoch).total_seconds() * 1000),
+                    )
+                metrics[event.metric].append(
+                    dict(
+                        name=event.variant,
+                        last_value=event.value,
+                        # as returned by version 2.1, which unversioned calls used to get
+                        last_10_value=event.value,
+                        last_10_average=sum(last_values) / len(last_values),
+                        min_value=event.min_value,
+                        max_value=event.max_value,
+                        last_iter=event.iter,
+                    )
+                )
+
+        return (
+            [
+                dict(name=metric, variants=sorted(variants, key=itemgetter("name")))
+                for metric, variants in sorted(metrics.items())
+            ],
+            max_timestamp,
+        )
+
     def compare_scalar_metrics_average_per_iter(
-        self, company_id, task_ids, allow_public=True
+        self,
+        company_id,
+        task_ids,
+        allow_public=True,
+        max_points=None,
+        min_iter=None,
+        max_iter=None,
+        since_timestamp=None,
     ):
+        """
+        Return the average value per iteration of every metric/variant of the tasks.
+        See get_scalar_metrics_average_per_iter for the max_points and iterations range semantics.
+        """
         assert isinstance(task_ids, list)
 
         task_name_by_id = {}
@@ -509,35 +1660,77 @@ class EventBLL(object):
             task_name_by_id = {t.id: t.name for t in task_objs}
 
         es_index = EventBLL.get_index_name(company_id, "training_stats_scalar")
-        if not self.es.indices.exists(es_index):
+        if not self.index_catalog.exists(es_index):
             return {}
 
-        es_req = {
-            "size": 0,
-            "_source": {"excludes": []},
-            "query": {"terms": {"task": task_ids}},
-            "aggs": {
-                "iters": {
-                    "histogram": {"field": "iter", "interval": 1, "min_doc_count": 1},
-                    "aggs": {
-                        "metric_and_variant": {
-                            "terms": {
-                                "script": "doc['metric'].value +'/'+ doc['variant'].value",
-                                "size": 10000,
-                            },
-                            "aggs": {
-                                "tasks": {
-                                    "terms": {"field": "task"},
-                                    "aggs": {"avg_val": {"avg": {"field": "value"}}},
-                                }
-                            },
+        self.refresh_tracker.ensure_visible(es_index, task_ids)
+
+        series = self._get_scalar_rollup_series(
+            company_id, task_ids, max_points, min_iter, max_iter, since_timestamp
+        )
+        if series is not None:
+            metrics = defaultdict(dict)
+            for task_id, task_metrics in series.items():
+                for metric, variants in task_metrics.items():
+                    for variant, (iterations, values) in variants.items():
+                        metrics[f"{metric}/{variant}"][task_id] = {
+                            "x": iterations,
+                            "y": values,
+                            "name": task_name_by_id[task_id],
                         }
+            return downsample_metrics(dict(metrics), max_points)
+
+        def get_request(metric_variant_terms: dict) -> dict:
+            return {
+                "size": 0,
+                "_source": {"excludes": []},
+                "query": self._get_scalar_query(
+                    task_ids, min_iter, max_iter, since_timestamp
+                ),
+                "aggs": {
+                    "iters": {
+                        "histogram": {
+                            "field": "iter",
+                            "interval": 1,
+                            "min_doc_count": 1,
+                        },
+                        "aggs": {
+                            "metric_and_variant": {
+                                "terms": {**metric_variant_terms, "size": 10000},
+                                "aggs": {
+                                    "tasks": {
+                                        "terms": {
+                                            "field": "task",
+                                            "size": len(task_ids),
+                                        },
+                                        "aggs": {
+                                            "avg_val": {"avg": {"field": "value"}}
+                                        },
+                                    }
+                                },
+                            }
+                        },
                     },
-                }
-            },
-        }
+                    "not_indexed": {"missing": {"field": "metric_variant"}},
+                },
+            }
+
+        routing = ",".join(task_ids)
         with translate_errors_context(), TimingContext("es", "task_stats_comparison"):
-            es_res = self.es.search(index=es_index, body=es_req)
+            es_res = self.es.search(
+                index=es_index,
+                body=get_request({"field": "metric_variant"}),
+                routing=routing,
+            )
+            if es_res.get("aggregations", {}).get("not_indexed", {}).get("doc_count"):
+                # events written before metric_variant was indexed (and not backfilled yet)
+                es_res = self.es.search(
+                    index=es_index,
+                    body=get_request(
+                        {"script": "doc['metric'].value +'/'+ doc['variant'].value"}
+                    ),
+                    routing=routing,
+                )
 
         if "aggregations" not in es_res:
             return
@@ -565,18 +1758,52 @@ class EventBLL(object):
                     metric_data[task_id]["x"].append(iteration)
                     metric_data[task_id]["y"].append(value)
 
-        return metrics
-
-    def get_scalar_metrics_average_per_iter(self, company_id, task_id):
+        return downsample_metrics(metrics, max_points)
 
+    def get_scalar_metrics_average_per_iter(
+        self,
+        company_id,
+        task_id,
+        max_points=None,
+        min_iter=None,
+        max_iter=None,
+        since_timestamp=None,
+    ):
+        """
+        Return the average value per iteration of every task metric/variant.
+        If max_points is specified, the values are averaged per rollup bucket using the coarsest
+        rollup stride that still provides max_points points per series (if available for the task),
+        and every series is then downsampled to at most max_points points.
+        :param min_iter: if specified, only iterations starting from this one are returned
+        :param max_iter: if specified, only iterations up to this one (inclusive) are returned
+        :param since_timestamp: if specified, only events written at this time (epoch milliseconds)
+            and later are aggregated. Rollups are not used in this case.
+        """
         es_index = EventBLL.get_index_name(company_id, "training_stats_scalar")
-        if not self.es.indices.exists(es_index):
+        if not self.index_catalog.exists(es_index):
             return {}
 
+        self.refresh_tracker.ensure_visible(es_index, [task_id])
+
+        series = self._get_scalar_rollup_series(
+            company_id, [task_id], max_points, min_iter, max_iter, since_timestamp
+        )
+        if series is not None:
+            metrics = {
+                metric: {
+                    variant: {"x": iterations, "y": values, "name": variant}
+                    for variant, (iterations, values) in variants.items()
+                }
+                for metric, variants in series.get(task_id, {}).items()
+            }
+            return downsample_metrics(metrics, max_points)
+
         es_req = {
             "size": 0,
             "_source": {"excludes": []},
-            "query": {"term": {"task": task_id}},
+            "query": self._get_scalar_query(
+                [task_id], min_iter, max_iter, since_timestamp
+            ),
             "aggs": {
                 "iters": {
                     "histogram": {"field": "iter", "interval": 1, "min_doc_count": 1},
@@ -624,12 +1851,252 @@ class EventBLL(object):
                             metric_data[variant] = {"x": [], "y": [], "name": variant}
                         metric_data[variant]["x"].append(iteration)
                         metric_data[variant]["y"].append(value)
-        return metrics
+        return downsample_metrics(metrics, max_points)
+
+    @staticmethod
+    def _get_iter_range(min_iter=None, max_iter=None) -> Optional[dict]:
+        iter_range = {
+            op: value
+            for op, value in (("gte", min_iter), ("lte", max_iter))
+            if value is not None
+        }
+        return iter_range or None
+
+    @classmethod
+    def _get_scalar_query(
+        cls, task_ids: Sequence[str], min_iter=None, max_iter=None, since_timestamp=None
+    ):
+        must = [{"terms": {"task": task_ids}}]
+        iter_range = cls._get_iter_range(min_iter, max_iter)
+        if iter_range:
+            must.append({"range": {"iter": iter_range}})
+        must.extend(cls._get_since_filters(since_timestamp=since_timestamp))
+        return {"bool": {"must": must}}
+
+    @staticmethod
+    def _get_since_filters(since_iter=None, since_timestamp=None) -> Sequence[dict]:
+        """
+        Return the filters of an incremental fetch. Both bounds are inclusive, so that events of the
+        watermark iteration or time that became visible after the previous fetch are not missed
+        """
+        filters = []
+        if since_iter is not None:
+            filters.append({"range": {"iter": {"gte": since_iter}}})
+        if since_timestamp is not None:
+            filters.append(
+                {
+                    "range": {
+                        "@timestamp": {"gte": since_timestamp, "format": "epoch_millis"}
+                    }
+                }
+            )
+        return filters
+
+    def get_task_events_watermark(
+        self, company_id, task_ids: Sequence[str], event_type
+    ) -> Tuple[Optional[int], Optional[int]]:
+        """
+        Return the last iteration and the last write time (epoch milliseconds) of the tasks events,
+        to be passed as since_iter/since_timestamp in the next incremental fetch.
+        The write time is held back by a grace period since events written shortly before it may not
+        be searchable yet (e.g. if written through a different server process)
+        """
+        es_index = EventBLL.get_search_index_name(company_id, event_type)
+        if not self.index_catalog.exists(EventBLL.get_index_name(company_id, event_type)):
+            return None, None
+
+        self.refresh_tracker.ensure_visible(
+            EventBLL.get_index_name(company_id, event_type), task_ids
+        )
+        es_req = {
+            "size": 0,
+            "query": {"terms": {"task": task_ids}},
+            "aggs": {
+                "last_iter": {"max": {"field": "iter"}},
+                "last_timestamp": {"max": {"field": "@timestamp"}},
+            },
+        }
+        with translate_errors_context(), TimingContext("es", "task_events_watermark"):
+            es_res = self.es.search(
+                index=es_index, body=es_req, routing=",".join(task_ids)
+            )
+
+        aggs = es_res.get("aggregations", {})
+        last_iter = aggs.get("last_iter", {}).get("value")
+        last_timestamp = aggs.get("last_timestamp", {}).get("value")
+        if last_timestamp is not None:
+            last_timestamp = min(
+                int(last_timestamp),
+                es_factory.get_timestamp_millis() - self.watermark_grace_ms,
+            )
+        return (int(last_iter) if last_iter is not None else None), last_timestamp
+
+    def _get_scalar_rollup_series(
+        self,
+        company_id,
+        task_ids: Sequence[str],
+        max_points: Optional[int],
+        min_iter: Optional[int] = None,
+        max_iter: Optional[int] = None,
+        since_timestamp: Optional[int] = None,
+    ) -> Optional[dict]:
+        """
+        Return the average value per rollup bucket of every task metric/variant as
+        {task_id: {metric: {variant: (iterations, values)}}}, using the coarsest rollup stride that
+        still provides max_points points over the requested iterations range. The buckets overlapping
+        the range boundaries are returned in full.
+        Return None if no stride is coarse enough or the rollup does not cover all the task events.
+        The stride is selected using the tasks last iteration and the first iteration of their scalar
+        metrics catalog entries, so the raw events are not aggregated.
+        Rollup buckets do not keep the events write time, so they are not used for since_timestamp queries
+        """
+        if not (max_points and self.scalar_rollup.enabled) or since_timestamp is not None:
+            return None
+
+        rollup_index = EventBLL.get_index_name(company_id, ROLLUP_EVENT_TYPE)
+        if not self.index_catalog.exists(rollup_index):
+            return None
+
+        with translate_errors_context():
+            last_iters = dict(
+                Task.objects(company=company_id, id__in=list(task_ids)).scalar(
+                    "id", "last_iteration"
+                )
+            )
+            first_iters = {}
+            for task_id, first_iter in TaskMetric.objects(
+                company=company_id,
+                task__in=list(task_ids),
+                type="training_stats_scalar",
+            ).scalar("task", "first_iter"):
+                if first_iter is not None:
+                    first_iters[task_id] = min(
+                        first_iter, first_iters.get(task_id, first_iter)
+                    )
+        if set(first_iters) != set(task_ids) or None in (
+            last_iters.get(t) for t in task_ids
+        ):
+            # tasks without scalars catalog or iterations
+            return None
+
+        first_iter = min(first_iters.values())
+        last_iter = max(last_iters[t] for t in task_ids)
+        if min_iter is not None:
+            first_iter = max(first_iter, min_iter)
+        if max_iter is not None:
+            last_iter = min(last_iter, max_iter)
+        if last_iter < first_iter:
+            return None
+        stride = self.scalar_rollup.select_stride(first_iter, last_iter, max_points)
+        if not stride:
+            return None
+
+        self.refresh_tracker.ensure_visible(rollup_index, task_ids)
+
+        routing = ",".join(task_ids)
+        iter_range = self._get_iter_range(min_iter, max_iter)
+        range_filter = (
+            {"range": {"iter": iter_range}} if iter_range else {"match_all": {}}
+        )
+        if iter_range:
+            # include the buckets in which the range starts
+            iter_range = dict(iter_range)
+            if "gte" in iter_range:
+                iter_range["gte"] -= iter_range["gte"] % stride
+            range_filter = {"range": {"iter": iter_range}}
+
+        es_req = {
+            "size": 0,
+            "query": {
+                "bool": {
+                    "must": [
+                        {"terms": {"task": task_ids}},
+                        {"term": {"stride": stride}},
+                    ]
+                }
+            },
+            "aggs": {
+                "first": {
+                    "terms": {"field": "task", "size": len(task_ids)},
+                    "aggs": {"iter": {"min": {"field": "iter"}}},
+                },
+                "in_range": {
+                    "filter": range_filter,
+                    "aggs": {
+                        "tasks": {
+                            "terms": {"field": "task", "size": len(task_ids)},
+                            "aggs": {
+                                "metrics": {
+                                    "terms": {
+                                        "field": "metric",
+                                        "size": 200,
+                                        "order": {"_term": "desc"},
+                                    },
+                                    "aggs": {
+                                        "variants": {
+                                            "terms": {
+                                                "field": "variant",
+                                                "size": 500,
+                                                "order": {"_term": "desc"},
+                                            },
+                                            "aggs": {
+                                                "iters": {
+                                                    "histogram": {
+                                                        "field": "iter",
+                                                        "interval": stride,
+                                                        "min_doc_count": 1,
+                                                    },
+                                                    "aggs": {
+                                                        "sum_val": {"sum": {"field": "sum"}},
+                                                        "count_val": {
+                                                            "sum": {"field": "count"}
+                                                        },
+                                                    },
+                                                }
+                                            },
+                                        }
+                                    },
+                                }
+                            },
+                        }
+                    },
+                },
+            },
+        }
+        with translate_errors_context(), TimingContext("es", "task_stats_scalar_rollup"):
+            es_res = self.es.search(index=rollup_index, body=es_req, routing=routing)
+
+        aggs = es_res.get("aggregations")
+        if not aggs:
+            return None
+        rollup_first = {
+            b["key"]: b["iter"]["value"] for b in aggs["first"]["buckets"]
+        }
+        if any(
+            rollup_first.get(task_id) is None
+            or rollup_first[task_id] > task_first_iter - task_first_iter % stride
+            for task_id, task_first_iter in first_iters.items()
+        ):
+            # some of the events were reported before the rollup was enabled
+            return None
+
+        series = nested_dict(3, dict)
+        for task_bucket in aggs["in_range"]["tasks"]["buckets"]:
+            for metric_bucket in task_bucket["metrics"]["buckets"]:
+                for variant_bucket in metric_bucket["variants"]["buckets"]:
+                    buckets = variant_bucket["iters"]["buckets"]
+                    series[task_bucket["key"]][metric_bucket["key"]][
+                        variant_bucket["key"]
+                    ] = (
+                        [int(b["key"]) for b in buckets],
+                        [b["sum_val"]["value"] / b["count_val"]["value"] for b in buckets],
+                    )
+        return series.to_dict()
 
     def get_vector_metrics_per_iter(self, company_id, task_id, metric, variant):
 
         es_index = EventBLL.get_index_name(company_id, "training_stats_vector")
-        if not self.es.indices.exists(es_index):
+        if not self.index_catalog.exists(es_index):
             return [], []
 
         es_req = {
@@ -658,31 +2125,53 @@ class EventBLL(object):
         return iterations, vectors
 
     def get_last_iters(self, es_index, task_id, event_type, iters):
-        if not self.es.indices.exists(es_index):
+        if not self.index_catalog.exists(es_index):
             return []
 
+        return self._get_last_iters_per_task(es_index, [task_id], event_type, iters).get(
+            task_id, []
+        )
+
+    def _get_last_iters_per_task(
+        self, es_index, task_ids: Sequence[str], event_type, iters
+    ) -> dict:
+        """
+        Return the last iterations of each of the tasks (tasks with no events are omitted),
+        using a single aggregation for all the tasks
+        """
         es_req: dict = {
             "size": 0,
             "aggs": {
-                "iters": {
-                    "terms": {
-                        "field": "iter",
-                        "size": iters,
-                        "order": {"_term": "desc"},
-                    }
+                "tasks": {
+                    "terms": {"field": "task", "size": len(task_ids)},
+                    "aggs": {
+                        "iters": {
+                            "terms": {
+                                "field": "iter",
+                                "size": iters,
+                                "order": {"_term": "desc"},
+                            }
+                        }
+                    },
                 }
             },
-            "query": {"bool": {"must": [{"term": {"task": task_id}}]}},
+            "query": {"bool": {"must": [{"terms": {"task": task_ids}}]}},
         }
-        if event_type:
+        if event_type and event_type != "*":
             es_req["query"]["bool"]["must"].append({"term": {"type": event_type}})
 
         with translate_errors_context(), TimingContext("es", "task_last_iter"):
-            es_res = self.es.search(index=es_index, body=es_req, routing=task_id)
+            es_res = self.es.search(
+                index=es_index, body=es_req, routing=",".join(task_ids)
+            )
         if "aggregations" not in es_res:
-            return []
+            return {}
 
-        return [b["key"] for b in es_res["aggregations"]["iters"]["buckets"]]
+        return {
+            task_bucket["key"]: [b["key"] for b in task_bucket["iters"]["buckets"]]
+            for task_bucket in es_res["aggregations"]["tasks"]["buckets"]
+            if task_bucket["iters"]["buckets"]
+        }
 
     def delete_task_events(self, company_id, task_id):
         es_index = EventBLL.get_index_name(company_id, "*")
@@ -692,9 +2181,43 @@ class EventBLL(object):
                 index=es_index, body=es_req, routing=task_id, refresh=True
             )
 
+        with translate_errors_context(), TimingContext("mongo", "delete_task_metrics"):
+            TaskMetric.objects(company=company_id, task=task_id).delete()
+
+        self.plot_store.delete_task_blobs(task_id)
+
         return es_res.get("deleted", 0)
 
     @staticmethod
     def get_index_name(company_id, event_type):
+        """
+        Return the index expression for reading events of the given type.
+        With index rollover it covers the rollover indices (see WriteAliases)
+        """
         event_type = event_type.lower().replace(" ", "_")
-        return "events-%s-%s" % (event_type, company_id)
+        es_index = "events-%s-%s" % (event_type, company_id)
+        # scalar rollup buckets are updated in place so they are kept in a single index
+        if event_type == ROLLUP_EVENT_TYPE:
+            return es_index
+        return get_read_index(es_index)
+
+    @staticmethod
+    def get_write_index_name(company_id, event_type):
+        """ Return the index (or write alias with index rollover) that events of the given type are written to """
+        event_type = event_type.lower().replace(" ", "_")
+        es_index = "events-%s-%s" % (event_type, company_id)
+        if event_type == ROLLUP_EVENT_TYPE:
+            return es_index
+        return get_write_index(es_index)
+
+    @staticmethod
+    def get_search_index_name(company_id, event_type):
+        """
+        Return the index expression for searching events of the given type.
+        Searching all event types excludes the scalar rollup index.
+        """
+        es_index = EventBLL.get_index_name(company_id, event_type)
+        if event_type != "*":
+            return es_index
+        rollup_index = EventBLL.get_index_name(company_id, ROLLUP_EVENT_TYPE)
+        return f"{es_index},-{rollup_index}"
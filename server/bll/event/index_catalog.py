@@ -0,0 +1,59 @@
+import threading
+import time
+from fnmatch import fnmatch
+
+from config import config
+from database.errors import translate_errors_context
+from timing_context import TimingContext
+
+
+class IndexCatalog(object):
+    """
+    In-process cache of the events indices existence, saving an ES round trip before every search.
+    Existing indices are cached for ttl_sec. Missing indices (or patterns matching no index) are cached
+    for the shorter missing_ttl_sec, since they may be created by other server processes at any time.
+    Indices written by this process are marked as existing right away.
+    """
+
+    def __init__(self, es, ttl_sec: float = None, missing_ttl_sec: float = None):
+        self.es = es
+        conf = config.get("services.events.index_catalog", {})
+        self.ttl_sec = ttl_sec if ttl_sec is not None else conf.get("ttl_sec", 300)
+        self.missing_ttl_sec = (
+            missing_ttl_sec
+            if missing_ttl_sec is not None
+            else conf.get("missing_ttl_sec", 2)
+        )
+        self._entries = {}  # index or pattern -> (exists, expiration time)
+        self._lock = threading.Lock()
+
+    def exists(self, index: str) -> bool:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(index)
+        if entry and entry[1] > now:
+            return entry[0]
+
+        with translate_errors_context(), TimingContext("es", "events_index_exists"):
+            exists = bool(self.es.indices.exists(index))
+
+        ttl = self.ttl_sec if exists else self.missing_ttl_sec
+        with self._lock:
+            self._entries[index] = (exists, now + ttl)
+        return exists
+
+    def index_written(self, index: str):
+        """ Mark the index as existing, along with the cached missing patterns that match it """
+        now = time.time()
+        with self._lock:
+            self._entries[index] = (True, now + self.ttl_sec)
+            for key in [
+                key
+                for key, (exists, _) in self._entries.items()
+                if not exists and fnmatch(index, key)
+            ]:
+                del self._entries[key]
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,64 @@
+import threading
+
+from config import config
+from database.errors import translate_errors_context
+from timing_context import TimingContext
+
+log = config.logger(__file__)
+
+WRITE_ALIAS_SUFFIX = "-write"
+""" Suffix of the write alias name added to the events index base name """
+
+FIRST_INDEX_SUFFIX = "-000001"
+""" Suffix of the first rollover index, incremented by ES on every rollover """
+
+
+def rollover_enabled() -> bool:
+    return config.get("services.events.rollover.enabled", False)
+
+
+def get_read_index(base_name: str) -> str:
+    return f"{base_name}*" if rollover_enabled() else base_name
+
+
+def get_write_index(base_name: str) -> str:
+    return f"{base_name}{WRITE_ALIAS_SUFFIX}" if rollover_enabled() else base_name
+
+
+class WriteAliases(object):
+    """
+    Time/size based rollover of the events indices. When enabled, events of a type and company are written
+    through a write alias (events-<type>-<company>-write) to events-<type>-<company>-NNNNNN indices, and read
+    using the events-<type>-<company>* pattern, which also covers the index written before rollover was enabled.
+    The indices are rolled over, shrunk and force-merged by elastic/events_maintenance.py.
+    The write aliases are created along with their first index on the first write.
+    Events with the same ID overwrite each other only within the same index, so an event reported again
+    after a rollover is kept in both the old and the new index.
+    """
+
+    def __init__(self, es):
+        self.es = es
+        self._aliases = set()  # write aliases known to exist
+        self._lock = threading.Lock()
+
+    def ensure(self, index: str):
+        """ Create the write alias if it does not exist. Does nothing for indices that are not write aliases """
+        if not index.endswith(WRITE_ALIAS_SUFFIX):
+            return
+        with self._lock:
+            if index in self._aliases:
+                return
+
+        with translate_errors_context(), TimingContext("es", "events_write_alias"):
+            if not self.es.indices.exists_alias(name=index):
+                base_name = index[: -len(WRITE_ALIAS_SUFFIX)]
+                # fails if the index was already created by a concurrent write
+                self.es.indices.create(
+                    index=f"{base_name}{FIRST_INDEX_SUFFIX}",
+                    body={"aliases": {index: {}}},
+                    ignore=400,
+                )
+                log.info(f"Created events write alias {index}")
+
+        with self._lock:
+            self._aliases.add(index)
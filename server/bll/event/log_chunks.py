@@ -0,0 +1,92 @@
+import itertools
+import time
+from typing import Sequence
+from uuid import uuid4
+
+LINE_FIELDS = ("timestamp", "iter", "level", "msg")
+""" Fields kept per line in log chunks """
+
+CHUNK_FIELDS = ("lines", "last_timestamp", "line_count")
+""" Fields of log chunk documents that do not belong to the lines """
+
+_chunk_seq = itertools.count()
+
+
+def get_chunk_id() -> str:
+    """
+    Return an ID for a new log chunk document. IDs are ordered by their generation time and by their
+    generation order within this process, so that chunks are sorted in the order they were written
+    when tied on the first line timestamp (the _uid sort tiebreaker)
+    """
+    return "{:012x}{:06x}{}".format(
+        int(time.time() * 1000), next(_chunk_seq) & 0xFFFFFF, uuid4().hex[:14]
+    )
+
+
+class LogChunker(object):
+    """
+    Packs consecutive log lines of the same task and worker into chunk documents.
+    A chunk holds up to max_lines lines and approximately up to max_bytes of messages, along with the
+    timestamps of its first and last lines. The chunk of a task is completed when the task lines switch
+    to another worker, so that the lines of workers reporting interleaved lines of the same task are not
+    grouped into overlapping chunks that would be read out of timestamp order.
+    """
+
+    def __init__(self, max_lines: int = 500, max_bytes: int = 65536):
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self._chunks = {}  # task -> (chunk document, message bytes)
+
+    def add(self, event: dict) -> Sequence[dict]:
+        """ Add the log event and return the chunks that were completed (if any) """
+        key = event["task"]
+        line = {field: event[field] for field in LINE_FIELDS if field in event}
+        line_bytes = len(line.get("msg") or "")
+
+        completed = []
+        chunk, chunk_bytes = self._chunks.get(key, (None, 0))
+        if chunk and (
+            chunk["worker"] != event.get("worker")
+            or len(chunk["lines"]) >= self.max_lines
+            or chunk_bytes + line_bytes > self.max_bytes
+        ):
+            completed.append(chunk)
+            chunk = None
+
+        if chunk is None:
+            chunk = {
+                "type": event["type"],
+                "task": event["task"],
+                "worker": event.get("worker"),
+                "@timestamp": event.get("@timestamp"),
+                "timestamp": event.get("timestamp"),
+                "lines": [],
+            }
+            chunk_bytes = 0
+
+        chunk["lines"].append(line)
+        chunk["last_timestamp"] = event.get("timestamp")
+        chunk["line_count"] = len(chunk["lines"])
+        self._chunks[key] = (chunk, chunk_bytes + line_bytes)
+        return completed
+
+    def flush(self) -> Sequence[dict]:
+        """ Return the incomplete chunks """
+        chunks = [chunk for chunk, _ in self._chunks.values()]
+        self._chunks = {}
+        return chunks
+
+
+def unpack_log_events(doc: dict, reverse: bool = False) -> Sequence[dict]:
+    """
+    Return the log events packed in a chunk document, or the document itself if it holds a single event
+    :param reverse: return the chunk events from the last to the first
+    """
+    lines = doc.get("lines")
+    if lines is None:
+        return [doc]
+    common = {k: v for k, v in doc.items() if k not in CHUNK_FIELDS}
+    events = [dict(common, **line) for line in lines]
+    if reverse:
+        events.reverse()
+    return events
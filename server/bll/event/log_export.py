@@ -0,0 +1,167 @@
+import heapq
+import queue
+import threading
+import zlib
+from typing import Callable, Iterable, Iterator, Optional
+
+from config import config
+from database.errors import translate_errors_context
+from timing_context import TimingContext
+
+log = config.logger(__file__)
+
+_END = object()
+
+
+class _SliceReader(object):
+    """
+    Reads the pages of a single scroll slice in a background thread into a bounded queue,
+    so that the slices are fetched from ES in parallel while the merged output is consumed
+    """
+
+    def __init__(self, es, index, body, routing, scroll, prefetch_pages, stop):
+        self.es = es
+        self.index = index
+        self.body = body
+        self.routing = routing
+        self.scroll = scroll
+        self.stop = stop
+        self.pages = queue.Queue(maxsize=prefetch_pages)
+        self.scroll_id = None
+        self.thread = threading.Thread(target=self._read, daemon=True)
+
+    def _put(self, item) -> bool:
+        while not self.stop.is_set():
+            try:
+                self.pages.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _read(self):
+        try:
+            with translate_errors_context(), TimingContext("es", "task_log_export"):
+                res = self.es.search(
+                    index=self.index,
+                    body=self.body,
+                    routing=self.routing,
+                    scroll=self.scroll,
+                )
+                while True:
+                    self.scroll_id = res.get("_scroll_id")
+                    hits = res["hits"]["hits"]
+                    if not (hits and self._put(hits)):
+                        break
+                    res = self.es.scroll(scroll_id=self.scroll_id, scroll=self.scroll)
+        except Exception as ex:
+            self._put(ex)
+        finally:
+            self._put(_END)
+            if self.scroll_id:
+                try:
+                    self.es.clear_scroll(scroll_id=self.scroll_id, ignore=404)
+                except Exception as ex:
+                    log.warning(f"Failed clearing task log export scroll: {ex}")
+
+    def __iter__(self) -> Iterator[dict]:
+        while True:
+            page = self.pages.get()
+            if page is _END:
+                return
+            if isinstance(page, Exception):
+                raise page
+            yield from page
+
+
+def iter_sliced_scroll(
+    es,
+    index: str,
+    body: dict,
+    routing: str,
+    sort_key: Callable[[dict], object],
+    slices: int = 1,
+    prefetch_pages: int = 2,
+    scroll: str = "1m",
+) -> Iterator[dict]:
+    """
+    Return the search hits of the sorted query, reading the scroll slices in parallel.
+    The body sort must be consistent with sort_key, so that the sorted slices can be merged on the fly.
+    The slice readers are stopped and their scrolls cleared once the returned iterator is exhausted or closed
+    """
+    stop = threading.Event()
+    readers = [
+        _SliceReader(
+            es=es,
+            index=index,
+            body=dict(body, slice={"id": i, "max": slices}) if slices > 1 else body,
+            routing=routing,
+            scroll=scroll,
+            prefetch_pages=prefetch_pages,
+            stop=stop,
+        )
+        for i in range(slices)
+    ]
+    for reader in readers:
+        reader.thread.start()
+    try:
+        if len(readers) == 1:
+            yield from readers[0]
+        else:
+            yield from heapq.merge(*readers, key=sort_key)
+    finally:
+        stop.set()
+
+
+def iter_output_chunks(
+    lines: Iterable[str], buffer_size: int = 1 << 20, compress: bool = False
+) -> Iterator[bytes]:
+    """
+    Encode the lines into output chunks of about buffer_size bytes.
+    If compress is True the output is a gzip stream compressed incrementally, chunk by chunk
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = []
+    buffered = 0
+    for line in lines:
+        buffer.append(line)
+        buffered += len(line)
+        if buffered >= buffer_size:
+            data = "".join(buffer).encode("utf-8")
+            buffer, buffered = [], 0
+            if compressor:
+                data = compressor.compress(data)
+            if data:
+                yield data
+
+    data = "".join(buffer).encode("utf-8")
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """
+    Return True if the Accept-Encoding header value allows a gzip encoded response.
+    gzip is accepted if listed (or matched by '*') with a non-zero quality value
+    """
+    qualities = {}
+    for item in (accept_encoding or "").split(","):
+        coding, *params = (part.strip() for part in item.split(";"))
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
@@ -0,0 +1,66 @@
+import threading
+import time
+from typing import Iterable
+
+from boltons.cacheutils import LRU
+
+from config import config
+
+
+class LogTailNotifier(object):
+    """
+    Wakes up the in-process followers of task logs when new log events of the task are written.
+    Each task has a version that is incremented on every write of its log events. A follower remembers
+    the version it read at, and waits for it to change.
+    The cursors known to be at the end of the task log (at a given version) are also kept, so that idle
+    followers are not searched for again until the task log is written. Since log events may be written by
+    other server processes, these are trusted for end_cursor_ttl_sec only.
+    """
+
+    def __init__(self, end_cursor_ttl_sec: float = None):
+        conf = config.get("services.events.log_tail", {})
+        self.end_cursor_ttl_sec = (
+            end_cursor_ttl_sec
+            if end_cursor_ttl_sec is not None
+            else conf.get("end_cursor_ttl_sec", 10)
+        )
+        self._versions = LRU(max_size=100000)
+        self._end_cursors = LRU(max_size=10000)  # task -> (version, cursor, expiration time)
+        self._cond = threading.Condition()
+
+    def version(self, task_id: str) -> int:
+        with self._cond:
+            return self._versions.get(task_id, 0)
+
+    def notify(self, task_ids: Iterable[str]):
+        with self._cond:
+            for task_id in task_ids:
+                self._versions[task_id] = self._versions.get(task_id, 0) + 1
+            self._cond.notify_all()
+
+    def wait(self, task_id: str, version: int, timeout: float) -> bool:
+        """
+        Wait until the task version changes from the given one or the timeout elapses.
+        Return True if the version changed
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self._versions.get(task_id, 0) != version, timeout=timeout
+            )
+
+    def mark_end(self, task_id: str, version: int, cursor: str):
+        """ Record that no log events follow the cursor at the given version of the task """
+        with self._cond:
+            self._end_cursors[task_id] = (
+                version,
+                cursor,
+                time.time() + self.end_cursor_ttl_sec,
+            )
+
+    def is_end(self, task_id: str, version: int, cursor: str) -> bool:
+        with self._cond:
+            entry = self._end_cursors.get(task_id)
+        return bool(entry) and entry[:2] == (version, cursor) and entry[2] > time.time()
+
+
+log_tail_notifier = LogTailNotifier()
@@ -0,0 +1,326 @@
+import gzip
+import hashlib
+import os
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from typing import Iterable, Optional
+
+import gridfs
+import requests
+from boltons.cacheutils import LRU
+from mongoengine.connection import get_db
+
+from config import config
+from database import Database
+from database.errors import translate_errors_context
+from database.model.task.plot_blob import PlotBlobRef
+from timing_context import TimingContext
+
+log = config.logger(__file__)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class BlobStore(ABC):
+    """ Content-addressed storage of immutable blobs """
+
+    @abstractmethod
+    def put(self, key: str, data: bytes):
+        pass
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """ Return the blob data or None if it does not exist """
+        pass
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        pass
+
+    @abstractmethod
+    def delete(self, key: str):
+        """ Delete the blob. Does nothing if it does not exist """
+        pass
+
+
+class LocalBlobStore(BlobStore):
+    """ Blobs stored as files in a local (or mounted) directory """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key)
+
+    def put(self, key: str, data: bytes):
+        path = self._get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first, so that readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._get_path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._get_path(key))
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._get_path(key))
+        except FileNotFoundError:
+            pass
+
+
+class FileServerBlobStore(BlobStore):
+    """ Blobs uploaded to the fileserver under a path prefix """
+
+    def __init__(self, url: str, prefix: str = "plots", timeout_sec: float = 10):
+        self.url = url.rstrip("/")
+        self.prefix = prefix.strip("/")
+        self.timeout_sec = timeout_sec
+        self._session = requests.Session()
+
+    def _get_path(self, key: str) -> str:
+        return f"{self.prefix}/{key[:2]}/{key}"
+
+    def put(self, key: str, data: bytes):
+        res = self._session.post(
+            self.url, files={self._get_path(key): data}, timeout=self.timeout_sec
+        )
+        res.raise_for_status()
+
+    def get(self, key: str) -> Optional[bytes]:
+        res = self._session.get(
+            f"{self.url}/{self._get_path(key)}", timeout=self.timeout_sec
+        )
+        if res.status_code == 404:
+            return None
+        res.raise_for_status()
+        return res.content
+
+    def exists(self, key: str) -> bool:
+        res = self._session.head(
+            f"{self.url}/{self._get_path(key)}", timeout=self.timeout_sec
+        )
+        if res.status_code == 404:
+            return False
+        res.raise_for_status()
+        return True
+
+    def delete(self, key: str):
+        res = self._session.delete(
+            f"{self.url}/{self._get_path(key)}", timeout=self.timeout_sec
+        )
+        if res.status_code != 404:
+            res.raise_for_status()
+
+
+class GridFSBlobStore(BlobStore):
+    """ Blobs stored in a GridFS bucket of the backend database """
+
+    def __init__(self, collection: str = "plots"):
+        self.collection = collection
+        self._fs = None
+
+    @property
+    def fs(self):
+        if self._fs is None:
+            self._fs = gridfs.GridFS(
+                get_db(Database.backend), collection=self.collection
+            )
+        return self._fs
+
+    def put(self, key: str, data: bytes):
+        try:
+            self.fs.put(data, _id=key)
+        except gridfs.errors.FileExists:
+            pass
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            return self.fs.get(key).read()
+        except gridfs.errors.NoFile:
+            return None
+
+    def exists(self, key: str) -> bool:
+        return self.fs.exists(key)
+
+    def delete(self, key: str):
+        self.fs.delete(key)
+
+
+class PlotStore(object):
+    """
+    Offloads plot bodies (plot_str) of plot events to a blob store. Bodies are compressed and stored
+    by their content hash, so identical plots (e.g. reported unchanged in every iteration) are stored once.
+    The event keeps a plot_ref with the hash, compression codec and body size instead of the body.
+    Blobs are shared between events and tasks, so the tasks referencing each blob are recorded (see
+    PlotBlobRef) and a blob is deleted with the events of the last task that references it.
+    A blob referenced again while it is being deleted may be lost, in which case its events are returned
+    without a plot body.
+    """
+
+    codecs = ("gzip", "zstd")
+
+    def __init__(
+        self,
+        store: BlobStore = None,
+        enabled: bool = None,
+        min_size: int = None,
+        codec: str = None,
+    ):
+        conf = config.get("services.events.plot_storage", {})
+        self.enabled = enabled if enabled is not None else conf.get("enabled", False)
+        self.min_size = min_size if min_size is not None else conf.get("min_size", 1024)
+        self.codec = codec or conf.get("compression", "gzip")
+        if self.codec not in self.codecs:
+            raise ValueError(f"Invalid plot storage compression: {self.codec}")
+        if self.codec == "zstd" and not zstandard:
+            log.warning(
+                "zstandard package is not installed, using gzip compression for plots"
+            )
+            self.codec = "gzip"
+        self._store = store
+        self._conf = conf
+        self._stored_refs = LRU(max_size=10000)  # (task, key) pairs known to be stored
+        self._bodies = LRU(max_size=conf.get("cache_size", 100))
+        self._lock = threading.Lock()
+
+    @property
+    def store(self) -> BlobStore:
+        if self._store is None:
+            self._store = self._create_store(self._conf)
+        return self._store
+
+    @staticmethod
+    def _create_store(conf) -> BlobStore:
+        backend = conf.get("backend", "local")
+        if backend == "local":
+            return LocalBlobStore(**conf.get("local", {}))
+        if backend == "fileserver":
+            return FileServerBlobStore(**conf.get("fileserver", {}))
+        if backend == "gridfs":
+            return GridFSBlobStore(**conf.get("gridfs", {}))
+        raise ValueError(f"Invalid plot storage backend: {backend}")
+
+    def offload(self, event: dict):
+        """
+        Move the event plot body to the blob store if it is large enough.
+        The blobs are referenced by their tasks, so the body of events with no task is kept in the event.
+        If the blob store fails the body is kept in the event
+        """
+        plot_str = event.get("plot_str")
+        if not (self.enabled and isinstance(plot_str, str) and event.get("task")):
+            return
+        body = plot_str.encode("utf-8")
+        if len(body) < self.min_size:
+            return
+
+        content_hash = hashlib.sha256(body).hexdigest()
+        key = f"{content_hash}.{self.codec}"
+        ref = (event.get("task"), key)
+        with self._lock:
+            stored = ref in self._stored_refs
+        if not stored:
+            try:
+                # the reference is added first, so that the blob is not deleted by other tasks meanwhile
+                self._add_ref(*ref)
+                with TimingContext("blob", "plot_store_put"):
+                    if not self.store.exists(key):
+                        self.store.put(key, self._compress(body, self.codec))
+            except Exception:
+                # the plot is kept in the event
+                log.exception(f"Failed storing plot body {key}")
+                return
+            with self._lock:
+                self._stored_refs[ref] = True
+
+        del event["plot_str"]
+        event["plot_ref"] = dict(hash=content_hash, codec=self.codec, size=len(body))
+
+    def rehydrate(self, events: Iterable[dict]):
+        """ Load the offloaded plot bodies of the events back into their plot_str """
+        for event in events:
+            ref = event.get("plot_ref")
+            if not ref:
+                continue
+            key = f"{ref['hash']}.{ref['codec']}"
+            with self._lock:
+                body = self._bodies.get(key)
+            if body is None:
+                with TimingContext("blob", "plot_store_get"):
+                    data = self.store.get(key)
+                if data is None:
+                    log.warning(f"Missing plot body {key}")
+                    continue
+                body = self._decompress(data, ref["codec"]).decode("utf-8")
+                with self._lock:
+                    self._bodies[key] = body
+            event["plot_str"] = body
+            del event["plot_ref"]
+
+    def delete_task_blobs(self, task_id: str):
+        """
+        Drop the references of the task to the plot blobs and delete the blobs that are no longer
+        referenced. Failures are logged and do not fail the task events deletion
+        """
+        try:
+            with translate_errors_context(), TimingContext("mongo", "plot_blob_refs"):
+                refs = PlotBlobRef.objects(task=task_id)
+                keys = set(refs.scalar("key"))
+                if not keys:
+                    return
+                refs.delete()
+                referenced = set(PlotBlobRef.objects(key__in=list(keys)).distinct("key"))
+        except Exception:
+            log.exception(f"Failed deleting the plot references of task {task_id}")
+            return
+
+        with self._lock:
+            for key in keys:
+                self._stored_refs.pop((task_id, key), None)
+
+        for key in keys - referenced:
+            try:
+                with TimingContext("blob", "plot_store_delete"):
+                    self.store.delete(key)
+            except Exception:
+                log.exception(f"Failed deleting plot body {key}")
+
+    @staticmethod
+    def _add_ref(task_id: str, key: str):
+        with translate_errors_context(), TimingContext("mongo", "plot_blob_refs"):
+            PlotBlobRef._get_collection().update_one(
+                {"_id": PlotBlobRef.get_id(task_id, key)},
+                {"$setOnInsert": {"task": task_id, "key": key}},
+                upsert=True,
+            )
+
+    @staticmethod
+    def _compress(data: bytes, codec: str) -> bytes:
+        if codec == "zstd":
+            return zstandard.ZstdCompressor().compress(data)
+        return gzip.compress(data)
+
+    @staticmethod
+    def _decompress(data: bytes, codec: str) -> bytes:
+        if codec == "zstd":
+            if not zstandard:
+                raise ValueError("zstandard package is required for reading zstd plots")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
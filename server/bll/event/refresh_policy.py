@@ -0,0 +1,107 @@
+import threading
+import time
+from fnmatch import fnmatch
+from typing import Sequence, Iterable
+
+from config import config
+from database.errors import translate_errors_context
+from timing_context import TimingContext
+
+log = config.logger(__file__)
+
+
+class RefreshPolicy(object):
+    """ Refresh policies for event bulk writes """
+
+    true = "true"
+    """ Refresh the written indices once the batch is written """
+    wait_for = "wait_for"
+    """ Each bulk request waits for the next periodic refresh """
+    none = "false"
+    """ Rely on the periodic refresh, reads refresh on demand using the tasks ingestion watermark """
+
+    @classmethod
+    def parse(cls, value) -> str:
+        if value is True or str(value).lower() == "true":
+            return cls.true
+        if str(value).lower() == "wait_for":
+            return cls.wait_for
+        if value in (False, None) or str(value).lower() in ("false", "none"):
+            return cls.none
+        raise ValueError(f"Invalid events refresh policy: {value}")
+
+
+class RefreshTracker(object):
+    """
+    Keeps a per-index per-task ingestion watermark for events written without an immediate refresh.
+    Read operations use it in order to refresh an index only when the caller needs events newer than the last
+    refresh. Events older than the periodic refresh interval are always visible, so their watermark is discarded.
+    The watermark is kept in-process, readers served by other processes rely on the periodic refresh.
+    """
+
+    def __init__(self, es, interval_sec: float = None):
+        self.es = es
+        conf = config.get("services.events.refresh", {})
+        self.interval_sec = (
+            interval_sec
+            if interval_sec is not None
+            else conf.get("periodic_interval_sec", 1)
+        )
+        self._default = RefreshPolicy.parse(conf.get("default", RefreshPolicy.none))
+        self._policies = {
+            event_type: RefreshPolicy.parse(policy)
+            for event_type, policy in conf.get("event_types", {}).items()
+        }
+        self._writes = {}  # (index, task_id) -> write time
+        self._refreshes = {}  # index -> refresh time
+        self._lock = threading.Lock()
+
+    def get_policy(self, event_type: str) -> str:
+        return self._policies.get(event_type, self._default)
+
+    def writes_done(self, index: str, task_ids: Iterable[str], policy: str):
+        """ Record that events for the given tasks were written into the index using the given policy """
+        now = time.time()
+        if policy != RefreshPolicy.none:
+            with self._lock:
+                self._refreshes[index] = now
+            return
+
+        with self._lock:
+            for task_id in task_ids:
+                self._writes[(index, task_id)] = now
+            self._prune(now)
+
+    def refresh(self, indices: Sequence[str]):
+        if not indices:
+            return
+        with translate_errors_context(), TimingContext("es", "events_refresh"):
+            self.es.indices.refresh(index=",".join(indices), ignore_unavailable=True)
+        now = time.time()
+        with self._lock:
+            self._refreshes.update((index, now) for index in indices)
+
+    def ensure_visible(self, index_pattern: str, task_ids: Iterable[str]):
+        """
+        Refresh the indices matching the pattern for which any of the tasks has events
+        written after the last refresh
+        """
+        task_ids = set(task_ids)
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            indices = {
+                index
+                for (index, task_id), written in self._writes.items()
+                if task_id in task_ids
+                and fnmatch(index, index_pattern)
+                and written > self._refreshes.get(index, 0)
+            }
+        if indices:
+            self.refresh(sorted(indices))
+
+    def _prune(self, now):
+        """ Drop watermarks older than the periodic refresh interval (these events are already searchable) """
+        expired = now - self.interval_sec
+        for key in [key for key, written in self._writes.items() if written < expired]:
+            del self._writes[key]
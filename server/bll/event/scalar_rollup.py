@@ -0,0 +1,153 @@
+from collections import defaultdict
+from typing import Iterable, Optional, Sequence, Tuple
+
+import attr
+
+import database.utils as dbutils
+from config import config
+
+ROLLUP_EVENT_TYPE = "training_stats_scalar_rollup"
+
+_ROLLUP_MERGE_SCRIPT = """
+def s = ctx._source;
+long last_iter = ((Number) s.last_iter).longValue();
+for (def point : params.points) {
+    long iteration = ((Number) point[0]).longValue();
+    double value = ((Number) point[1]).doubleValue();
+    if (iteration < last_iter) {
+        continue;
+    }
+    if (iteration == last_iter) {
+        s.sum = ((Number) s.sum).doubleValue() - ((Number) s.last_value).doubleValue() + value;
+    } else {
+        s.sum = ((Number) s.sum).doubleValue() + value;
+        s.count = ((Number) s.count).longValue() + 1;
+    }
+    s.min = Math.min(((Number) s.min).doubleValue(), value);
+    s.max = Math.max(((Number) s.max).doubleValue(), value);
+    s.last_iter = iteration;
+    s.last_value = value;
+    last_iter = iteration;
+}
+"""
+
+
+@attr.s
+class RollupBucket(object):
+    """
+    Summary of the scalar values of a single series in a range of iterations.
+    Only the summary is kept, so that the bucket size does not depend on the stride
+    """
+
+    task = attr.ib(type=str)
+    metric = attr.ib(type=str)
+    variant = attr.ib(type=str)
+    stride = attr.ib(type=int)
+    iter = attr.ib(type=int)  # first iteration of the bucket
+    min = attr.ib(type=float, default=None)
+    max = attr.ib(type=float, default=None)
+    sum = attr.ib(type=float, default=0)
+    count = attr.ib(type=int, default=0)
+    last_iter = attr.ib(type=int, default=None)
+    last_value = attr.ib(type=float, default=None)
+
+    def summarize(self, points: Sequence[Tuple[int, float]]):
+        """ Compute the bucket summary from the (iteration, value) points ordered by iteration """
+        values = [v for _, v in points]
+        self.min = min(values)
+        self.max = max(values)
+        self.sum = sum(values)
+        self.count = len(values)
+        self.last_iter, self.last_value = points[-1]
+
+    @property
+    def id(self):
+        return "-".join(
+            (
+                self.task,
+                str(self.stride),
+                str(self.iter),
+                dbutils.hash_field_name(self.metric),
+                dbutils.hash_field_name(self.variant),
+            )
+        )
+
+
+class ScalarRollup(object):
+    """
+    Maintains fixed-stride summaries (min/max/sum/count/last) of the scalar events of each task
+    metric/variant in a companion index, so that long series can be plotted without aggregating
+    every iteration.
+    Buckets are merged into the index using scripted upserts that add the iterations following the last
+    one of the bucket and replace the value of the last iteration, so merging the same events again has
+    no effect. Earlier iterations reported again are not applied, since the bucket does not keep the
+    values of its iterations. Readers detect tasks reported before the rollup was enabled by comparing the
+    first rolled up iteration with the first iteration in the task metrics catalog.
+    The rollup adds a scripted update per bucket to every scalar events write, so it is disabled by default.
+    """
+
+    def __init__(self, enabled: bool = None, strides: Sequence[int] = None):
+        conf = config.get("services.events.scalar_rollup", {})
+        self.enabled = enabled if enabled is not None else conf.get("enabled", False)
+        self.strides = sorted(strides or conf.get("strides", [10, 100, 1000]))
+
+    def get_actions(self, index: str, events: Iterable[dict]) -> Sequence[dict]:
+        """ Return the ES update actions that merge the given scalar events into the rollup buckets """
+        if not self.enabled:
+            return []
+
+        points = defaultdict(dict)
+        for event in events:
+            task, metric, variant = (
+                event.get("task"),
+                event.get("metric"),
+                event.get("variant"),
+            )
+            iteration, value = event.get("iter"), event.get("value")
+            if None in (task, metric, variant, iteration, value):
+                continue
+            for stride in self.strides:
+                start = iteration - iteration % stride
+                points[(task, metric, variant, stride, start)][iteration] = value
+
+        actions = []
+        for (task, metric, variant, stride, start), values in points.items():
+            bucket_points = sorted(values.items())
+            bucket = RollupBucket(
+                task=task, metric=metric, variant=variant, stride=stride, iter=start
+            )
+            bucket.summarize(bucket_points)
+            actions.append(
+                {
+                    "_op_type": "update",
+                    "_index": index,
+                    "_type": "event",
+                    "_id": bucket.id,
+                    "_routing": bucket.task,
+                    "_retry_on_conflict": 3,
+                    "script": {
+                        "lang": "painless",
+                        "inline": _ROLLUP_MERGE_SCRIPT,
+                        "params": {"points": [list(p) for p in bucket_points]},
+                    },
+                    "upsert": attr.asdict(bucket),
+                }
+            )
+        return actions
+
+    def select_stride(self, first_iter: int, last_iter: int, max_points: int) -> Optional[int]:
+        """
+        Return the coarsest stride that still yields at least max_points buckets over the given
+        iterations range, or None if the raw events should be used
+        """
+        if not (self.enabled and max_points):
+            return None
+        span = last_iter - first_iter + 1
+        return next(
+            (
+                stride
+                for stride in reversed(self.strides)
+                if span // stride >= max_points
+            ),
+            None,
+        )
@@ -0,0 +1,39 @@
+import base64
+import binascii
+import json
+from typing import Optional, Sequence
+
+from apierrors import errors
+
+CURSOR_PREFIX = "c1."
+
+
+def is_cursor(scroll_id: str) -> bool:
+    """ Distinguish search_after cursors from legacy ES scroll IDs """
+    return bool(scroll_id) and scroll_id.startswith(CURSOR_PREFIX)
+
+
+def encode_cursor(sort_values: Sequence) -> str:
+    """
+    Encode the sort values of the last returned hit into an opaque continuation token.
+    The token holds no query parameters, the query is rebuilt from the request on every page
+    """
+    payload = json.dumps(list(sort_values)).encode()
+    return CURSOR_PREFIX + base64.urlsafe_b64encode(payload).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Optional[list]:
+    """ Return the search_after sort values encoded in the cursor """
+    try:
+        values = json.loads(
+            base64.urlsafe_b64decode(cursor[len(CURSOR_PREFIX):].encode("ascii"))
+        )
+    except (binascii.Error, ValueError, UnicodeError):
+        values = None
+    if not isinstance(values, list) or not all(
+        isinstance(v, (str, int, float)) for v in values
+    ):
+        raise errors.bad_request.FieldsValueError(
+            "invalid scroll_id", scroll_id=cursor
+        )
+    return values
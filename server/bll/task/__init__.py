@@ -1,4 +1,5 @@
 from .task_bll import TaskBLL
+from .task_cache import task_existence_cache
 from .utils import (
     ChangeStatusRequest,
     update_project_time,
@@ -0,0 +1,603 @@
+import atexit
+import threading
+import time
+from datetime import datetime
+from typing import List, Mapping, Optional, Sequence, Set, Tuple
+
+import attr
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from config import config
+import database.utils as dbutils
+from database.errors import translate_errors_context
+from database.model.task.metrics import MetricEvent
+from database.model.task.metrics_catalog import TaskMetric
+from database.model.task.task import Task
+from .task_cache import task_existence_cache
+
+log = config.logger(__file__)
+
+
+@attr.s
+class MetricStats(object):
+    """ Value statistics of a single metric/variant reported in one or more batches """
+
+    max_last_values = 10
+
+    min_value = attr.ib(type=float)
+    max_value = attr.ib(type=float)
+    last_values = attr.ib(type=list, factory=list)  # (iter, value) pairs
+
+    @classmethod
+    def from_value(cls, iteration: Optional[int], value: float) -> "MetricStats":
+        return cls(min_value=value, max_value=value, last_values=[(iteration, value)])
+
+    def add(self, iteration: Optional[int], value: float):
+        if value < self.min_value:
+            self.min_value = value
+        if value > self.max_value:
+            self.max_value = value
+        self.last_values.append((iteration, value))
+        if len(self.last_values) > 2 * self.max_last_values:
+            self.last_values = self.get_last_values()
+
+    def merge(self, other: "MetricStats"):
+        self.min_value = min(self.min_value, other.min_value)
+        self.max_value = max(self.max_value, other.max_value)
+        self.last_values.extend(other.last_values)
+        self.last_values = self.get_last_values()
+
+    def get_last_values(self) -> List[Tuple[Optional[int], float]]:
+        """
+        Return the values of the latest iterations ordered by iteration.
+        A value reported again for an iteration replaces the previous one
+        """
+        by_iteration = {}
+        for i, (iteration, value) in enumerate(self.last_values):
+            by_iteration[iteration if iteration is not None else (None, i)] = (
+                iteration,
+                value,
+            )
+        return sorted(
+            by_iteration.values(), key=lambda p: p[0] if p[0] is not None else -1
+        )[-self.max_last_values:]
+
+
+@attr.s
+class MetricCatalogStats(object):
+    """ Iterations range and number of events of a single event type metric/variant """
+
+    first_iter = attr.ib(type=int, default=None)
+    last_iter = attr.ib(type=int, default=None)
+    count = attr.ib(type=int, default=0)
+    images = attr.ib(type=dict, factory=dict)  # iter -> debug image url
+
+    def add(self, iteration: Optional[int], count: int = 1):
+        if iteration is not None:
+            if self.first_iter is None or iteration < self.first_iter:
+                self.first_iter = iteration
+            if self.last_iter is None or iteration > self.last_iter:
+                self.last_iter = iteration
+        self.count += count
+
+    def merge(self, other: "MetricCatalogStats"):
+        self.add(other.first_iter, count=other.count)
+        self.add(other.last_iter, count=0)
+        self.images.update(other.images)
+
+
+@attr.s
+class PendingTaskStats(object):
+    """ Statistics updates coalesced for a single task """
+
+    last_update = attr.ib(type=datetime, default=None)
+    last_iteration = attr.ib(type=int, default=None)
+    last_events = attr.ib(
+        type=dict, factory=dict
+    )  # (metric_hash, variant_hash) -> scalar event
+    metric_stats = attr.ib(
+        type=dict, factory=dict
+    )  # (metric_hash, variant_hash) -> MetricStats
+    metric_catalog = attr.ib(
+        type=dict, factory=dict
+    )  # (event_type, metric, variant) -> MetricCatalogStats
+    requests = attr.ib(type=int, default=0)
+    failures = attr.ib(type=int, default=0)  # failed flush attempts
+
+    def merge(self, other: "PendingTaskStats"):
+        self.requests += other.requests
+        self.failures = max(self.failures, other.failures)
+        if other.last_update is not None and (
+            self.last_update is None or self.last_update < other.last_update
+        ):
+            self.last_update = other.last_update
+        if other.last_iteration is not None and (
+            self.last_iteration is None or self.last_iteration < other.last_iteration
+        ):
+            self.last_iteration = other.last_iteration
+        for key, event in other.last_events.items():
+            current = self.last_events.get(key)
+            if current is None or current["timestamp"] <= event["timestamp"]:
+                self.last_events[key] = event
+        for key, stats in other.metric_stats.items():
+            current = self.metric_stats.get(key)
+            if current is None:
+                self.metric_stats[key] = stats
+            else:
+                current.merge(stats)
+        for key, stats in other.metric_catalog.items():
+            current = self.metric_catalog.get(key)
+            if current is None:
+                self.metric_catalog[key] = stats
+            else:
+                current.merge(stats)
+
+
+@attr.s
+class AggregatorStats(object):
+    requests = attr.ib(type=int, default=0)
+    updates = attr.ib(type=int, default=0)
+    flushes = attr.ib(type=int, default=0)
+    total_flush_ms = attr.ib(type=float, default=0)
+    max_flush_ms = attr.ib(type=float, default=0)
+
+    @property
+    def coalescing_ratio(self) -> float:
+        """ Average number of reported updates merged into a single task update """
+        return self.requests / self.updates if self.updates else 0
+
+    @property
+    def avg_flush_ms(self) -> float:
+        return self.total_flush_ms / self.flushes if self.flushes else 0
+
+    def to_dict(self):
+        return dict(
+            attr.asdict(self),
+            coalescing_ratio=self.coalescing_ratio,
+            avg_flush_ms=self.avg_flush_ms,
+        )
+
+
+class TaskStatsAggregator(object):
+    """
+    Write-behind coalescer for the task statistics updated by event ingestion.
+    Updates reported for the same task during the flush window are merged in memory (last iteration is the max,
+    last metrics are taken from the newest event per metric/variant, min/max and the latest values ring are
+    merged) and written for all tasks with unordered bulk writes that do not require reading the tasks first.
+    The tasks metrics catalog entries are upserted the same way.
+    """
+
+    _event_fields = {"metric", "variant", "type", "timestamp", "iter", "value"}
+
+    def __init__(self, flush_interval_sec: float = None, max_pending_tasks: int = None):
+        self.max_variant_images = config.get(
+            "services.events.debug_images.max_iterations_per_variant", 10000
+        )
+        conf = config.get("services.tasks.stats_aggregator", {})
+        self.flush_interval_sec = (
+            flush_interval_sec
+            if flush_interval_sec is not None
+            else conf.get("flush_interval_sec", 0.5)
+        )
+        self.max_pending_tasks = max_pending_tasks or conf.get(
+            "max_pending_tasks", 1000
+        )
+        self.max_flush_retries = conf.get("max_flush_retries", 10)
+        self.stats = AggregatorStats()
+        self._pending = {}  # (company_id, task_id) -> PendingTaskStats
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def add(
+        self,
+        company_id: str,
+        task_id: str,
+        last_update: datetime,
+        last_iteration: Optional[int] = None,
+        last_events: Mapping[str, Mapping[str, dict]] = None,
+        metric_stats: Mapping[Tuple[str, str], MetricStats] = None,
+        metric_catalog: Mapping[Tuple[str, str, str], MetricCatalogStats] = None,
+    ):
+        """
+        Add task statistics reported by an events batch
+        :param last_update: Task's last update time
+        :param last_iteration: Max iteration reported in the batch
+        :param last_events: Latest scalar events per metric hash and variant hash
+        :param metric_stats: Scalar values statistics per metric hash and variant hash
+        :param metric_catalog: Iterations range and events count per event type, metric and variant
+        """
+        stats = PendingTaskStats(
+            last_update=last_update,
+            last_iteration=last_iteration,
+            last_events={
+                (metric_hash, variant_hash): event
+                for metric_hash, variants in (last_events or {}).items()
+                for variant_hash, event in variants.items()
+            },
+            metric_stats=dict(metric_stats or {}),
+            metric_catalog=dict(metric_catalog or {}),
+            requests=1,
+        )
+        with self._lock:
+            pending = self._pending.get((company_id, task_id))
+            if pending is None:
+                self._pending[(company_id, task_id)] = stats
+            else:
+                pending.merge(stats)
+            pending_tasks = len(self._pending)
+
+        if not self.flush_interval_sec or pending_tasks >= self.max_pending_tasks:
+            self.flush()
+        else:
+            self._start_flusher()
+
+    def flush(self):
+        """
+        Write all pending updates. Updates that failed to be written are merged back into the pending ones
+        and retried in the next flush, up to max_flush_retries times
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+
+            start = time.time()
+            # the latest values of iterations reported again replace the previous ones, so these
+            # iterations are pulled from the values arrays before the values are pushed
+            failed = self._pull_last_values(pending)
+            keys = []
+            ops = []
+            for key, stats in pending.items():
+                if key in failed:
+                    continue
+                update = self._get_update(stats)
+                if update:
+                    company_id, task_id = key
+                    keys.append(key)
+                    ops.append(
+                        UpdateOne({"_id": task_id, "company": company_id}, update)
+                    )
+            matched, failed_ops = self._bulk_write(Task, ops)
+            failed.update(keys[i] for i in failed_ops)
+            failed_events = self._write_last_events(
+                {key: stats for key, stats in pending.items() if key not in failed}
+            )
+            for key in failed:
+                self._requeue(
+                    key, attr.evolve(pending[key], metric_catalog={}, requests=0)
+                )
+            for key, last_events in failed_events.items():
+                self._requeue(
+                    key,
+                    PendingTaskStats(
+                        last_events=last_events, failures=pending[key].failures
+                    ),
+                )
+            self._update_stats(
+                requests=sum(s.requests for s in pending.values()),
+                updates=len(ops),
+                flush_ms=(time.time() - start) * 1000,
+            )
+
+            self._write_metric_catalog(pending)
+
+            if matched is not None and matched < len(ops):
+                try:
+                    self._invalidate_missing_tasks(pending)
+                except Exception:
+                    log.exception("Failed looking up tasks missing on statistics update")
+
+    def _bulk_write(self, document_cls, ops: Sequence[UpdateOne]) -> Tuple[Optional[int], Set[int]]:
+        """
+        Write the ops in a single unordered bulk write.
+        Return the number of matched documents (None if unknown) and the indices of the failed ops
+        """
+        if not ops:
+            return 0, set()
+        name = document_cls.__name__
+        try:
+            res = document_cls._get_collection().bulk_write(ops, ordered=False)
+            return res.matched_count, set()
+        except BulkWriteError as ex:
+            write_errors = ex.details.get("writeErrors", [])
+            log.warning(
+                f"Failed writing {len(write_errors)} of {len(ops)} {name} statistics updates: "
+                f"{write_errors[0].get('errmsg') if write_errors else ex}"
+            )
+            return None, {err["index"] for err in write_errors}
+        except Exception:
+            log.exception(f"Failed writing {len(ops)} {name} statistics updates")
+            return None, set(range(len(ops)))
+
+    def _requeue(self, key: Tuple[str, str], stats: PendingTaskStats):
+        stats.failures += 1
+        if stats.failures > self.max_flush_retries:
+            log.error(
+                f"Dropping statistics updates of task {key[1]} after {stats.failures} failed attempts"
+            )
+            return
+        with self._lock:
+            current = self._pending.get(key)
+            if current is not None:
+                # the current updates are newer, so they are merged into the failed ones
+                stats.merge(current)
+            self._pending[key] = stats
+        self._start_flusher()
+
+    @staticmethod
+    def _invalidate_missing_tasks(pending: Mapping[Tuple[str, str], PendingTaskStats]):
+        """
+        Drop the tasks that were not found (deleted, possibly through another server process) from the
+        existence cache, so that their following events are rejected
+        """
+        task_ids = {task_id for _, task_id in pending}
+        with translate_errors_context():
+            found = set(Task.objects(id__in=list(task_ids)).distinct("id"))
+        missing = task_ids - found
+        if missing:
+            log.info(f"Statistics reported for {len(missing)} missing tasks")
+            task_existence_cache.invalidate(missing)
+
+    def _pull_last_values(
+        self, pending: Mapping[Tuple[str, str], PendingTaskStats]
+    ) -> Set[Tuple[str, str]]:
+        """
+        Pull the reported iterations from the tasks latest values arrays.
+        Return the keys of the tasks that failed to be updated
+        """
+        keys = []
+        ops = []
+        for key, stats in pending.items():
+            pull = {}
+            for (metric_hash, variant_hash), metric_stats in stats.metric_stats.items():
+                iterations = sorted(
+                    {i for i, _ in metric_stats.last_values if i is not None}
+                )
+                if iterations:
+                    prefix = f"last_metrics.{metric_hash}.{variant_hash}"
+                    pull[f"{prefix}.last_values"] = {"iter": {"$in": iterations}}
+            if pull:
+                company_id, task_id = key
+                keys.append(key)
+                ops.append(
+                    UpdateOne({"_id": task_id, "company": company_id}, {"$pull": pull})
+                )
+        _, failed = self._bulk_write(Task, ops)
+        return {keys[i] for i in failed}
+
+    def _write_last_events(
+        self, pending: Mapping[Tuple[str, str], PendingTaskStats]
+    ) -> Mapping[Tuple[str, str], dict]:
+        """
+        Write the last scalar event of every task metric/variant. Each event is written only if the stored
+        one is not newer, so that the whole entry comes from the newest event also when updates of different
+        flushes are written out of order. Return the events that failed to be written per task key
+        """
+        keys = []
+        ops = []
+        for key, stats in pending.items():
+            company_id, task_id = key
+            for metric_key, event in stats.last_events.items():
+                keys.append((key, metric_key))
+                ops.append(
+                    self._get_last_event_update(company_id, task_id, metric_key, event)
+                )
+        _, failed = self._bulk_write(Task, ops)
+        failed_events = {}
+        for i in failed:
+            key, metric_key = keys[i]
+            event = pending[key].last_events[metric_key]
+            failed_events.setdefault(key, {})[metric_key] = event
+        return failed_events
+
+    @staticmethod
+    def _get_last_event_update(
+        company_id: str, task_id: str, metric_key: Tuple[str, str], event: dict
+    ) -> UpdateOne:
+        metric_hash, variant_hash = metric_key
+        prefix = f"last_metrics.{metric_hash}.{variant_hash}"
+        metric_event = TaskStatsAggregator._get_metric_event(event)
+        fields = {
+            field: value
+            for field, value in metric_event.to_mongo().items()
+            if field in TaskStatsAggregator._event_fields
+        }
+        query = {"_id": task_id, "company": company_id}
+        timestamp = fields.get("timestamp")
+        if timestamp is not None:
+            query["$or"] = [
+                {f"{prefix}.timestamp": {"$lte": timestamp}},
+                {f"{prefix}.timestamp": {"$exists": False}},
+            ]
+        update = {f"{prefix}.{field}": value for field, value in fields.items()}
+        return UpdateOne(query, {"$set": update})
+
+    @staticmethod
+    def _get_update(stats: PendingTaskStats) -> dict:
+        """
+        Return the task update, or an empty dict if there are no task statistics to update.
+        The last events are written separately (see _write_last_events)
+        """
+        update = {"$max": {}}
+        if stats.last_update is not None:
+            update["$max"]["last_update"] = stats.last_update
+        if stats.last_iteration is not None:
+            update["$max"]["last_iteration"] = stats.last_iteration
+        if stats.metric_stats:
+            update["$min"] = {}
+            update["$push"] = {}
+            for (metric_hash, variant_hash), metric_stats in stats.metric_stats.items():
+                prefix = f"last_metrics.{metric_hash}.{variant_hash}"
+                update["$min"][f"{prefix}.min_value"] = metric_stats.min_value
+                update["$max"][f"{prefix}.max_value"] = metric_stats.max_value
+                update["$push"][f"{prefix}.last_values"] = {
+                    "$each": [
+                        dict(iter=iteration, value=value)
+                        for iteration, value in metric_stats.get_last_values()
+                    ],
+                    "$sort": {"iter": 1},
+                    "$slice": -MetricStats.max_last_values,
+                }
+        return {op: fields for op, fields in update.items() if fields}
+
+    def _write_metric_catalog(self, pending: Mapping[Tuple[str, str], PendingTaskStats]):
+        keys = [
+            (task_key, catalog_key)
+            for task_key, stats in pending.items()
+            for catalog_key in stats.metric_catalog
+        ]
+        if not keys:
+            return
+        entries = [
+            (
+                self._get_catalog_id(task_id, catalog_key),
+                pending[(company_id, task_id)].metric_catalog[catalog_key],
+            )
+            for (company_id, task_id), catalog_key in keys
+        ]
+        try:
+            projects = self._get_task_projects({task_id for (_, task_id), _ in keys})
+        except Exception:
+            log.exception("Failed reading the projects of the metrics catalog tasks")
+            failed = set(range(len(keys)))
+        else:
+            # images re-sent for an iteration replace the previous ones, so the iterations are pulled
+            # from the images arrays before the images are pushed
+            with_images = [i for i, (_, stats) in enumerate(entries) if stats.images]
+            _, failed_pulls = self._bulk_write(
+                TaskMetric,
+                [
+                    UpdateOne(
+                        {"_id": entries[i][0]},
+                        {"$pull": {"images": {"iter": {"$in": sorted(entries[i][1].images)}}}},
+                    )
+                    for i in with_images
+                ],
+            )
+            failed = {with_images[i] for i in failed_pulls}
+            written = [i for i in range(len(keys)) if i not in failed]
+            ops = []
+            for i in written:
+                (company_id, task_id), catalog_key = keys[i]
+                entry_id, stats = entries[i]
+                update = self._get_catalog_update(
+                    company_id, task_id, projects.get(task_id), catalog_key, stats
+                )
+                ops.append(UpdateOne({"_id": entry_id}, update, upsert=True))
+            _, failed_writes = self._bulk_write(TaskMetric, ops)
+            failed.update(written[i] for i in failed_writes)
+        for i in failed:
+            task_key, catalog_key = keys[i]
+            self._requeue(
+                task_key,
+                PendingTaskStats(
+                    metric_catalog={catalog_key: pending[task_key].metric_catalog[catalog_key]},
+                    failures=pending[task_key].failures,
+                ),
+            )
+
+    @staticmethod
+    def _get_catalog_id(task_id: str, key: Tuple[str, str, str]) -> str:
+        event_type, metric, variant = key
+        return TaskMetric.get_id(
+            task_id,
+            event_type,
+            dbutils.hash_field_name(metric),
+            dbutils.hash_field_name(variant),
+        )
+
+    @staticmethod
+    def _get_task_projects(task_ids: Set[str]) -> Mapping[str, Optional[str]]:
+        with translate_errors_context():
+            return dict(Task.objects(id__in=list(task_ids)).scalar("id", "project"))
+
+    def _get_catalog_update(
+        self,
+        company_id: str,
+        task_id: str,
+        project_id: Optional[str],
+        key: Tuple[str, str, str],
+        stats: MetricCatalogStats,
+    ) -> dict:
+        event_type, metric, variant = key
+        update = {
+            "$setOnInsert": dict(
+                company=company_id,
+                task=task_id,
+                type=event_type,
+                metric=metric,
+                variant=variant,
+            ),
+            # the project is set on every update, so that entries of moved tasks are eventually fixed
+            # also when written concurrently with the move
+            "$set": {"project": project_id},
+            "$inc": {"count": stats.count},
+        }
+        if stats.first_iter is not None:
+            update["$min"] = {"first_iter": stats.first_iter}
+            update["$max"] = {"last_iter": stats.last_iter}
+        if stats.images:
+            # the array is kept sorted by iteration, with a single image per iteration
+            update["$push"] = {
+                "images": {
+                    "$each": [
+                        dict(iter=iteration, url=url)
+                        for iteration, url in sorted(stats.images.items())
+                    ],
+                    "$sort": {"iter": 1},
+                    "$slice": -self.max_variant_images,
+                }
+            }
+        return update
+
+    @staticmethod
+    def _get_metric_event(event: dict) -> MetricEvent:
+        me = MetricEvent.from_dict(**event)
+        if "timestamp" in event:
+            me.timestamp = datetime.utcfromtimestamp(event["timestamp"] / 1000)
+        return me
+
+    def get_stats(self) -> dict:
+        """ Return the coalescing and flush latency statistics of this server process """
+        with self._lock:
+            pending_tasks = len(self._pending)
+        return dict(self.stats.to_dict(), pending_tasks=pending_tasks)
+
+    def _update_stats(self, requests: int, updates: int, flush_ms: float):
+        stats = self.stats
+        stats.requests += requests
+        stats.updates += updates
+        stats.flushes += 1
+        stats.total_flush_ms += flush_ms
+        stats.max_flush_ms = max(stats.max_flush_ms, flush_ms)
+        log.debug(
+            f"Flushed statistics of {updates} tasks from {requests} reports in {flush_ms:.1f}ms "
+            f"(coalescing ratio {stats.coalescing_ratio:.2f}, avg flush {stats.avg_flush_ms:.1f}ms)"
+        )
+
+    def _start_flusher(self):
+        if self._thread:
+            return
+        with self._lock:
+            if self._thread:
+                return
+            self._thread = threading.Thread(
+                target=self._flusher, name="task_stats_flusher", daemon=True
+            )
+            self._thread.start()
+            # write the pending updates when the server process exits
+            atexit.register(self.flush)
+
+    def _flusher(self):
+        while True:
+            time.sleep(self.flush_interval_sec)
+            try:
+                self.flush()
+            except Exception:
+                log.exception("Failed flushing task statistics")
+
+
+task_stats_aggregator = TaskStatsAggregator()
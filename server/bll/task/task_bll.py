@@ -15,11 +15,17 @@ from database.fields import OutputDestinationField
 from database.model.model import Model
 from database.model.project import Project
 from database.model.task.metrics import MetricEvent
+from database.model.task.metrics_catalog import TaskMetric
 from database.model.task.output import Output
 from database.model.task.task import Task, TaskStatus, TaskStatusMessage, TaskTags
-from database.utils import get_company_or_none_constraint, id as create_id
+from database.utils import (
+    get_company_or_none_constraint,
+    hash_field_name,
+    id as create_id,
+)
 from service_repo import APICall
 from timing_context import TimingContext
+from .task_cache import task_existence_cache
 from .utils import ChangeStatusRequest, validate_status_change
 
 
@@ -109,6 +115,38 @@ class TaskBLL(object):
                 raise errors.bad_request.InvalidTaskId(ids=task_ids)
             return res
 
+    @staticmethod
+    def assert_exists_cached(company_id, task_ids, allow_public=False):
+        """
+        Verify that the tasks exist and are accessible by the company. Same as assert_exists, but uses
+        the task existence cache and does not return the tasks.
+        :except errors.bad_request.InvalidTaskId: if any of the tasks is not found
+        """
+        task_ids = [task_ids] if isinstance(task_ids, six.string_types) else task_ids
+        ids = set(task_ids)
+        missing, unknown = task_existence_cache.lookup(
+            company_id, ids, allow_public=allow_public
+        )
+        if unknown and not missing:
+            with translate_errors_context(), TimingContext("mongo", "task_exists"):
+                found = {
+                    t.id
+                    for t in Task.get_many(
+                        company=company_id,
+                        query=Q(id__in=unknown),
+                        allow_public=allow_public,
+                        return_dicts=False,
+                    ).only("id")
+                }
+            missing = unknown - found
+            task_existence_cache.update(
+                company_id, found=found, missing=missing, allow_public=allow_public
+            )
+        if missing:
+            raise errors.bad_request.InvalidTaskId(
+                company=company_id, ids=tuple(missing)
+            )
+
     @staticmethod
     def create(call: APICall, fields: dict):
         identity = call.identity
@@ -177,13 +215,65 @@ class TaskBLL(object):
 
     @staticmethod
     def get_unique_metric_variants(company_id, project_ids=None):
+        """
+        Return the unique scalar metric/variant pairs reported by the company tasks (optionally only
+        the tasks of the given projects), along with their last metrics hashed names.
+        Read from the tasks metrics catalog, merged with the last metrics of the tasks that have no
+        catalog entries (tasks reported by previous server versions)
+        """
+        query = Q(company=company_id, type="training_stats_scalar")
+        if project_ids:
+            query &= Q(project__in=project_ids)
+        with translate_errors_context(), TimingContext("mongo", "unique_metric_variants"):
+            result = TaskMetric.objects(query).aggregate(
+                {"$group": {"_id": {"metric": "$metric", "variant": "$variant"}}}
+            )
+            metrics = {
+                (r["_id"]["metric"], r["_id"]["variant"]): dict(
+                    metric=r["_id"]["metric"],
+                    metric_hash=hash_field_name(r["_id"]["metric"]),
+                    variant=r["_id"]["variant"],
+                    variant_hash=hash_field_name(r["_id"]["variant"]),
+                )
+                for r in result
+            }
+
+        for metric in TaskBLL._aggregate_uncataloged_metric_variants(
+            company_id, project_ids
+        ):
+            metrics.setdefault((metric["metric"], metric["variant"]), metric)
+
+        return [metric for _, metric in sorted(metrics.items())]
+
+    @staticmethod
+    def _aggregate_uncataloged_metric_variants(company_id, project_ids=None):
+        """
+        Aggregate the unique metric/variant pairs from the last metrics of the tasks that have no metrics
+        catalog entries. The catalog is looked up using an equality match on the task, so that it is
+        served by the catalog task index, and a single entry is enough to tell that the task is cataloged
+        """
         pipeline = [
             {
                 "$match": dict(
                     company=company_id,
+                    last_metrics={"$exists": True, "$ne": {}},
                     **({"project": {"$in": project_ids}} if project_ids else {}),
                 )
             },
+            {"$project": {"last_metrics": 1}},
+            {
+                "$lookup": {
+                    "from": TaskMetric._get_collection_name(),
+                    "let": {"task": "$_id"},
+                    "pipeline": [
+                        {"$match": {"$expr": {"$eq": ["$task", "$$task"]}}},
+                        {"$limit": 1},
+                        {"$project": {"_id": 1}},
+                    ],
+                    "as": "catalog",
+                }
+            },
+            {"$match": {"catalog": {"$size": 0}}},
             {"$project": {"metrics": {"$objectToArray": "$last_metrics"}}},
             {"$unwind": "$metrics"},
             {
@@ -216,6 +306,16 @@ class TaskBLL(object):
             result = Task.objects.aggregate(*pipeline)
             return [r["metrics"][0] for r in result]
 
+    @staticmethod
+    def update_metrics_catalog_project(
+        company_id: str, task_ids: Collection[str], project_id: str
+    ):
+        """ Move the metrics catalog entries of the tasks to the project the tasks were moved to """
+        with translate_errors_context(), TimingContext("mongo", "metrics_catalog_project"):
+            TaskMetric.objects(company=company_id, task__in=list(task_ids)).update(
+                project=project_id
+            )
+
     @staticmethod
     def set_last_update(
         task_ids: Collection[str], company_id: str, last_update: datetime
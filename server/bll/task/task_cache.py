@@ -0,0 +1,82 @@
+import threading
+import time
+from typing import Iterable, Set, Tuple
+
+from boltons.cacheutils import LRU
+
+from config import config
+
+
+class TaskExistenceCache(object):
+    """
+    LRU cache of task existence/access lookups per (company, task_id, allow_public), grouped by task ID.
+    Both found and missing tasks are cached. Entries are invalidated explicitly when tasks are created, deleted
+    or moved, and expire after their TTL in any case since other server processes do not invalidate this
+    process's cache. The TTL is kept short since events accepted for a task deleted through another process
+    are orphaned. Tasks found missing by the task statistics flush are invalidated as well.
+    """
+
+    def __init__(self, max_size=None, ttl_sec=None, negative_ttl_sec=None):
+        conf = config.get("services.tasks.existence_cache", {})
+        self.enabled = conf.get("enabled", True)
+        self.ttl_sec = ttl_sec if ttl_sec is not None else conf.get("ttl_sec", 5)
+        self.negative_ttl_sec = (
+            negative_ttl_sec
+            if negative_ttl_sec is not None
+            else conf.get("negative_ttl_sec", 5)
+        )
+        self._cache = LRU(max_size=max_size or conf.get("max_size", 100000))
+        self._lock = threading.Lock()
+
+    def lookup(
+        self, company_id: str, task_ids: Iterable[str], allow_public: bool
+    ) -> Tuple[Set[str], Set[str]]:
+        """
+        Return the sets of task IDs known to be missing and task IDs not in cache
+        """
+        missing = set()
+        unknown = set()
+        now = time.time()
+        with self._lock:
+            for task_id in task_ids:
+                entry = self._cache.get(task_id, {}).get((company_id, allow_public))
+                if not entry or entry[1] < now:
+                    unknown.add(task_id)
+                elif not entry[0]:
+                    missing.add(task_id)
+        return missing, unknown
+
+    def update(
+        self,
+        company_id: str,
+        found: Iterable[str],
+        missing: Iterable[str],
+        allow_public: bool,
+    ):
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            for task_id in found:
+                self._cache.setdefault(task_id, {})[(company_id, allow_public)] = (
+                    True,
+                    now + self.ttl_sec,
+                )
+            for task_id in missing:
+                self._cache.setdefault(task_id, {})[(company_id, allow_public)] = (
+                    False,
+                    now + self.negative_ttl_sec,
+                )
+
+    def invalidate(self, task_ids: Iterable[str]):
+        """ Drop all cached lookups of the given tasks (regardless of the company they were looked up for) """
+        with self._lock:
+            for task_id in task_ids:
+                self._cache.pop(task_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+task_existence_cache = TaskExistenceCache()
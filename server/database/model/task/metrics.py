@@ -1,4 +1,17 @@
-from mongoengine import EmbeddedDocument, StringField, DateTimeField, LongField, DynamicField
+from mongoengine import (
+    EmbeddedDocument,
+    StringField,
+    DateTimeField,
+    LongField,
+    DynamicField,
+    ListField,
+    EmbeddedDocumentField,
+)
+
+
+class MetricValue(EmbeddedDocument):
+    iter = LongField()
+    value = DynamicField(required=True)
 
 
 class MetricEvent(EmbeddedDocument):
@@ -8,6 +21,9 @@ class MetricEvent(EmbeddedDocument):
     timestamp = DateTimeField(default=0, required=True)
     iter = LongField()
     value = DynamicField(required=True)
+    min_value = DynamicField()
+    max_value = DynamicField()
+    last_values = ListField(EmbeddedDocumentField(MetricValue))
 
     @classmethod
     def from_dict(cls, **kwargs):
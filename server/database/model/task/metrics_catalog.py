@@ -0,0 +1,53 @@
+from mongoengine import (
+    Document,
+    EmbeddedDocument,
+    EmbeddedDocumentField,
+    ListField,
+    LongField,
+    StringField,
+)
+
+from database import Database, strict
+from database.model.base import DbModelMixin
+
+
+class MetricImage(EmbeddedDocument):
+    iter = LongField()
+    url = StringField()
+
+
+class TaskMetric(DbModelMixin, Document):
+    """
+    Catalog entry of a metric/variant reported by a task for a single event type.
+    Maintained by events ingestion, so that the task (and project) metrics and variants can be listed
+    without aggregating the events. The task project is copied to the entries so that they can be
+    listed per project, and updated when the task is moved to another project.
+    """
+
+    meta = {
+        "db_alias": Database.backend,
+        "strict": strict,
+        "indexes": [
+            ("task", "type", "metric", "variant"),
+            ("company", "type", "metric", "variant"),
+            ("company", "project", "type", "metric", "variant"),
+        ],
+    }
+
+    id = StringField(primary_key=True)
+    company = StringField(required=True)
+    task = StringField(required=True)
+    project = StringField()
+    type = StringField(required=True)
+    metric = StringField(required=True)
+    variant = StringField(required=True)
+    first_iter = LongField()
+    last_iter = LongField()
+    count = LongField(default=0)
+    images = ListField(
+        EmbeddedDocumentField(MetricImage)
+    )  # debug images sorted by iteration
+
+    @staticmethod
+    def get_id(task_id: str, event_type: str, metric_hash: str, variant_hash: str):
+        return f"{task_id}.{event_type}.{metric_hash}.{variant_hash}"
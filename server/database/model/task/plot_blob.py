@@ -0,0 +1,25 @@
+from mongoengine import Document, StringField
+
+from database import Database, strict
+from database.model.base import DbModelMixin
+
+
+class PlotBlobRef(DbModelMixin, Document):
+    """
+    Reference of a task to a plot body stored in the plots blob store. Plot blobs are shared between
+    the tasks that reported the same plot, and are deleted once no task references them.
+    """
+
+    meta = {
+        "db_alias": Database.backend,
+        "strict": strict,
+        "indexes": ["task", "key"],
+    }
+
+    id = StringField(primary_key=True)
+    task = StringField(required=True)
+    key = StringField(required=True)
+
+    @staticmethod
+    def get_id(task_id: str, key: str):
+        return f"{task_id}.{key}"
@@ -6,6 +6,7 @@ import argparse
 import json
 import requests
 from pathlib import Path
+from typing import Sequence
 
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
@@ -13,17 +14,21 @@ from requests.packages.urllib3.util.retry import Retry
 HERE = Path(__file__).parent
 
 
-def apply_mappings_to_host(host: str):
+def apply_mappings_to_host(host: str, optional: Sequence[str] = ()):
+    """
+    Apply the mappings to the host. Optional mappings are applied only if their name is listed in optional,
+    otherwise they are removed from the host
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(max_retries=Retry(5, backoff_factor=0.5))
+    session.mount('http://', adapter)
+
     def _send_mapping(f):
         with f.open() as json_data:
             data = json.load(json_data)
             es_server = host
             url = f"{es_server}/_template/{f.stem}"
 
-            session = requests.Session()
-            adapter = HTTPAdapter(max_retries=Retry(5, backoff_factor=0.5))
-            session.mount('http://', adapter)
-
             session.delete(url)
             r = session.post(
                 url,
@@ -32,10 +37,19 @@ def apply_mappings_to_host(host: str):
             )
             return {"mapping": f.stem, "result": r.text}
 
+    def _delete_mapping(f):
+        r = session.delete(f"{host}/_template/{f.stem}")
+        return {"mapping": f.stem, "result": r.text}
+
     p = HERE / "mappings"
-    return [
+    res = [
         _send_mapping(f) for f in p.iterdir() if f.is_file() and f.suffix == ".json"
     ]
+    res.extend(
+        _send_mapping(f) if f.stem in optional else _delete_mapping(f)
+        for f in (p / "optional").glob("*.json")
+    )
+    return res
 
 
 def parse_args():
@@ -43,13 +57,17 @@ def parse_args():
         description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
     )
     parser.add_argument("hosts", nargs="+")
+    parser.add_argument(
+        "--optional", nargs="*", default=[], help="names of the optional mappings to apply"
+    )
     return parser.parse_args()
 
 
 def main():
-    for host in parse_args().hosts:
+    args = parse_args()
+    for host in args.hosts:
         print(">>>>> Applying mapping to " + host)
-        res = apply_mappings_to_host(host)
+        res = apply_mappings_to_host(host, optional=args.optional)
         print(res)
 
 
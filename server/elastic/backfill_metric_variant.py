@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Add the metric_variant field to events written before it was indexed.
+The field mapping is added to the existing events indices, and the field is set on all the events that
+have a metric and a variant but no metric_variant. The script can be safely run again (for example if
+interrupted), already updated events are skipped.
+"""
+import argparse
+import json
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+INDEX_PATTERN = "events-*,-events-training_stats_scalar_rollup-*"
+
+BACKFILL_SCRIPT = (
+    "ctx._source.metric_variant = ctx._source.metric + '/' + ctx._source.variant"
+)
+
+
+def _get_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(max_retries=Retry(5, backoff_factor=0.5))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def backfill_host(host: str, index_pattern: str = INDEX_PATTERN, wait: bool = True):
+    session = _get_session()
+    headers = {"Content-Type": "application/json"}
+
+    r = session.put(
+        f"{host}/{index_pattern}/_mapping/event",
+        headers=headers,
+        data=json.dumps({"properties": {"metric_variant": {"type": "keyword"}}}),
+    )
+    r.raise_for_status()
+
+    query = {
+        "bool": {
+            "must": [{"exists": {"field": "metric"}}, {"exists": {"field": "variant"}}],
+            "must_not": [{"exists": {"field": "metric_variant"}}],
+        }
+    }
+    r = session.post(
+        f"{host}/{index_pattern}/_update_by_query",
+        params={
+            "conflicts": "proceed",
+            "wait_for_completion": "true" if wait else "false",
+        },
+        headers=headers,
+        data=json.dumps(
+            {"query": query, "script": {"lang": "painless", "inline": BACKFILL_SCRIPT}}
+        ),
+    )
+    r.raise_for_status()
+    return r.json()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("hosts", nargs="+")
+    parser.add_argument(
+        "--index", default=INDEX_PATTERN, help="events indices to backfill"
+    )
+    parser.add_argument(
+        "--no-wait",
+        action="store_true",
+        help="start the backfill as a background task and return its ID",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    for host in args.hosts:
+        print(">>>>> Backfilling metric_variant on " + host)
+        res = backfill_host(host, index_pattern=args.index, wait=not args.no_wait)
+        print(res)
+
+
+if __name__ == "__main__":
+    main()
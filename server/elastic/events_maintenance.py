@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Maintain the events rollover indices (services.events.rollover.enabled):
+- Roll over the events write aliases whose current index reached the max age, documents number or size
+- Shrink the cold indices (rolled over indices older than the cold age) to a single shard
+- Force-merge the cold indices into a single segment
+Shrunk indices replace the original ones, which are kept as aliases so the events read patterns still match them.
+The script is meant to run periodically (e.g. daily) and can be safely run again if interrupted.
+"""
+import argparse
+import json
+import re
+import time
+from typing import Optional, Sequence
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+WRITE_ALIAS_PATTERN = "events-*-write"
+INDEX_PATTERN = "events-*,shrink-events-*"
+ROLLOVER_INDEX_REGEX = re.compile(r"^(shrink-)?events-.+-\d{6}$")
+SHRINK_PREFIX = "shrink-"
+HEADERS = {"Content-Type": "application/json"}
+
+SIZE_UNITS = {"b": 1, "kb": 1 << 10, "mb": 1 << 20, "gb": 1 << 30, "tb": 1 << 40}
+AGE_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def _get_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(max_retries=Retry(5, backoff_factor=0.5))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def parse_size(value: str) -> int:
+    match = re.match(r"^(\d+)\s*([kmgt]?b)?$", value.strip().lower())
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid size: {value}")
+    return int(match.group(1)) * SIZE_UNITS[match.group(2) or "b"]
+
+
+def parse_age(value: str) -> str:
+    if not re.match(r"^\d+[smhd]$", value.strip()):
+        raise argparse.ArgumentTypeError(f"invalid age: {value}")
+    return value.strip()
+
+
+def _age_seconds(age: str) -> int:
+    return int(age[:-1]) * AGE_UNITS[age[-1]]
+
+
+class EventsMaintenance(object):
+    def __init__(self, host: str, dry_run: bool = False, timeout: str = "30m"):
+        self.host = host.rstrip("/")
+        self.dry_run = dry_run
+        self.timeout = timeout
+        self.session = _get_session()
+
+    def _request(self, method, path, params=None, body=None) -> dict:
+        r = self.session.request(
+            method,
+            f"{self.host}/{path}",
+            params=params,
+            headers=HEADERS,
+            data=json.dumps(body) if body is not None else None,
+        )
+        r.raise_for_status()
+        return r.json()
+
+    def get_write_indices(self) -> dict:
+        """ Return the current index of every events write alias """
+        res = self._request("GET", f"_alias/{WRITE_ALIAS_PATTERN}")
+        return {
+            alias: index for index, data in res.items() for alias in data["aliases"]
+        }
+
+    def rollover(
+        self, max_age: str = None, max_docs: int = None, max_size: int = None
+    ) -> Sequence[dict]:
+        """
+        Roll over the write aliases. ES 5 rollover conditions do not include the index size, so indices
+        exceeding max_size are rolled over unconditionally
+        """
+        results = []
+        conditions = {}
+        if max_age:
+            conditions["max_age"] = max_age
+        if max_docs:
+            conditions["max_docs"] = max_docs
+
+        for alias, index in sorted(self.get_write_indices().items()):
+            body = {"conditions": conditions}
+            if max_size and self._get_primaries_size(index) >= max_size:
+                body = {}
+            elif not conditions:
+                continue
+            res = self._request(
+                "POST",
+                f"{alias}/_rollover",
+                params={"dry_run": "true"} if self.dry_run else None,
+                body=body,
+            )
+            results.append(
+                dict(
+                    alias=alias,
+                    old_index=res.get("old_index"),
+                    new_index=res.get("new_index"),
+                    rolled_over=res.get("rolled_over"),
+                    dry_run=self.dry_run,
+                )
+            )
+        return results
+
+    def _get_primaries_size(self, index: str) -> int:
+        res = self._request("GET", f"{index}/_stats/store")
+        return res["indices"][index]["primaries"]["store"]["size_in_bytes"]
+
+    def get_cold_indices(self, cold_age: str) -> dict:
+        """
+        Return the settings of the rollover indices that are no longer written to
+        and were created more than cold_age ago
+        """
+        write_indices = set(self.get_write_indices().values())
+        created_before = (time.time() - _age_seconds(cold_age)) * 1000
+        res = self._request(
+            "GET", f"{INDEX_PATTERN}/_settings", params={"flat_settings": "true"}
+        )
+        return {
+            index: data["settings"]
+            for index, data in res.items()
+            if ROLLOVER_INDEX_REGEX.match(index)
+            and index not in write_indices
+            and int(data["settings"]["index.creation_date"]) < created_before
+        }
+
+    def shrink(self, index: str, settings: dict) -> Optional[str]:
+        """
+        Shrink the index into a single shard index, replacing it.
+        Return the name of the shrunk index, or None if the index has a single shard
+        """
+        if int(settings["index.number_of_shards"]) == 1:
+            return None
+        target = f"{SHRINK_PREFIX}{index}"
+        if self.dry_run:
+            return target
+
+        # a copy of every shard must reside on the same node, and the index must be read only
+        shards = self._request("GET", f"_cat/shards/{index}", params={"format": "json"})
+        node = next(
+            s["node"] for s in shards if s["prirep"] == "p" and s["state"] == "STARTED"
+        )
+        self._request(
+            "PUT",
+            f"{index}/_settings",
+            body={
+                "index.routing.allocation.require._name": node,
+                "index.blocks.write": True,
+            },
+        )
+        self._request(
+            "GET",
+            f"_cluster/health/{index}",
+            params={"wait_for_no_relocating_shards": "true", "timeout": self.timeout},
+        )
+        self._request(
+            "POST",
+            f"{index}/_shrink/{target}",
+            body={
+                "settings": {
+                    "index.number_of_shards": 1,
+                    "index.number_of_replicas": settings.get(
+                        "index.number_of_replicas", 1
+                    ),
+                    "index.codec": "best_compression",
+                }
+            },
+        )
+        health = self._request(
+            "GET",
+            f"_cluster/health/{target}",
+            params={"wait_for_status": "green", "timeout": self.timeout},
+        )
+        if health.get("timed_out"):
+            raise RuntimeError(f"Timed out waiting for shrunk index {target}")
+
+        # events reads match the original index name through the alias. The index is missing from
+        # reads for the short time between its deletion and the alias creation
+        self._request("DELETE", index)
+        self._request(
+            "POST", "_aliases", body={"actions": [{"add": {"index": target, "alias": index}}]}
+        )
+        return target
+
+    def forcemerge(self, index: str) -> bool:
+        """ Merge the index shards into a single segment each. Return False if already merged """
+        stats = self._request("GET", f"{index}/_stats/segments")["indices"][index]
+        shards = stats["primaries"]["segments"]["count"]
+        res = self._request("GET", f"{index}/_settings", params={"flat_settings": "true"})
+        if shards <= int(res[index]["settings"]["index.number_of_shards"]):
+            return False
+        if not self.dry_run:
+            self._request("POST", f"{index}/_forcemerge", params={"max_num_segments": 1})
+        return True
+
+    def maintain_cold_indices(
+        self, cold_age: str, shrink: bool = True, forcemerge: bool = True
+    ) -> Sequence[dict]:
+        results = []
+        for index, settings in sorted(self.get_cold_indices(cold_age).items()):
+            res = dict(index=index, dry_run=self.dry_run)
+            if shrink:
+                target = self.shrink(index, settings)
+                if target:
+                    res["shrunk_into"] = target
+                    index = target
+            if forcemerge and not (self.dry_run and res.get("shrunk_into")):
+                res["force_merged"] = self.forcemerge(index)
+            results.append(res)
+        return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("hosts", nargs="+")
+    parser.add_argument(
+        "--max-age", type=parse_age, default="7d", help="roll over indices older than this (e.g. 7d)"
+    )
+    parser.add_argument(
+        "--max-docs", type=int, default=None, help="roll over indices with more documents"
+    )
+    parser.add_argument(
+        "--max-size",
+        type=parse_size,
+        default=parse_size("50gb"),
+        help="roll over indices with larger primary shards in total (e.g. 50gb)",
+    )
+    parser.add_argument(
+        "--cold-age",
+        type=parse_age,
+        default="1d",
+        help="shrink and force-merge rolled over indices created before this age",
+    )
+    parser.add_argument("--no-rollover", action="store_true")
+    parser.add_argument("--no-shrink", action="store_true")
+    parser.add_argument("--no-forcemerge", action="store_true")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="report the actions without applying them"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    for host in args.hosts:
+        print(">>>>> Maintaining events indices on " + host)
+        maintenance = EventsMaintenance(host, dry_run=args.dry_run)
+        if not args.no_rollover:
+            print(
+                maintenance.rollover(
+                    max_age=args.max_age, max_docs=args.max_docs, max_size=args.max_size
+                )
+            )
+        if not (args.no_shrink and args.no_forcemerge):
+            print(
+                maintenance.maintain_cold_indices(
+                    args.cold_age,
+                    shrink=not args.no_shrink,
+                    forcemerge=not args.no_forcemerge,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
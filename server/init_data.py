@@ -24,10 +24,14 @@ def init_es_data():
     if not hosts_config:
         raise MissingElasticConfiguration(hosts_key)
 
+    optional = []
+    if config.get("services.events.log_storage.indexed", False):
+        optional.append("events_log_indexed")
+
     for conf in hosts_config:
         host = furl(scheme="http", host=conf["host"], port=conf["port"]).url
         log.info(f"Applying mappings to host: {host}")
-        res = apply_mappings_to_host(host)
+        res = apply_mappings_to_host(host, optional=optional)
         log.info(res)
 
 
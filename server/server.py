@@ -6,6 +6,7 @@ from flask_cors import CORS
 from werkzeug.exceptions import BadRequest
 
 import database
+from apierrors import errors
 from apierrors.base import BaseError
 from config import config
 from service_repo import ServiceRepo, APICall
@@ -15,9 +16,19 @@ from timing_context import TimingContext
 from utilities import json
 from init_data import init_es_data, init_mongo_data
 
+
+class _Compress(Compress):
+    """ Response compression that leaves the direct passthrough (streamed as is) responses alone """
+
+    def after_request(self, response):
+        if response.direct_passthrough:
+            return response
+        return super().after_request(response)
+
+
 app = Flask(__name__, static_url_path="/static")
 CORS(app, supports_credentials=True, **config.get("apiserver.cors"))
-Compress(app)
+_Compress(app)
 
 log = config.logger(__file__)
 
@@ -50,36 +61,47 @@ def before_request():
     try:
         call = create_api_call(request)
         content, content_type = ServiceRepo.handle_call(call)
-        headers = None
+        headers = dict(call.result.headers)
         if call.result.filename:
-            headers = {
-                "Content-Disposition": f"attachment; filename={call.result.filename}"
-            }
+            headers[
+                "Content-Disposition"
+            ] = f"attachment; filename={call.result.filename}"
 
         return Response(
-            content, mimetype=content_type, status=call.result.code, headers=headers
+            content,
+            mimetype=content_type,
+            status=call.result.code,
+            headers=headers,
+            direct_passthrough=call.result.direct_passthrough,
         )
     except Exception as ex:
         log.exception(f"Failed processing request {request.url}: {ex}")
         return f"Failed processing request {request.url}", 500
 
 
+def _iter_json_lines(req):
+    """
+    Lazily parse a json-lines request body, one item per line.
+    Items are read from the request stream, so the body is never held in memory as a whole.
+    """
+    for i, line in enumerate(req.stream):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            raise errors.bad_request.BatchValidationError(f"{e} in batch item #{i}")
+        if not isinstance(item, dict):
+            raise errors.bad_request.BatchValidationError(
+                f"json lines must contain objects, found: {type(item).__name__} in batch item #{i}"
+            )
+        yield item
+
+
 def update_call_data(call, req):
     """ Use request payload/form to fill call data or batched data """
     if req.content_type == "application/json-lines":
-        items = []
-        for i, line in enumerate(req.data.splitlines()):
-            try:
-                event = json.loads(line)
-                if not isinstance(event, dict):
-                    raise BadRequest(
-                        f"json lines must contain objects, found: {type(event).__name__}"
-                    )
-                items.append(event)
-            except ValueError as e:
-                msg = f"{e} in batch item #{i}"
-                req.on_json_loading_failed(msg)
-        call.batched_data = items
+        call.batched_data = _iter_json_lines(req)
     else:
         json_body = req.get_json(force=True, silent=False) if req.data else None
         # merge form and args
@@ -26,6 +26,7 @@ class DataContainer(object):
         if data and batched_data:
             raise ValueError("data and batched data are not supported simultaneously")
         self._batched_data = None
+        self._batched_data_stream = None
         self._data = None
         self._data_model = None
         self._data_model_cls = None
@@ -59,6 +60,11 @@ class DataContainer(object):
 
     @property
     def batched_data(self):
+        if self._batched_data_stream is not None:
+            # materialize the stream for callers that need random access to the items
+            self._batched_data = list(self._batched_data_stream)
+            self._batched_data_stream = None
+            self._update_data_model()
         if self._batched_data is not None:
             return self._batched_data
         elif self.data != {}:
@@ -70,10 +76,27 @@ class DataContainer(object):
     def batched_data(self, value):
         if not value:
             return
+        if isinstance(value, types.GeneratorType):
+            self._batched_data_stream = value
+            return
         assert isinstance(value, (tuple, list)), "Batched data should be a list"
         self._batched_data = value
         self._update_data_model()
 
+    @property
+    def has_batched_data_stream(self) -> bool:
+        return self._batched_data_stream is not None
+
+    def iter_batched_data(self):
+        """
+        Return an iterator over the batched data items. If the batched data was set from a stream
+        the items are parsed lazily and the stream can only be iterated once.
+        """
+        if self._batched_data_stream is not None:
+            stream, self._batched_data_stream = self._batched_data_stream, None
+            return stream
+        return iter(self.batched_data)
+
     @property
     def raw_data(self):
         return self._raw_data
@@ -171,6 +194,8 @@ class APICallResult(DataContainer):
         self._traceback = traceback
         self._extra = None
         self._filename = None
+        self._headers = {}
+        self._direct_passthrough = False
 
     def get_log_entry(self):
         res = dict(
@@ -240,6 +265,20 @@ class APICallResult(DataContainer):
     def filename(self, value):
         self._filename = value
 
+    @property
+    def headers(self):
+        """ Extra HTTP response headers """
+        return self._headers
+
+    @property
+    def direct_passthrough(self):
+        """ The raw data is streamed to the client as is, with no response compression """
+        return self._direct_passthrough
+
+    @direct_passthrough.setter
+    def direct_passthrough(self, value):
+        self._direct_passthrough = value
+
 
 class MissingIdentity(Exception):
     pass
@@ -513,8 +552,9 @@ class APICall(DataContainer):
                 return float(str(version))
             return str(version)
 
-        if self.result.raw_data and not self.failed:
-            # endpoint returned raw data and no error was detected, return raw data, no fancy dicts
+        if self.result.raw_data is not None:
+            # endpoint returned raw data (possibly with a non-200 status, e.g. a partial content response),
+            # return raw data, no fancy dicts. Errors raised by the endpoint replace the result and its raw data
             return self.result.raw_data, self.result.content_type
 
         else:
@@ -58,6 +58,11 @@ def validate_role(endpoint, call):
         pass
 
 
+def _get_call_data_items(call):
+    """ Return the batched call data unless it is streamed (a stream must be left for the endpoint to consume) """
+    return None if call.has_batched_data_stream else call.batched_data
+
+
 def validate_auth(endpoint, call):
     """ Validate authorization for this endpoint and call.
         If authentication has occurred, the call is updated with the authentication results.
@@ -77,7 +82,7 @@ def validate_auth(endpoint, call):
         auth = call.authorization or ""
         auth_type, _, auth_data = auth.partition(" ")
         authorize_func = get_auth_func(auth_type)
-        call.auth = authorize_func(auth_data, service, action, call.batched_data)
+        call.auth = authorize_func(auth_data, service, action, _get_call_data_items(call))
     except Exception as e:
         if endpoint.authorize:
             # if endpoint requires authorization, re-raise exception
@@ -150,7 +155,7 @@ def validate_impersonation(endpoint, call):
                 ),
                 service=service,
                 action=action,
-                call_data_items=call.batched_data,
+                call_data_items=_get_call_data_items(call),
             )
         else:
             return False
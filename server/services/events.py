@@ -1,12 +1,17 @@
 import itertools
 from collections import defaultdict
 from operator import itemgetter
+from typing import Optional, Tuple
 
 import six
 
 from apierrors import errors
 from bll.event import EventBLL
+from bll.event.columnar import encode_column, encode_series
+from bll.event.log_export import accepts_gzip, iter_output_chunks
 from bll.task import TaskBLL
+from bll.task.stats_aggregator import task_stats_aggregator
+from config import config
 from service_repo import APICall, endpoint
 from utilities import json
 
@@ -14,36 +19,114 @@ task_bll = TaskBLL()
 event_bll = EventBLL()
 
 
-@endpoint("events.add")
-def add(call, company_id, req_model):
-    assert isinstance(call, APICall)
-    added, batch_errors = event_bll.add_events(company_id, [call.data.copy()], call.worker)
+def _add_events(call, company_id, events) -> int:
+    """ Add the events and return the number of events that were processed """
+    if call.exec_async:
+        ticket = event_bll.add_events_async(company_id, events, call.worker)
+        call.result.data = dict(ticket=ticket.id, status=ticket.status)
+        return ticket.events
+
+    added, batch_errors = event_bll.add_events(company_id, events, call.worker)
     call.result.data = dict(
         added=added,
         errors=len(batch_errors)
     )
+    return added + len(batch_errors)
+
+
+@endpoint("events.add")
+def add(call, company_id, req_model):
+    assert isinstance(call, APICall)
+    _add_events(call, company_id, [call.data.copy()])
     call.kpis["events"] = 1
 
 
 @endpoint("events.add_batch")
 def add_batch(call, company_id, req_model):
     assert isinstance(call, APICall)
-    events = call.batched_data
-    if events is None or len(events) == 0:
+    events = call.iter_batched_data()
+    first = next(events, None)
+    if first is None:
         raise errors.bad_request.BatchContainsNoItems()
 
-    added, batch_errors = event_bll.add_events(company_id, events, call.worker)
+    call.kpis["events"] = _add_events(
+        call, company_id, itertools.chain([first], events)
+    )
+
+
+@endpoint(
+    "events.add_scalars", required_fields=["task", "metric", "variant", "iter", "values"]
+)
+def add_scalars(call, company_id, req_model):
+    assert isinstance(call, APICall)
+    added, batch_errors = event_bll.add_scalars(
+        company_id,
+        task_id=call.data["task"],
+        metric=call.data["metric"],
+        variant=call.data["variant"],
+        iterations=call.data["iter"],
+        values=call.data["values"],
+        timestamps=call.data.get("timestamps"),
+        worker=call.worker,
+    )
+    call.result.data = dict(added=added, errors=len(batch_errors))
+    call.kpis["events"] = added + len(batch_errors)
+
+
+def _get_incremental_fetch(call, company_id, task_ids, event_type) -> Tuple[dict, dict]:
+    """
+    Return the since filters requested by the caller and, if any were requested, the watermark
+    to return for the next incremental fetch. The watermark is taken before the events are fetched
+    """
+    since = {
+        key: call.data[key]
+        for key in ("since_iter", "since_timestamp")
+        if call.data.get(key) is not None
+    }
+    if not since:
+        return since, {}
+    last_iter, last_timestamp = event_bll.get_task_events_watermark(
+        company_id, task_ids, event_type
+    )
+    return (
+        since,
+        dict(
+            last_iter=last_iter if last_iter is not None else since.get("since_iter"),
+            last_timestamp=last_timestamp
+            if last_timestamp is not None
+            else since.get("since_timestamp"),
+        ),
+    )
+
+
+def _get_series_encoding(call) -> Optional[str]:
+    """ Return the requested binary encoding of number series, or None for JSON arrays """
+    encoding = call.data.get("encoding")
+    return encoding if encoding and encoding != "json" else None
+
+
+def _get_min_iter(call, since: dict) -> Optional[int]:
+    """ Combine the requested min_iter with the incremental fetch since_iter """
+    bounds = [
+        value
+        for value in (call.data.get("min_iter"), since.get("since_iter"))
+        if value is not None
+    ]
+    return max(bounds) if bounds else None
+
+
+@endpoint("events.get_ingestion_status", required_fields=["ticket"])
+def get_ingestion_status(call, company_id, req_model):
+    ticket = event_bll.get_ingestion_ticket(company_id, call.data["ticket"])
     call.result.data = dict(
-        added=added,
-        errors=len(batch_errors)
+        ticket.to_dict(), task_stats=task_stats_aggregator.get_stats()
     )
-    call.kpis["events"] = len(events)
 
 
 @endpoint("events.get_task_log", required_fields=["task"])
 def get_task_log(call, company_id, req_model):
     task_id = call.data["task"]
-    task_bll.assert_exists(company_id, task_id, allow_public=True)
+    task_bll.assert_exists_cached(company_id, task_id, allow_public=True)
     order = call.data.get("order") or "desc"
     scroll_id = call.data.get("scroll_id")
     batch_size = int(call.data.get("batch_size") or 500)
@@ -63,7 +146,7 @@ def get_task_log(call, company_id, req_model):
 @endpoint("events.get_task_log", min_version="1.7", required_fields=["task"])
 def get_task_log_v1_7(call, company_id, req_model):
     task_id = call.data["task"]
-    task_bll.assert_exists(company_id, task_id, allow_public=True)
+    task_bll.assert_exists_cached(company_id, task_id, allow_public=True)
 
     order = call.data.get("order") or "desc"
     from_ = call.data.get("from") or "head"
@@ -78,7 +161,8 @@ def get_task_log_v1_7(call, company_id, req_model):
         order=scroll_order,
         event_type="log",
         batch_size=batch_size,
-        scroll_id=scroll_id
+        scroll_id=scroll_id,
+        only_fields=call.data.get("only_fields"),
     )
 
     if scroll_order != order:
@@ -92,10 +176,55 @@ def get_task_log_v1_7(call, company_id, req_model):
     )
 
 
+@endpoint("events.get_task_log_tail", required_fields=["task"])
+def get_task_log_tail(call, company_id, req_model):
+    task_id = call.data["task"]
+    task_bll.assert_exists_cached(company_id, task_id, allow_public=True)
+
+    max_timeout_sec = config.get("services.events.log_tail.max_timeout_sec", 30)
+    timeout_sec = min(float(call.data.get("timeout_sec") or 0), max_timeout_sec)
+    events, cursor = event_bll.get_task_log_tail(
+        company_id,
+        task_id,
+        cursor=call.data.get("cursor"),
+        batch_size=int(call.data.get("batch_size") or 500),
+        timeout_sec=max(timeout_sec, 0),
+    )
+
+    call.result.data = dict(events=events, returned=len(events), cursor=cursor)
+
+
+@endpoint("events.search_task_log", required_fields=["task", "query"])
+def search_task_log(call, company_id, req_model):
+    task_id = call.data["task"]
+    task_bll.assert_exists_cached(company_id, task_id, allow_public=True)
+    if not event_bll.log_indexed:
+        raise errors.bad_request.NotSupported(
+            "log search requires the indexed log storage mode"
+        )
+
+    results, cursor, total = event_bll.search_task_log(
+        company_id,
+        task_id,
+        query=call.data["query"],
+        match=call.data.get("match") or "phrase",
+        levels=call.data.get("levels"),
+        from_timestamp=call.data.get("from_timestamp"),
+        to_timestamp=call.data.get("to_timestamp"),
+        context_lines=int(call.data.get("context_lines") or 0),
+        batch_size=int(call.data.get("batch_size") or 100),
+        cursor=call.data.get("cursor"),
+    )
+
+    call.result.data = dict(
+        results=results, returned=len(results), total=total, cursor=cursor
+    )
+
+
 @endpoint('events.download_task_log', required_fields=['task'])
 def download_task_log(call, company_id, req_model):
     task_id = call.data['task']
-    task_bll.assert_exists(company_id, task_id, allow_public=True)
+    task_bll.assert_exists_cached(company_id, task_id, allow_public=True)
 
     line_type = call.data.get('line_type', 'json').lower()
     line_format = str(call.data.get('line_format', '{asctime} {worker} {level} {msg}'))
@@ -127,47 +256,84 @@ def download_task_log(call, company_id, req_model):
         # make sure line_format has a trailing newline
         line_format = line_format.rstrip('\n') + '\n'
 
-    def generate():
-        scroll_id = None
-        batch_size = 1000
-        while True:
-            log_events, scroll_id, _ = event_bll.scroll_task_events(
-                company_id,
-                task_id,
-                order="asc",
-                event_type="log",
-                batch_size=batch_size,
-                scroll_id=scroll_id
-            )
-            if not log_events:
-                break
-            for ev in log_events:
-                ev['asctime'] = ev.pop('@timestamp')
-                if is_json:
-                    ev.pop('type')
-                    ev.pop('task')
-                    yield json.dumps(ev) + '\n'
-                else:
-                    try:
-                        yield line_format.format(**ev)
-                    except KeyError as ex:
-                        raise errors.bad_request.FieldsValueError(
-                            'undefined placeholders in line format',
-                            placeholders=[str(ex)]
-                        )
-
-            if len(log_events) < batch_size:
-                break
+    def format_lines(log_events):
+        for ev in log_events:
+            ev['asctime'] = ev.pop('@timestamp')
+            if is_json:
+                ev.pop('type')
+                ev.pop('task')
+                yield json.dumps(ev) + '\n'
+            else:
+                try:
+                    yield line_format.format_map(ev)
+                except KeyError as ex:
+                    raise errors.bad_request.FieldsValueError(
+                        'undefined placeholders in line format',
+                        placeholders=[str(ex)]
+                    )
+
+    offset = _get_log_lines_offset(call)
+    total_lines = event_bll.get_task_log_line_count(company_id, task_id)
+    call.result.headers["Accept-Ranges"] = "lines"
+    if offset:
+        if offset >= total_lines:
+            # a bare response, with no body to tell apart from the log lines
+            call.result.code = 416
+            call.result.headers["Content-Range"] = f"lines */{total_lines}"
+            call.result.content_type = 'text/plain'
+            call.result.raw_data = ''
+            return
+        call.result.code = 206
+        call.result.headers["Content-Range"] = f"lines {offset}-{total_lines - 1}/{total_lines}"
+
+    export_conf = config.get("services.events.log_export", {})
+    compress = export_conf.get("gzip", True) and accepts_gzip(_get_header(call, "Accept-Encoding"))
+    # the output is encoded here as it is streamed, so it is passed through the response compression
+    # that would otherwise buffer it
+    call.result.direct_passthrough = True
+    if compress:
+        call.result.headers["Content-Encoding"] = "gzip"
 
     call.result.filename = 'task_%s.log' % task_id
     call.result.content_type = 'text/plain'
-    call.result.raw_data = generate()
+    call.result.raw_data = iter_output_chunks(
+        format_lines(event_bll.iter_task_log_events(company_id, task_id, offset=offset)),
+        buffer_size=export_conf.get("buffer_size", 1 << 20),
+        compress=compress,
+    )
+
+
+def _get_header(call, name):
+    """ Return the value of the request header, matching its name case-insensitively """
+    name = name.lower()
+    return next((v for k, v in call.headers.items() if k.lower() == name), None)
+
+
+def _get_log_lines_offset(call) -> int:
+    """
+    Return the number of log lines to skip, either requested explicitly or using a 'Range: lines=<offset>-'
+    header for resuming a download. Range headers in other units are ignored
+    """
+    offset = call.data.get("offset")
+    if offset is None:
+        range_header = _get_header(call, "Range") or ""
+        unit, _, ranges = range_header.partition("=")
+        start, sep, end = ranges.strip().partition("-")
+        if unit.strip() == "lines" and sep and not end and start.isdigit():
+            offset = int(start)
+    try:
+        lines_offset = int(offset or 0)
+    except (TypeError, ValueError):
+        lines_offset = -1
+    if lines_offset < 0:
+        raise errors.bad_request.FieldsValueError('invalid log lines offset', offset=offset)
+    return lines_offset
 
 
 @endpoint("events.get_vector_metrics_and_variants", required_fields=["task"])
 def get_vector_metrics_and_variants(call, company_id, req_model):
     task_id = call.data["task"]
-    task_bll.assert_exists(company_id, task_id, allow_public=True)
+    task_bll.assert_exists_cached(company_id, task_id, allow_public=True)
     call.result.data = dict(
         metrics=event_bll.get_metrics_and_variants(company_id, task_id, "training_stats_vector")
     )
@@ -176,7 +342,7 @@ def get_vector_metrics_and_variants(call, company_id, req_model):
 @endpoint("events.get_scalar_metrics_and_variants", required_fields=["task"])
 def get_scalar_metrics_and_variants(call, company_id, req_model):
     task_id = call.data["task"]
-    task_bll.assert_exists(company_id, task_id, allow_public=True)
+    task_bll.assert_exists_cached(company_id, task_id, allow_public=True)
     call.result.data = dict(
         metrics=event_bll.get_metrics_and_variants(company_id, task_id, "training_stats_scalar")
     )
@@ -186,10 +352,21 @@ def get_scalar_metrics_and_variants(call, company_id, req_model):
 @endpoint("events.vector_metrics_iter_histogram", required_fields=["task", "metric", "variant"])
 def vector_metrics_iter_histogram(call, company_id, req_model):
     task_id = call.data["task"]
-    task_bll.assert_exists(company_id, task_id, allow_public=True)
+    task_bll.assert_exists_cached(company_id, task_id, allow_public=True)
     metric = call.data["metric"]
     variant = call.data["variant"]
     iterations, vectors = event_bll.get_vector_metrics_per_iter(company_id, task_id, metric, variant)
+    encoding = _get_series_encoding(call)
+    if encoding:
+        call.result.data = dict(
+            metric=metric,
+            variant=variant,
+            vectors=[encode_column(vector, encoding) for vector in vectors],
+            iterations=encode_column(iterations),
+            encoding=encoding,
+        )
+        return
+
     call.result.data = dict(
         metric=metric,
         variant=variant,
@@ -205,12 +382,17 @@ def get_task_events(call, company_id, req_model):
     scroll_id = call.data.get("scroll_id")
     order = call.data.get("order") or "asc"
 
-    task_bll.assert_exists(company_id, task_id, allow_public=True)
+    task_bll.assert_exists_cached(company_id, task_id, allow_public=True)
+    since, watermark = _get_incremental_fetch(
+        call, company_id, [task_id], event_type or "*"
+    )
     result = event_bll.get_task_events(
         company_id, task_id,
         sort=[{"timestamp": {"order": order}}],
         event_type=event_type,
-        scroll_id=scroll_id
+        scroll_id=scroll_id,
+        only_fields=call.data.get("only_fields"),
+        **since
     )
 
     call.result.data = dict(
@@ -218,6 +400,7 @@ def get_task_events(call, company_id, req_model):
         returned=len(result.events),
         total=result.total_events,
         scroll_id=result.next_scroll_id,
+        **watermark
     )
 
 
@@ -227,7 +410,7 @@ def get_scalar_metric_data(call, company_id, req_model):
     metric = call.data["metric"]
     scroll_id = call.data.get("scroll_id")
 
-    task_bll.assert_exists(company_id, task_id, allow_public=True)
+    task_bll.assert_exists_cached(company_id, task_id, allow_public=True)
     result = event_bll.get_task_events(
         company_id, task_id,
         event_type="training_stats_scalar",
@@ -249,7 +432,7 @@ def get_task_latest_scalar_values(call, company_id, req_model):
     task_id = call.data["task"]
     task = task_bll.assert_exists(company_id, task_id, allow_public=True)
     metrics, last_timestamp = event_bll.get_task_latest_scalar_values(company_id, task_id)
-    es_index = EventBLL.get_index_name(company_id, "*")
+    es_index = EventBLL.get_search_index_name(company_id, "*")
     last_iters = event_bll.get_last_iters(es_index, task_id, None, 1)
     call.result.data = dict(
         metrics=metrics,
@@ -260,13 +443,60 @@ def get_task_latest_scalar_values(call, company_id, req_model):
     )
 
 
+@endpoint(
+    "events.get_task_latest_scalar_values", min_version="2.2", required_fields=["task"]
+)
+def get_task_latest_scalar_values_v2_2(call, company_id, req_model):
+    task_id = call.data["task"]
+    task = task_bll.assert_exists(
+        company_id,
+        task_id,
+        allow_public=True,
+        only=("id", "name", "status", "last_iteration", "last_metrics"),
+    )[0]
+    metrics, last_timestamp = event_bll.get_task_scalar_values_summary(task)
+    call.result.data = dict(
+        metrics=metrics,
+        last_iter=task.last_iteration or 0,
+        name=task.name,
+        status=task.status,
+        last_timestamp=last_timestamp
+    )
+
+
+@endpoint("events.get_task_summary", required_fields=["task"])
+def get_task_summary(call, company_id, req_model):
+    task_id = call.data["task"]
+    task_bll.assert_exists_cached(call.identity.company, task_id, allow_public=True)
+    call.result.data = dict(
+        task=task_id, **event_bll.get_task_summary(company_id, task_id)
+    )
+
+
 # todo: should not repeat iter (x-axis) for each metric/variant, JS client should get raw data and fill gaps if needed
 @endpoint("events.scalar_metrics_iter_histogram", required_fields=["task"])
 def scalar_metrics_iter_histogram(call, company_id, req_model):
     task_id = call.data["task"]
-    task_bll.assert_exists(call.identity.company, task_id, allow_public=True)
-    metrics = event_bll.get_scalar_metrics_average_per_iter(company_id, task_id)
-    call.result.data = metrics
+    task_bll.assert_exists_cached(call.identity.company, task_id, allow_public=True)
+    since, watermark = _get_incremental_fetch(
+        call, company_id, [task_id], "training_stats_scalar"
+    )
+    metrics = event_bll.get_scalar_metrics_average_per_iter(
+        company_id,
+        task_id,
+        max_points=call.data.get("max_points"),
+        min_iter=_get_min_iter(call, since),
+        max_iter=call.data.get("max_iter"),
+        since_timestamp=since.get("since_timestamp"),
+    )
+    encoding = _get_series_encoding(call)
+    if encoding:
+        call.result.data = dict(encode_series(metrics or {}, encoding), **watermark)
+    elif since:
+        # incremental fetches return the metrics along with the watermark
+        call.result.data = dict(metrics=metrics, **watermark)
+    else:
+        call.result.data = metrics
 
 
 @endpoint("events.multi_task_scalar_metrics_iter_histogram", required_fields=["tasks"])
@@ -275,9 +505,23 @@ def multi_task_scalar_metrics_iter_histogram(call, company_id, req_model):
     if isinstance(task_ids, six.string_types):
         task_ids = [s.strip() for s in task_ids.split(",")]
     # Note, bll already validates task ids as it needs their names
-    call.result.data = dict(
-        metrics=event_bll.compare_scalar_metrics_average_per_iter(company_id, task_ids, allow_public=True)
+    since, watermark = _get_incremental_fetch(
+        call, company_id, task_ids, "training_stats_scalar"
     )
+    metrics = event_bll.compare_scalar_metrics_average_per_iter(
+        company_id,
+        task_ids,
+        allow_public=True,
+        max_points=call.data.get("max_points"),
+        min_iter=_get_min_iter(call, since),
+        max_iter=call.data.get("max_iter"),
+        since_timestamp=since.get("since_timestamp"),
+    )
+    encoding = _get_series_encoding(call)
+    if encoding:
+        call.result.data = dict(encode_series(metrics or {}, encoding), **watermark)
+    else:
+        call.result.data = dict(metrics=metrics, **watermark)
 
 
 @endpoint("events.get_multi_task_plots", required_fields=["tasks"])
@@ -290,13 +534,13 @@ def get_multi_task_plots_v1_7(call, company_id, req_model):
         company_id=call.identity.company, only=('id', 'name'), task_ids=task_ids, allow_public=True
     )
 
-    # Get last 10K events by iteration and group them by unique metric+variant, returning top events for combination
-    result = event_bll.get_task_events(
-        company_id, task_ids,
+    result = _get_last_iters_events(
+        company_id,
+        task_ids,
         event_type="plot",
-        sort=[{"iter": {"order": "desc"}}],
-        size=10000,
-        scroll_id=scroll_id
+        iters=iters,
+        scroll_id=scroll_id,
+        only_fields=_get_grouping_only_fields(call),
     )
 
     tasks = {t.id: t.name for t in tasks}
@@ -326,7 +570,8 @@ def get_multi_task_plots(call, company_id, req_model):
         event_type="plot",
         sort=[{"iter": {"order": "desc"}}],
         last_iter_count=iters,
-        scroll_id=scroll_id
+        scroll_id=scroll_id,
+        only_fields=_get_grouping_only_fields(call),
     )
 
     tasks = {t.id: t.name for t in tasks}
@@ -347,21 +592,14 @@ def get_task_plots_v1_7(call, company_id, req_model):
     iters = call.data.get("iters", 1)
     scroll_id = call.data.get("scroll_id")
 
-    task_bll.assert_exists(call.identity.company, task_id, allow_public=True)
-    # events, next_scroll_id, total_events = event_bll.get_task_events(
-    #     company_id, task_id,
-    #     event_type="plot",
-    #     sort=[{"iter": {"order": "desc"}}],
-    #     last_iter_count=iters,
-    #     scroll_id=scroll_id)
-
-    # get last 10K events by iteration and group them by unique metric+variant, returning top events for combination
-    result = event_bll.get_task_events(
-        company_id, task_id,
+    task_bll.assert_exists_cached(call.identity.company, task_id, allow_public=True)
+    result = _get_last_iters_events(
+        company_id,
+        [task_id],
         event_type="plot",
-        sort=[{"iter": {"order": "desc"}}],
-        size=10000,
-        scroll_id=scroll_id
+        iters=iters,
+        scroll_id=scroll_id,
+        only_fields=_get_grouping_only_fields(call),
     )
 
     return_events = _get_top_iter_unique_events(result.events, max_iters=iters)
@@ -380,13 +618,16 @@ def get_task_plots(call, company_id, req_model):
     iters = call.data.get("iters", 1)
     scroll_id = call.data.get("scroll_id")
 
-    task_bll.assert_exists(call.identity.company, task_id, allow_public=True)
+    task_bll.assert_exists_cached(call.identity.company, task_id, allow_public=True)
+    since, watermark = _get_incremental_fetch(call, company_id, [task_id], "plot")
     result = event_bll.get_task_events(
         company_id, task_id,
         event_type="plot",
         sort=[{"iter": {"order": "desc"}}],
         last_iter_count=iters,
-        scroll_id=scroll_id
+        scroll_id=scroll_id,
+        only_fields=call.data.get("only_fields"),
+        **since
     )
 
     return_events = result.events
@@ -396,6 +637,7 @@ def get_task_plots(call, company_id, req_model):
         returned=len(return_events),
         total=result.total_events,
         scroll_id=result.next_scroll_id,
+        **watermark
     )
 
 
@@ -405,21 +647,14 @@ def get_debug_images_v1_7(call, company_id, req_model):
     iters = call.data.get("iters") or 1
     scroll_id = call.data.get("scroll_id")
 
-    task_bll.assert_exists(call.identity.company, task_id, allow_public=True)
-    # events, next_scroll_id, total_events = event_bll.get_task_events(
-    #     company_id, task_id,
-    #     event_type="training_debug_image",
-    #     sort=[{"iter": {"order": "desc"}}],
-    #     last_iter_count=iters,
-    #     scroll_id=scroll_id)
-
-    # get last 10K events by iteration and group them by unique metric+variant, returning top events for combination
-    result = event_bll.get_task_events(
-        company_id, task_id,
+    task_bll.assert_exists_cached(call.identity.company, task_id, allow_public=True)
+    result = _get_last_iters_events(
+        company_id,
+        [task_id],
         event_type="training_debug_image",
-        sort=[{"iter": {"order": "desc"}}],
-        size=10000,
-        scroll_id=scroll_id
+        iters=iters,
+        scroll_id=scroll_id,
+        only_fields=_get_grouping_only_fields(call),
     )
 
     return_events = _get_top_iter_unique_events(result.events, max_iters=iters)
@@ -439,13 +674,18 @@ def get_debug_images(call, company_id, req_model):
     iters = call.data.get("iters") or 1
     scroll_id = call.data.get("scroll_id")
 
-    task_bll.assert_exists(call.identity.company, task_id, allow_public=True)
+    task_bll.assert_exists_cached(call.identity.company, task_id, allow_public=True)
+    since, watermark = _get_incremental_fetch(
+        call, company_id, [task_id], "training_debug_image"
+    )
     result = event_bll.get_task_events(
         company_id, task_id,
         event_type="training_debug_image",
         sort=[{"iter": {"order": "desc"}}],
         last_iter_count=iters,
-        scroll_id=scroll_id
+        scroll_id=scroll_id,
+        only_fields=call.data.get("only_fields"),
+        **since
     )
 
     return_events = result.events
@@ -456,6 +696,22 @@ def get_debug_images(call, company_id, req_model):
         returned=len(return_events),
         total=result.total_events,
         scroll_id=result.next_scroll_id,
+        **watermark
+    )
+
+
+@endpoint("events.get_debug_images_for_iteration", required_fields=["task"])
+def get_debug_images_for_iteration(call, company_id, req_model):
+    task_id = call.data["task"]
+    task_bll.assert_exists_cached(call.identity.company, task_id, allow_public=True)
+    call.result.data = dict(
+        task=task_id,
+        **event_bll.get_debug_images_for_iteration(
+            company_id,
+            task_id,
+            iteration=call.data.get("iteration"),
+            navigate=call.data.get("navigate"),
+        )
     )
 
 
@@ -469,6 +725,42 @@ def delete_for_task(call, company_id, req_model):
     )
 
 
+def _get_grouping_only_fields(call):
+    """
+    Return the requested event fields projection extended with the fields by which
+    the returned events are grouped
+    """
+    only_fields = call.data.get("only_fields")
+    if only_fields and any(not f.startswith("-") for f in only_fields):
+        only_fields = list(only_fields) + [
+            f for f in ("task", "iter", "metric", "variant") if f not in only_fields
+        ]
+    return only_fields
+
+
+def _get_last_iters_events(
+    company_id, task_ids, event_type, iters, scroll_id=None, only_fields=None
+):
+    """
+    Return the events of the last iterations of every metric/variant de-duplicated by ES.
+    Scrolls started by previous versions (over the latest 10K events by iteration) are continued,
+    their events are grouped by unique metric+variant by the caller
+    """
+    if scroll_id:
+        return event_bll.get_task_events(
+            company_id,
+            task_ids,
+            event_type=event_type,
+            sort=[{"iter": {"order": "desc"}}],
+            size=10000,
+            scroll_id=scroll_id,
+            only_fields=only_fields,
+        )
+    return event_bll.get_last_iters_events(
+        company_id, task_ids, event_type, iters, only_fields=only_fields
+    )
+
+
 def _get_top_iter_unique_events_per_task(events, max_iters, tasks):
     key = itemgetter('metric', 'variant', 'task', 'iter')
 
@@ -30,6 +30,7 @@ from bll.task import (
     ChangeStatusRequest,
     update_project_time,
     split_by,
+    task_existence_cache,
 )
 from database.errors import translate_errors_context
 from database.model.model import Model
@@ -281,6 +282,9 @@ def create(call: APICall, company_id, req_model: CreateRequest):
         task.save()
         update_project_time(task.project)
 
+    # the task ID may have been cached as missing by an early events report
+    task_existence_cache.invalidate([task.id])
+
     call.result.data = {"id": task.id}
 
 
@@ -297,6 +301,17 @@ def prepare_update_fields(task, call_data):
     return fields, valid_fields
 
 
+def _update_moved_task(company_id, task_id, fields: dict):
+    """
+    Invalidate the task existence cache for tasks moved to a different project or (un)archived,
+    and move the task metrics catalog entries to the task's new project
+    """
+    if "project" in fields or "tags" in fields:
+        task_existence_cache.invalidate([task_id])
+    if "project" in fields:
+        TaskBLL.update_metrics_catalog_project(company_id, [task_id], fields["project"])
+
+
 @endpoint(
     "tasks.update", request_data_model=UpdateRequest, response_data_model=UpdateResponse
 )
@@ -321,6 +336,7 @@ def update(call: APICall, company_id, req_model: UpdateRequest):
         )
 
         update_project_time(updated_fields.get("project"))
+        _update_moved_task(company_id, task_id, updated_fields)
 
         return UpdateResponse(updated=updated_count, fields=updated_fields)
 
@@ -390,6 +406,7 @@ def update_batch(call: APICall):
         if bulk_ops:
             res = Task._get_collection().bulk_write(bulk_ops)
             updated = res.modified_count
+            task_existence_cache.invalidate(tasks)
 
         call.result.data = {"updated": updated}
 
@@ -446,6 +463,7 @@ def edit(call: APICall, company_id, req_model: UpdateRequest):
             fixed_fields.update(last_update=now)
             updated = task.update(upsert=False, **fixed_fields)
             update_project_time(fields.get("project"))
+            _update_moved_task(company_id, task_id, fields)
             call.result.data_model = UpdateResponse(updated=updated, fields=fields)
         else:
             call.result.data_model = UpdateResponse(updated=0)
@@ -491,6 +509,8 @@ def reset(call: APICall, company_id, req_model: UpdateRequest):
     for key, value in api_results.items():
         setattr(res, key, value)
 
+    task_existence_cache.invalidate([task.id])
+
     call.result.data_model = res
 
 
@@ -660,6 +680,7 @@ def delete(call: APICall, company_id, req_model: DeleteRequest):
             task.switch_collection(collection_name)
 
         task.delete()
+        task_existence_cache.invalidate([task.id])
 
         call.result.data = dict(deleted=True, **attr.asdict(result))
 
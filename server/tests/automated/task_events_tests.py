@@ -1,16 +1,28 @@
 """
 Comprehensive test of all(?) use cases of datasets and frames
 """
+import base64
 import json
+import time
 import unittest
+from array import array
 
 import es_factory
 from config import config
+from tests.api_client import APIClient
 from tests.automated import TestService
 
 log = config.logger(__file__)
 
 
+def encode_column(values, typecode="d"):
+    return base64.b64encode(array(typecode, values).tobytes()).decode()
+
+
+def decode_column(data, typecode="d"):
+    return list(array(typecode, base64.b64decode(data)))
+
+
 class TestDatasetsService(TestService):
 
     def setUp(self, version="1.0"):
@@ -47,6 +59,57 @@ class TestDatasetsService(TestService):
         obj.update(new_data)
         return obj
 
+    def create_task_events(self, type, iters, fields=None):
+        """
+        Return task events of the given type for the iterations
+        :param fields: a function returning additional event fields for an iteration
+        """
+        return [
+            self.copy_and_update(
+                self.create_task_event(type, iteration=iter), fields(iter) if fields else {}
+            )
+            for iter in iters
+        ]
+
+    def create_scalar_events(self, iters, metric="loss", variant="total"):
+        """ Return scalar events of the metric/variant for the iterations, valued with the iteration """
+        return self.create_task_events(
+            "training_stats_scalar",
+            iters,
+            lambda iter: {"metric": metric, "variant": variant, "value": iter},
+        )
+
+    def create_log_events(self, iters):
+        """ Return log events for the iterations, with increasing timestamps """
+        return self.create_task_events(
+            "log", iters, lambda iter: {"msg": f"line {iter}", "timestamp": 1000 + iter}
+        )
+
+    def create_image_events(self, iters, variant="input", metric="samples"):
+        return self.create_task_events(
+            "training_debug_image",
+            iters,
+            lambda iter: {
+                "metric": metric,
+                "variant": variant,
+                "url": f"http://images/{variant}/{iter}.png",
+            },
+        )
+
+    def wait_for(self, func, timeout_sec=5, interval_sec=0.1):
+        """
+        Call func until it returns a true value and return it. Used for results written behind,
+        like the task statistics and asynchronous ingestion
+        """
+        deadline = time.time() + timeout_sec
+        while True:
+            res = func()
+            if res or time.time() > deadline:
+                break
+            time.sleep(interval_sec)
+        assert res, f"timed out waiting for {func}"
+        return res
+
     def test_task_logs(self):
         events = []
         for iter in range(10):
@@ -55,7 +118,6 @@ class TestDatasetsService(TestService):
                 "msg": "This is a log message from test task iter " + str(iter)
             }))
             # sleep so timestamp is not the same
-            import time
             time.sleep(0.01)
         self.send_batch(events)
 
@@ -66,6 +128,190 @@ class TestDatasetsService(TestService):
         data = self.api.events.get_task_log(task=self.task_id)
         assert len(data["events"]) == 0
 
+    def test_task_log_paging(self):
+        self.send_batch(self.create_log_events(range(25)))
+
+        msgs = []
+        scroll_id = None
+        for _ in range(3):
+            data = self.api.events.get_task_log(
+                task=self.task_id, order="asc", batch_size=10, scroll_id=scroll_id
+            )
+            assert data.total == 25
+            msgs.extend(ev.msg for ev in data.events)
+            scroll_id = data.scroll_id
+        assert msgs == [f"line {i}" for i in range(25)]
+
+    def test_task_log_tail(self):
+        self.send_batch(self.create_log_events(range(5)))
+        data = self.api.events.get_task_log_tail(task=self.task_id, batch_size=3)
+        assert [ev.msg for ev in data.events] == ["line 2", "line 3", "line 4"]
+
+        cursor = data.cursor
+        data = self.api.events.get_task_log_tail(task=self.task_id, cursor=cursor, timeout_sec=0.1)
+        assert data.events == []
+        assert data.cursor == cursor
+
+        self.send_batch(self.create_log_events(range(5, 7)))
+        data = self.api.events.get_task_log_tail(task=self.task_id, cursor=cursor, timeout_sec=1)
+        assert [ev.msg for ev in data.events] == ["line 5", "line 6"]
+
+    def test_task_logs_async(self):
+        events = self.create_task_events(
+            "log",
+            range(10),
+            lambda iter: {"msg": f"This is an async log message from test task iter {iter}"},
+        )
+        _, data = self.api.send_batch(
+            'events.add_batch', events, headers_overrides={"X-Trains-Async": "1"}
+        )
+        ticket = data["ticket"]
+
+        def get_processed_status():
+            status = self.api.events.get_ingestion_status(ticket=ticket)
+            return status if status["status"] != "queued" else None
+
+        status = self.wait_for(get_processed_status)
+        assert status["status"] == "completed"
+        assert status["added"] == 10
+
+        data = self.api.events.get_task_log(task=self.task_id)
+        assert len(data["events"]) == 10
+
+    def test_task_scalars_columnar(self):
+        values = [0.5, 1.5, 2.5]
+        data = self.api.events.add_scalars(
+            task=self.task_id,
+            metric="loss",
+            variant="total",
+            iter=[0, 1, 2],
+            values=encode_column(values),
+        )
+        assert data["added"] == 3
+
+        data = self.api.events.get_task_events(task=self.task_id)
+        assert sorted(ev["value"] for ev in data["events"]) == values
+
+        # task statistics are written behind
+        self.wait_for(
+            lambda: self.api.tasks.get_by_id(task=self.task_id).task.last_iteration == 2
+        )
+
+    def test_task_scalars_encoded(self):
+        self.send_batch(
+            self.create_scalar_events(range(3), variant="train")
+            + self.create_scalar_events(range(3), variant="val")
+        )
+
+        data = self.api.events.scalar_metrics_iter_histogram(task=self.task_id, encoding="float32")
+        assert data.encoding == "float32"
+        train, val = data.metrics["loss"]["train"], data.metrics["loss"]["val"]
+        assert train.x_axis == val.x_axis
+
+        x = decode_column(data.axes[train.x_axis], "d")
+        y = decode_column(train.y, "f")
+        assert x == y == [0, 1, 2]
+
+    def test_task_scalars_incremental(self):
+        self.send_batch(self.create_scalar_events(range(5)))
+        data = self.api.events.scalar_metrics_iter_histogram(task=self.task_id, since_iter=0)
+        assert data.metrics["loss"]["total"]["x"] == list(range(5))
+        assert data.last_iter == 4
+
+        self.send_batch(self.create_scalar_events(range(5, 8)))
+        data = self.api.events.scalar_metrics_iter_histogram(
+            task=self.task_id, since_iter=data.last_iter
+        )
+        assert data.metrics["loss"]["total"]["x"] == [4, 5, 6, 7]
+        assert data.last_iter == 7
+
+    def test_task_events_only_fields(self):
+        self.send_batch(self.create_image_events(range(3)))
+
+        data = self.api.events.get_task_events(task=self.task_id, only_fields=["iter", "url"])
+        assert len(data["events"]) == 3
+        assert all(set(ev) == {"iter", "url"} for ev in data["events"])
+
+    def test_task_summary(self):
+        self.send_batch(self.create_scalar_events(range(3)) + self.create_image_events([2]))
+
+        data = self.api.events.get_task_summary(task=self.task_id)
+        scalar = data.scalars[0]
+        assert scalar.name == "loss"
+        assert scalar.variants[0].count == 3
+        assert scalar.variants[0].last_iter == 2
+        assert scalar.variants[0].last_value == 2
+        assert data.images[0].variants[0].url == "http://images/input/2.png"
+        assert data.plots == []
+
+    def test_task_latest_scalar_values_unversioned(self):
+        self.send_batch(self.create_scalar_events(range(3)))
+
+        # unversioned calls get the latest endpoint version, which keeps the previous version fields
+        api = APIClient(base_url="http://localhost:8008")
+        data = self.wait_for(
+            lambda: api.events.get_task_latest_scalar_values(task=self.task_id).metrics
+        )
+        variant = data[0].variants[0]
+        assert variant.name == "total"
+        assert variant.last_value == variant.last_10_value == 2
+        assert (variant.min_value, variant.max_value) == (0, 2)
+
+    def test_task_metrics_catalog(self):
+        self.send_batch(
+            self.create_scalar_events([0], variant="train")
+            + self.create_scalar_events([0], variant="val")
+        )
+
+        # task statistics are written behind
+        data = self.wait_for(
+            lambda: self.api.events.get_scalar_metrics_and_variants(
+                task=self.task_id
+            ).metrics
+        )
+        assert data == {"loss": ["train", "val"]}
+
+        self.api.tasks.reset(task=self.task_id)
+        data = self.api.events.get_scalar_metrics_and_variants(task=self.task_id)
+        assert data.metrics == {}
+
+    def test_debug_images_for_iteration(self):
+        self.send_batch(
+            self.create_image_events([0, 2, 4], variant="input")
+            + self.create_image_events([0, 4], variant="output")
+        )
+
+        # the debug images grid is written behind
+        def get_grid():
+            res = self.api.events.get_debug_images_for_iteration(task=self.task_id)
+            return res if res.images else None
+
+        data = self.wait_for(get_grid)
+        assert data.iteration == 4
+        assert [img.iter for img in data.images] == [4, 4]
+
+        data = self.api.events.get_debug_images_for_iteration(
+            task=self.task_id, iteration=4, navigate="previous"
+        )
+        assert data.iteration == 2
+        assert [(img.variant, img.iter) for img in data.images] == [("input", 2), ("output", 0)]
+
+        # an image re-sent for an iteration replaces the previous one
+        event = self.copy_and_update(
+            self.create_task_event("training_debug_image", iteration=2),
+            {"metric": "samples", "variant": "input", "url": "http://images/input/2-new.png"},
+        )
+        self.send(event)
+
+        def get_input_images():
+            res = self.api.events.get_debug_images_for_iteration(
+                task=self.task_id, iteration=2
+            )
+            urls = [img.url for img in res.images if img.variant == "input"]
+            return urls if urls != ["http://images/input/2.png"] else None
+
+        assert self.wait_for(get_input_images) == ["http://images/input/2-new.png"]
+
     def test_task_plots(self):
         event = self.create_task_event("plot", 0)
         event["metric"] = "roc"
@@ -0,0 +1,78 @@
+import base64
+import math
+import unittest
+from array import array
+
+from apierrors import errors
+from bll.event.columnar import (
+    decode_float64_column,
+    decode_int_column,
+    encode_column,
+    encode_series,
+)
+
+
+class TestColumnar(unittest.TestCase):
+    def test_float64_round_trip(self):
+        values = [0.0, -1.5, 1e-300, 1.7976931348623157e308, 0.1, float("inf")]
+        decoded = decode_float64_column("y", encode_column(values))
+        assert list(decoded) == values
+
+    def test_float32_encoding(self):
+        values = [0.0, -1.5, 0.1, 3e38]
+        encoded = encode_column(values, "float32")
+        assert len(base64.b64decode(encoded)) == 4 * len(values)
+        decoded = array("f")
+        decoded.frombytes(base64.b64decode(encoded))
+        assert list(decoded) == list(array("f", values))
+        assert decoded[2] != 0.1 and math.isclose(decoded[2], 0.1, rel_tol=1e-7)
+
+    def test_nan(self):
+        for encoding, typecode in (("float64", "d"), ("float32", "f")):
+            decoded = array(typecode)
+            decoded.frombytes(base64.b64decode(encode_column([1.0, float("nan")], encoding)))
+            assert decoded[0] == 1.0 and math.isnan(decoded[1])
+        decoded = decode_float64_column("y", encode_column([float("nan")]))
+        assert math.isnan(decoded[0])
+
+    def test_decode_json_array(self):
+        assert decode_float64_column("y", [1, 2.5]) == [1, 2.5]
+        with self.assertRaises(errors.bad_request.FieldsValueError):
+            decode_float64_column("y", [1, "2"])
+        with self.assertRaises(errors.bad_request.FieldsValueError):
+            decode_float64_column("y", [True])
+        with self.assertRaises(errors.bad_request.FieldsValueError):
+            decode_float64_column("y", 1.0)
+
+    def test_decode_invalid_buffer(self):
+        with self.assertRaises(errors.bad_request.FieldsValueError):
+            decode_float64_column("y", "not base64!")
+        with self.assertRaises(errors.bad_request.FieldsValueError):
+            decode_float64_column("y", base64.b64encode(b"1234").decode())
+
+    def test_decode_int_column(self):
+        assert decode_int_column("iter", encode_column([1, 2, 3])) == [1, 2, 3]
+        with self.assertRaises(errors.bad_request.FieldsValueError):
+            decode_int_column("iter", encode_column([1.5]))
+
+    def test_encode_series(self):
+        metrics = {
+            "m": {
+                "v1": {"x": [1, 2], "y": [0.5, 1.5], "name": "v1"},
+                "v2": {"x": [1, 2], "y": [2.5, 3.5], "name": "v2"},
+                "v3": {"x": [1, 3], "y": [4.5, 5.5], "name": "v3"},
+            }
+        }
+        res = encode_series(metrics, "float32")
+        assert res["encoding"] == "float32"
+        series = res["metrics"]["m"]
+        assert series["v1"]["x_axis"] == series["v2"]["x_axis"] != series["v3"]["x_axis"]
+        assert len(res["axes"]) == 2
+        assert list(
+            decode_float64_column("x", res["axes"][series["v3"]["x_axis"]])
+        ) == [1.0, 3.0]
+        assert series["v2"]["name"] == "v2" and "x" not in series["v2"]
+
+
+if __name__ == "__main__":
+    unittest.main()
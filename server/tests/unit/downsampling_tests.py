@@ -0,0 +1,54 @@
+import unittest
+
+from bll.event.downsampling import downsample_metrics, downsample_min_max
+
+
+class TestDownsampling(unittest.TestCase):
+    def test_short_series_unchanged(self):
+        x, y = [1, 2, 3], [0.5, 0.1, 0.3]
+        assert downsample_min_max(x, y, 3) == (x, y)
+        assert downsample_min_max(x, y, 0) == (x, y)
+        assert downsample_min_max(x, y, None) == (x, y)
+
+    def test_few_points(self):
+        x, y = list(range(10)), [float(i) for i in range(10)]
+        assert downsample_min_max(x, y, 2) == ([0, 9], [0.0, 9.0])
+        assert downsample_min_max(x, y, 1) == ([0], [0.0])
+
+    def test_min_max_kept(self):
+        x = list(range(1000))
+        y = [float(i % 100) for i in x]
+        y[500] = 1000.0
+        y[700] = -1000.0
+        new_x, new_y = downsample_min_max(x, y, 50)
+        assert len(new_x) <= 50
+        assert new_x == sorted(new_x)
+        assert (new_x[0], new_y[0]) == (0, 0.0)
+        assert (new_x[-1], new_y[-1]) == (999, 99.0)
+        assert max(new_y) == 1000.0 and new_x[new_y.index(1000.0)] == 500
+        assert min(new_y) == -1000.0 and new_x[new_y.index(-1000.0)] == 700
+        assert all(y[i] == v for i, v in zip(new_x, new_y))
+
+    def test_sparse_iterations(self):
+        # iterations are bucketed by their value and not by their position
+        x = list(range(100)) + [10000]
+        y = [1.0] * 100 + [5.0]
+        new_x, new_y = downsample_min_max(x, y, 10)
+        assert new_x[-1] == 10000 and new_y[-1] == 5.0
+        assert len(new_x) <= 4
+
+    def test_downsample_metrics(self):
+        metrics = {
+            "m": {
+                "v1": {"x": list(range(100)), "y": [float(i) for i in range(100)]},
+                "v2": {"x": [1, 2], "y": [1.0, 2.0]},
+            }
+        }
+        res = downsample_metrics(metrics, 10)
+        assert res is metrics
+        assert len(metrics["m"]["v1"]["x"]) <= 10
+        assert metrics["m"]["v2"] == {"x": [1, 2], "y": [1.0, 2.0]}
+
+
+if __name__ == "__main__":
+    unittest.main()
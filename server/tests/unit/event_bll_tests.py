@@ -0,0 +1,371 @@
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from apierrors import errors
+from bll.event import EventBLL
+from database.model.task.metrics import MetricEvent, MetricValue
+from database.model.task.task import Task
+
+
+class TestLastIters(unittest.TestCase):
+    def setUp(self):
+        self.es = mock.Mock()
+        self.event_bll = EventBLL(events_es=self.es)
+
+    def test_last_iters_per_task(self):
+        self.es.search.return_value = {
+            "aggregations": {
+                "tasks": {
+                    "buckets": [
+                        {"key": "t1", "iters": {"buckets": [{"key": 9}, {"key": 8}]}},
+                        {"key": "t2", "iters": {"buckets": [{"key": 3}]}},
+                        {"key": "t3", "iters": {"buckets": []}},
+                    ]
+                }
+            }
+        }
+        res = self.event_bll._get_last_iters_per_task(
+            "events-*-c", ["t1", "t2", "t3", "t4"], "training_debug_image", 2
+        )
+        assert res == {"t1": [9, 8], "t2": [3]}
+
+        # a single search routed to all the tasks
+        self.es.search.assert_called_once()
+        kwargs = self.es.search.call_args[1]
+        assert kwargs["index"] == "events-*-c"
+        assert kwargs["routing"] == "t1,t2,t3,t4"
+        body = kwargs["body"]
+        assert body["size"] == 0
+        assert body["query"]["bool"]["must"] == [
+            {"terms": {"task": ["t1", "t2", "t3", "t4"]}},
+            {"term": {"type": "training_debug_image"}},
+        ]
+        tasks_agg = body["aggs"]["tasks"]
+        assert tasks_agg["terms"] == {"field": "task", "size": 4}
+        assert tasks_agg["aggs"]["iters"]["terms"] == {
+            "field": "iter",
+            "size": 2,
+            "order": {"_term": "desc"},
+        }
+
+    def test_last_iters_any_type(self):
+        self.es.search.return_value = {}
+        assert self.event_bll._get_last_iters_per_task("events-*-c", ["t1"], "*", 1) == {}
+        body = self.es.search.call_args[1]["body"]
+        assert body["query"]["bool"]["must"] == [{"terms": {"task": ["t1"]}}]
+
+    def test_get_last_iters(self):
+        self.es.indices.exists.return_value = True
+        self.es.search.return_value = {
+            "aggregations": {
+                "tasks": {"buckets": [{"key": "t1", "iters": {"buckets": [{"key": 5}]}}]}
+            }
+        }
+        assert self.event_bll.get_last_iters("events-*-c", "t1", None, 1) == [5]
+        self.es.indices.exists.return_value = False
+        assert self.event_bll.get_last_iters("events-log-d", "t1", None, 1) == []
+
+
+
+class TestLastItersEvents(unittest.TestCase):
+    def setUp(self):
+        self.es = mock.Mock()
+        self.es.indices.exists.return_value = True
+        self.event_bll = EventBLL(events_es=self.es)
+
+    @staticmethod
+    def _collapsed(*groups, total=None, missing=0):
+        """ A collapsed search result, with the inner hits of every metric/variant group """
+        return {
+            "hits": {
+                "total": total if total is not None else sum(len(g) for g in groups),
+                "hits": [
+                    {"inner_hits": {"last_iters": {"hits": {"hits": [{"_source": e} for e in group]}}}}
+                    for group in groups
+                ],
+            },
+            "aggregations": {"not_indexed": {"doc_count": missing}},
+        }
+
+    def test_events_of_last_iters(self):
+        self.es.msearch.return_value = {
+            "responses": [
+                self._collapsed(
+                    [
+                        dict(task="t1", iter=7, metric="a", variant="x"),
+                        dict(task="t1", iter=5, metric="a", variant="x"),
+                    ],
+                    # a variant that was not reported in the task's last iterations is still returned
+                    [
+                        dict(task="t1", iter=2, metric="b", variant="x"),
+                        dict(task="t1", iter=1, metric="b", variant="x"),
+                    ],
+                    total=10,
+                ),
+                self._collapsed([dict(task="t2", iter=3, metric="a", variant="x")]),
+            ]
+        }
+        res = self.event_bll.get_last_iters_events(
+            "c", ["t1", "t2"], "plot", 2, only_fields=["iter", "metric"]
+        )
+        assert [(e["task"], e["metric"], e["iter"]) for e in res.events] == [
+            ("t1", "a", 7),
+            ("t1", "a", 5),
+            ("t2", "a", 3),
+            ("t1", "b", 2),
+            ("t1", "b", 1),
+        ]
+        assert res.total_events == 11
+
+        # a collapsed search per task, routed to the task shard
+        body = self.es.msearch.call_args[1]["body"]
+        headers, requests = body[::2], body[1::2]
+        assert [h["routing"] for h in headers] == ["t1", "t2"]
+        request = requests[0]
+        assert request["query"] == {"term": {"task": "t1"}}
+        assert request["_source"] is False
+        assert request["collapse"] == {
+            "field": "metric_variant",
+            "inner_hits": {
+                "name": "last_iters",
+                "size": 2,
+                "sort": [{"iter": {"order": "desc"}}],
+                "_source": {"includes": ["iter", "metric", "lines.iter"]},
+            },
+        }
+        assert not self.es.search.called
+
+    def test_not_indexed_events(self):
+        # tasks with events lacking metric_variant fall back to the latest events by iteration
+        self.es.msearch.return_value = {"responses": [self._collapsed(missing=1)]}
+        self.es.search.return_value = {
+            "hits": {
+                "total": 1,
+                "hits": [
+                    {
+                        "_source": dict(task="t1", iter=4, metric="a", variant="x"),
+                        "sort": [4, "event#a"],
+                    }
+                ],
+            }
+        }
+        res = self.event_bll.get_last_iters_events("c", ["t1"], "plot", 2)
+        assert [e["iter"] for e in res.events] == [4]
+        assert res.total_events == 1
+
+    def test_no_events(self):
+        self.es.msearch.return_value = {"responses": [self._collapsed()]}
+        res = self.event_bll.get_last_iters_events("c", ["t1"], "plot", 2)
+        assert res.events == [] and res.total_events == 0
+
+
+class TestAddEvents(unittest.TestCase):
+    def setUp(self):
+        self.es = mock.Mock()
+        self.event_bll = EventBLL(events_es=self.es)
+        self.event_bll.bulk_chunk_size = 2
+        self.event_bll.index_catalog = mock.Mock()
+        self.bulk_actions = []
+
+        def streaming_bulk(es, actions, **kwargs):
+            for action in actions:
+                self.bulk_actions.append(action)
+                yield True, {}
+
+        patches = [
+            mock.patch("bll.event.event_bll.helpers.streaming_bulk", streaming_bulk),
+            mock.patch("bll.event.event_bll.TaskBLL.assert_exists_cached"),
+            mock.patch("bll.event.event_bll.log_tail_notifier"),
+        ]
+        self.aggregator = mock.patch("bll.event.event_bll.task_stats_aggregator").start()
+        for patch in patches:
+            patch.start()
+        self.addCleanup(mock.patch.stopall)
+
+    @staticmethod
+    def _scalar(task, iteration):
+        return dict(
+            type="training_stats_scalar",
+            task=task,
+            iter=iteration,
+            metric="loss",
+            variant="total",
+            value=1.0,
+        )
+
+    def test_invalid_event_after_written_chunks(self):
+        events = [
+            self._scalar("t1", 1),
+            self._scalar("t1", 2),
+            self._scalar("t2", 3),
+            dict(type="invalid", task="t2"),
+        ]
+        with self.assertRaises(errors.BadRequest):
+            self.event_bll.add_events("c", events, "w")
+
+        # the first chunk was written and its task statistics are still updated
+        assert [a["_source"]["iter"] for a in self.bulk_actions] == [1, 2]
+        (call,) = self.aggregator.add.call_args_list
+        assert call[1]["task_id"] == "t1"
+        assert call[1]["last_iteration"] == 2
+        assert set(call[1]["metric_catalog"]) == {("training_stats_scalar", "loss", "total")}
+        self.event_bll.index_catalog.index_written.assert_called_once_with(
+            "events-training_stats_scalar-c"
+        )
+
+    def test_plots_of_unknown_task_not_offloaded(self):
+        self.event_bll.plot_store = mock.Mock()
+        plot = dict(type="plot", task="t1", iter=1, metric="m", variant="v", plot_str="{}")
+        with mock.patch(
+            "bll.event.event_bll.TaskBLL.assert_exists_cached",
+            side_effect=errors.bad_request.InvalidTaskId(),
+        ):
+            with self.assertRaises(errors.bad_request.InvalidTaskId):
+                self.event_bll.add_events("c", [plot], "w")
+        assert not self.event_bll.plot_store.offload.called
+
+        self.event_bll.add_events("c", [plot, dict(plot, task=None)], "w")
+        self.event_bll.plot_store.offload.assert_called_once()
+
+    def test_tasks_verified_per_chunk(self):
+        events = [self._scalar(task, 1) for task in ("t1", "t2", "t1", "t3", "t2")]
+        with mock.patch("bll.event.event_bll.TaskBLL.assert_exists_cached") as verify:
+            self.event_bll.add_events("c", events, "w")
+        # a single lookup for the new tasks of every chunk
+        assert [call[0] for call in verify.call_args_list] == [
+            ("c", {"t1", "t2"}),
+            ("c", {"t3"}),
+        ]
+
+    def test_all_written(self):
+        events = [self._scalar("t1", 1), self._scalar("t2", 5), self._scalar("t1", 3)]
+        added, errors_in_bulk = self.event_bll.add_events("c", events, "w")
+        assert (added, errors_in_bulk) == (3, [])
+        iterations = {
+            call[1]["task_id"]: call[1]["last_iteration"]
+            for call in self.aggregator.add.call_args_list
+        }
+        assert iterations == {"t1": 3, "t2": 5}
+
+
+class TestScalarValuesSummary(unittest.TestCase):
+    def test_summary(self):
+        event = MetricEvent(
+            metric="loss",
+            variant="total",
+            type="training_stats_scalar",
+            timestamp=datetime.utcfromtimestamp(10),
+            iter=5,
+            value=4.0,
+            min_value=1.0,
+            max_value=8.0,
+            last_values=[MetricValue(iter=i, value=float(i)) for i in (3, 4, 5)],
+        )
+        task = Task(last_metrics={"m": {"v": event}})
+        metrics, last_timestamp = EventBLL.get_task_scalar_values_summary(task)
+        assert last_timestamp == 10000
+        (metric,) = metrics
+        assert metric["name"] == "loss"
+        (variant,) = metric["variants"]
+        # a superset of the version 2.1 response, which unversioned calls used to get
+        assert variant == dict(
+            name="total",
+            last_value=4.0,
+            last_10_value=4.0,
+            last_10_average=4.0,
+            min_value=1.0,
+            max_value=8.0,
+            last_iter=5,
+        )
+
+
+def _evaluate(expr, doc: dict, variables: dict = None):
+    """ Evaluate the aggregation expressions used on the debug images arrays """
+    variables = variables or {}
+    if isinstance(expr, str) and expr.startswith("$"):
+        name, *path = expr.lstrip("$").split(".")
+        value = variables[name] if expr.startswith("$$") else doc.get(name)
+        for field in path:
+            value = (
+                [v[field] for v in value] if isinstance(value, list) else value[field]
+            )
+        return value
+    if not isinstance(expr, dict):
+        return expr
+    (op, args), = expr.items()
+    if op == "$arrayElemAt":
+        array, index = (_evaluate(a, doc, variables) for a in args)
+        return array[index] if -len(array) <= index < len(array) else None
+    if op == "$filter":
+        return [
+            item
+            for item in _evaluate(args["input"], doc, variables)
+            if _evaluate(args["cond"], doc, {**variables, args["as"]: item})
+        ]
+    compare = {"$gt": "__gt__", "$lt": "__lt__", "$lte": "__le__"}[op]
+    left, right = (_evaluate(a, doc, variables) for a in args)
+    return getattr(left, compare)(right)
+
+
+class TestDebugImagesForIteration(unittest.TestCase):
+    def setUp(self):
+        self.event_bll = EventBLL(events_es=mock.Mock())
+        self.entries = [
+            dict(
+                metric="samples",
+                variant="output",
+                images=[dict(iter=0, url="o0"), dict(iter=4, url="o4")],
+            ),
+            dict(
+                metric="samples",
+                variant="input",
+                images=[dict(iter=i, url=f"i{i}") for i in (0, 2, 4)],
+            ),
+        ]
+
+        def aggregate(company_id, task_id, **projection):
+            return [
+                dict(
+                    metric=entry["metric"],
+                    variant=entry["variant"],
+                    **{k: _evaluate(v, entry) for k, v in projection.items()},
+                )
+                for entry in self.entries
+            ]
+
+        patch = mock.patch.object(EventBLL, "_aggregate_task_images", side_effect=aggregate)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def get_images(self, iteration=None, navigate=None):
+        res = self.event_bll.get_debug_images_for_iteration(
+            "c", "t1", iteration=iteration, navigate=navigate
+        )
+        return res["iteration"], [(i["variant"], i["iter"], i["url"]) for i in res["images"]]
+
+    def test_last_iteration(self):
+        res = self.event_bll.get_debug_images_for_iteration("c", "t1")
+        assert (res["min_iteration"], res["max_iteration"]) == (0, 4)
+        assert self.get_images() == (4, [("input", 4, "i4"), ("output", 4, "o4")])
+
+    def test_iteration(self):
+        assert self.get_images(3) == (3, [("input", 2, "i2"), ("output", 0, "o0")])
+
+    def test_navigate(self):
+        assert self.get_images(4, "previous") == (
+            2,
+            [("input", 2, "i2"), ("output", 0, "o0")],
+        )
+        assert self.get_images(2, "next")[0] == 4
+        assert self.get_images(0, "previous") == (None, [])
+        assert self.get_images(navigate="next") == (None, [])
+
+    def test_no_images(self):
+        self.entries = [dict(metric="samples", variant="input", images=[])]
+        res = self.event_bll.get_debug_images_for_iteration("c", "t1")
+        assert res == dict(iteration=None, min_iteration=None, max_iteration=None, images=[])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,184 @@
+import argparse
+import time
+import unittest
+from unittest import mock
+
+from bll.event import EventBLL
+from bll.event.event_bll import EventsBatchStats
+from bll.event.index_rollover import WriteAliases, get_read_index, get_write_index
+from elastic.events_maintenance import EventsMaintenance, parse_age, parse_size
+
+
+def _rollover(enabled: bool):
+    return mock.patch("bll.event.index_rollover.rollover_enabled", return_value=enabled)
+
+
+class TestIndexNames(unittest.TestCase):
+    def test_disabled(self):
+        with _rollover(False):
+            assert get_read_index("events-log-c") == "events-log-c"
+            assert get_write_index("events-log-c") == "events-log-c"
+            assert EventBLL.get_index_name("c", "log") == "events-log-c"
+            assert EventBLL.get_write_index_name("c", "log") == "events-log-c"
+
+    def test_enabled(self):
+        with _rollover(True):
+            assert get_read_index("events-log-c") == "events-log-c*"
+            assert get_write_index("events-log-c") == "events-log-c-write"
+            assert EventBLL.get_index_name("c", "log") == "events-log-c*"
+            assert EventBLL.get_write_index_name("c", "log") == "events-log-c-write"
+            assert (
+                EventBLL.get_search_index_name("c", "*")
+                == "events-*-c*,-events-training_stats_scalar_rollup-c"
+            )
+
+    def test_rollup_not_rolled_over(self):
+        with _rollover(True):
+            for name in (EventBLL.get_index_name, EventBLL.get_write_index_name):
+                assert (
+                    name("c", "training_stats_scalar_rollup")
+                    == "events-training_stats_scalar_rollup-c"
+                )
+
+
+class TestWriteAliases(unittest.TestCase):
+    def setUp(self):
+        self.es = mock.Mock()
+        self.aliases = WriteAliases(self.es)
+
+    def test_not_alias(self):
+        self.aliases.ensure("events-log-c")
+        assert not self.es.indices.exists_alias.called
+        assert not self.es.indices.create.called
+
+    def test_create(self):
+        self.es.indices.exists_alias.return_value = False
+        self.aliases.ensure("events-log-c-write")
+        self.es.indices.create.assert_called_once_with(
+            index="events-log-c-000001",
+            body={"aliases": {"events-log-c-write": {}}},
+            ignore=400,
+        )
+
+        # known aliases are not checked again
+        self.aliases.ensure("events-log-c-write")
+        assert self.es.indices.exists_alias.call_count == 1
+
+    def test_existing(self):
+        self.es.indices.exists_alias.return_value = True
+        self.aliases.ensure("events-log-c-write")
+        assert not self.es.indices.create.called
+
+
+class TestReportedAgain(unittest.TestCase):
+    """
+    Events are overwritten by ID only within the index they are written to. An event reported again
+    after its index was rolled over is written to the new index, and both copies are read
+    """
+
+    def test_same_id_written_to_alias(self):
+        event_bll = EventBLL(events_es=mock.Mock())
+
+        def actions():
+            event = dict(
+                type="training_stats_scalar",
+                task="t1",
+                iter=1,
+                metric="loss",
+                variant="total",
+                value=1.0,
+            )
+            return list(
+                event_bll._iter_actions("c", [event], "w", EventsBatchStats())
+            )
+
+        with _rollover(True), mock.patch(
+            "bll.event.event_bll.TaskBLL.assert_exists_cached"
+        ):
+            (first,) = actions()
+            (second,) = actions()
+
+        assert first["_op_type"] == second["_op_type"] == "index"
+        assert first["_id"] == second["_id"]
+        # the write alias resolves to the current rollover index at the time of every write
+        assert first["_index"] == second["_index"] == "events-training_stats_scalar-c-write"
+
+
+class TestEventsMaintenance(unittest.TestCase):
+    def setUp(self):
+        self.requests = []
+        self.responses = {}
+        self.maintenance = EventsMaintenance("http://es:9200/")
+        self.maintenance._request = self._request
+
+    def _request(self, method, path, params=None, body=None):
+        self.requests.append((method, path, params, body))
+        return self.responses.get((method, path), {})
+
+    def test_parse(self):
+        assert parse_size("10") == 10
+        assert parse_size("2kb") == 2048
+        assert parse_size("50GB") == 50 << 30
+        assert parse_age("7d") == "7d"
+        for parse, value in ((parse_size, "10xb"), (parse_age, "7w"), (parse_age, "d")):
+            with self.assertRaises(argparse.ArgumentTypeError):
+                parse(value)
+
+    def test_rollover(self):
+        self.responses[("GET", "_alias/events-*-write")] = {
+            "events-log-c-000001": {"aliases": {"events-log-c-write": {}}},
+            "events-plot-c-000002": {"aliases": {"events-plot-c-write": {}}},
+        }
+        for index, size in (("events-log-c-000001", 100), ("events-plot-c-000002", 10)):
+            self.responses[("GET", f"{index}/_stats/store")] = {
+                "indices": {index: {"primaries": {"store": {"size_in_bytes": size}}}}
+            }
+        self.responses[("POST", "events-log-c-write/_rollover")] = {
+            "old_index": "events-log-c-000001",
+            "new_index": "events-log-c-000002",
+            "rolled_over": True,
+        }
+
+        res = self.maintenance.rollover(max_age="7d", max_size=50)
+        assert [r["alias"] for r in res] == ["events-log-c-write", "events-plot-c-write"]
+        assert res[0]["new_index"] == "events-log-c-000002"
+        rollovers = {path: body for method, path, _, body in self.requests if method == "POST"}
+        # indices exceeding the size are rolled over unconditionally
+        assert rollovers == {
+            "events-log-c-write/_rollover": {},
+            "events-plot-c-write/_rollover": {"conditions": {"max_age": "7d"}},
+        }
+
+    def test_rollover_no_conditions(self):
+        self.responses[("GET", "_alias/events-*-write")] = {
+            "events-log-c-000001": {"aliases": {"events-log-c-write": {}}}
+        }
+        assert self.maintenance.rollover() == []
+        assert all(method == "GET" for method, *_ in self.requests)
+
+    def test_cold_indices(self):
+        self.responses[("GET", "_alias/events-*-write")] = {
+            "events-log-c-000002": {"aliases": {"events-log-c-write": {}}}
+        }
+        old = str(int((time.time() - 3 * 86400) * 1000))
+        new = str(int(time.time() * 1000))
+        self.responses[("GET", "events-*,shrink-events-*/_settings")] = {
+            "events-log-c-000001": {"settings": {"index.creation_date": old}},
+            "events-log-c-000002": {"settings": {"index.creation_date": old}},
+            "events-log-c-000003": {"settings": {"index.creation_date": new}},
+            "events-log-c": {"settings": {"index.creation_date": old}},
+        }
+        assert list(self.maintenance.get_cold_indices("1d")) == ["events-log-c-000001"]
+
+    def test_shrink_dry_run(self):
+        self.maintenance.dry_run = True
+        assert self.maintenance.shrink("events-log-c-000001", {"index.number_of_shards": "1"}) is None
+        assert (
+            self.maintenance.shrink("events-log-c-000001", {"index.number_of_shards": "5"})
+            == "shrink-events-log-c-000001"
+        )
+        assert self.requests == []
+
+
+if __name__ == "__main__":
+    unittest.main()
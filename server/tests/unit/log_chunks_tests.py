@@ -0,0 +1,176 @@
+import unittest
+from unittest import mock
+
+from bll.event import EventBLL
+from bll.event.log_chunks import LogChunker, get_chunk_id, unpack_log_events
+
+
+def _log_event(timestamp, msg="line", task="t1", worker="w1"):
+    return dict(
+        type="log",
+        task=task,
+        worker=worker,
+        timestamp=timestamp,
+        level="info",
+        msg=msg,
+        iter=0,
+    )
+
+
+class TestLogChunker(unittest.TestCase):
+    def test_max_lines(self):
+        chunker = LogChunker(max_lines=2)
+        completed = [
+            chunk for i in range(5) for chunk in chunker.add(_log_event(i, f"m{i}"))
+        ]
+        completed.extend(chunker.flush())
+        assert [c["line_count"] for c in completed] == [2, 2, 1]
+        assert [(c["timestamp"], c["last_timestamp"]) for c in completed] == [
+            (0, 1),
+            (2, 3),
+            (4, 4),
+        ]
+        assert completed[0]["lines"] == [
+            dict(timestamp=0, iter=0, level="info", msg="m0"),
+            dict(timestamp=1, iter=0, level="info", msg="m1"),
+        ]
+        assert chunker.flush() == []
+
+    def test_max_bytes(self):
+        chunker = LogChunker(max_lines=100, max_bytes=10)
+        assert chunker.add(_log_event(0, "x" * 6)) == []
+        completed = chunker.add(_log_event(1, "x" * 6))
+        assert [c["line_count"] for c in completed] == [1]
+        # a single line larger than the limit still gets its own chunk
+        completed = chunker.add(_log_event(2, "x" * 20))
+        assert [c["line_count"] for c in completed] == [1]
+        assert [c["line_count"] for c in chunker.flush()] == [1]
+
+    def test_chunks_per_task_and_worker(self):
+        chunker = LogChunker(max_lines=10)
+        completed = []
+        for task, worker in (("t1", "w1"), ("t2", "w1"), ("t1", "w1"), ("t1", "w2")):
+            completed.extend(chunker.add(_log_event(0, task=task, worker=worker)))
+        chunks = completed + sorted(chunker.flush(), key=lambda c: c["task"])
+        assert [(c["task"], c["worker"], c["line_count"]) for c in chunks] == [
+            ("t1", "w1", 2),
+            ("t1", "w2", 1),
+            ("t2", "w1", 1),
+        ]
+
+    def test_interleaved_workers(self):
+        # lines of workers reporting the same task are chunked in the order they were reported
+        chunker = LogChunker(max_lines=10)
+        completed = []
+        for timestamp, worker in ((1, "w1"), (2, "w1"), (3, "w2"), (4, "w1"), (5, "w2")):
+            completed.extend(chunker.add(_log_event(timestamp, worker=worker)))
+        chunks = completed + chunker.flush()
+        assert [(c["worker"], c["timestamp"], c["last_timestamp"]) for c in chunks] == [
+            ("w1", 1, 2),
+            ("w2", 3, 3),
+            ("w1", 4, 4),
+            ("w2", 5, 5),
+        ]
+        lines = [e["timestamp"] for c in chunks for e in unpack_log_events(c)]
+        assert lines == sorted(lines)
+
+    def test_unpack(self):
+        chunker = LogChunker()
+        for i in range(3):
+            chunker.add(_log_event(i, f"m{i}"))
+        (chunk,) = chunker.flush()
+        events = unpack_log_events(chunk)
+        assert [(e["timestamp"], e["msg"]) for e in events] == [
+            (0, "m0"),
+            (1, "m1"),
+            (2, "m2"),
+        ]
+        assert all(e["task"] == "t1" and e["worker"] == "w1" for e in events)
+        assert not any(
+            field in e for e in events for field in ("lines", "line_count", "last_timestamp")
+        )
+        assert [e["msg"] for e in unpack_log_events(chunk, reverse=True)] == [
+            "m2",
+            "m1",
+            "m0",
+        ]
+
+        event = _log_event(5)
+        assert unpack_log_events(event) == [event]
+
+    def test_chunk_ids_ordered(self):
+        ids = [get_chunk_id() for _ in range(1000)]
+        assert len(set(ids)) == len(ids)
+        assert ids == sorted(ids)
+
+
+class TestScrollLogChunks(unittest.TestCase):
+    def setUp(self):
+        self.es = mock.Mock()
+        self.es.indices.exists.return_value = True
+        self.event_bll = EventBLL(events_es=self.es)
+        self.event_bll.log_chunks = True
+        self.event_bll.log_chunk_max_lines = 3
+
+    @staticmethod
+    def _chunk_hit(uid, timestamp, msgs):
+        lines = [dict(timestamp=timestamp, level="info", msg=m) for m in msgs]
+        return {
+            "_source": dict(
+                type="log",
+                task="t1",
+                timestamp=timestamp,
+                last_timestamp=timestamp,
+                line_count=len(lines),
+                lines=lines,
+            ),
+            "sort": [timestamp, f"event#{uid}"],
+        }
+
+    def test_chunks_tied_on_timestamp(self):
+        # chunks starting at the same time are ordered by their (write ordered) IDs
+        hits = [
+            self._chunk_hit("a", 100, ["m0", "m1", "m2"]),
+            self._chunk_hit("b", 100, ["m3", "m4"]),
+        ]
+        self.es.search.return_value = {
+            "hits": {"hits": hits},
+            "aggregations": {"lines": {"value": 5}},
+        }
+        events, cursor, total = self.event_bll.scroll_task_events(
+            "c", "t1", order="asc", event_type="log", batch_size=4
+        )
+        assert [e["msg"] for e in events] == ["m0", "m1", "m2", "m3"]
+        assert total == 5
+        body = self.es.search.call_args[1]["body"]
+        assert body["sort"] == [
+            {"timestamp": {"order": "asc"}},
+            {"_uid": {"order": "asc"}},
+        ]
+
+        # the cursor continues the second chunk after its first line
+        self.es.search.return_value = {
+            "hits": {"hits": hits[1:]},
+            "aggregations": {"lines": {"value": 5}},
+        }
+        events, cursor, _ = self.event_bll.scroll_task_events(
+            "c", "t1", order="asc", event_type="log", batch_size=4, scroll_id=cursor
+        )
+        assert [e["msg"] for e in events] == ["m4"]
+        assert self.es.search.call_args[1]["body"]["search_after"] == [100, "event#a"]
+
+    def test_desc_tiebreaker(self):
+        self.es.search.return_value = {
+            "hits": {"hits": []},
+            "aggregations": {"lines": {"value": 0}},
+        }
+        self.event_bll.scroll_task_events("c", "t1", order="desc", event_type="log")
+        body = self.es.search.call_args[1]["body"]
+        assert body["sort"] == [
+            {"timestamp": {"order": "desc"}},
+            {"_uid": {"order": "desc"}},
+        ]
+
+
+if __name__ == "__main__":
+    unittest.main()
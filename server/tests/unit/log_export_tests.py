@@ -0,0 +1,70 @@
+import gzip
+import json
+import unittest
+
+from bll.event.log_export import accepts_gzip, iter_output_chunks
+from service_repo.apicall import APICall
+
+
+class TestAcceptsGzip(unittest.TestCase):
+    def test_accepted(self):
+        assert accepts_gzip("gzip")
+        assert accepts_gzip("gzip, deflate, br")
+        assert accepts_gzip("deflate;q=1.0, GZIP;q=0.5")
+        assert accepts_gzip("x-gzip")
+        assert accepts_gzip("*")
+        assert accepts_gzip("br, *;q=0.1")
+
+    def test_refused(self):
+        assert not accepts_gzip(None)
+        assert not accepts_gzip("")
+        assert not accepts_gzip("identity")
+        assert not accepts_gzip("deflate, br")
+        assert not accepts_gzip("gzip;q=0")
+        assert not accepts_gzip("gzip; q=0.000")
+        assert not accepts_gzip("*, gzip;q=0")
+        assert not accepts_gzip("*;q=0")
+        assert not accepts_gzip("gzip;q=invalid")
+        # not a substring match
+        assert not accepts_gzip("nogzip")
+
+
+class TestOutputChunks(unittest.TestCase):
+    lines = [f"line {i}\n" for i in range(100)]
+
+    def test_buffering(self):
+        chunks = list(iter_output_chunks(self.lines, buffer_size=100))
+        assert b"".join(chunks) == "".join(self.lines).encode()
+        assert all(len(chunk) >= 100 for chunk in chunks[:-1])
+
+    def test_compressed(self):
+        chunks = list(iter_output_chunks(self.lines, buffer_size=100, compress=True))
+        assert gzip.decompress(b"".join(chunks)) == "".join(self.lines).encode()
+
+    def test_empty(self):
+        assert list(iter_output_chunks([])) == []
+        assert gzip.decompress(b"".join(iter_output_chunks([], compress=True))) == b""
+
+
+class TestRawResponse(unittest.TestCase):
+    def test_raw_data_with_status(self):
+        call = APICall("events.download_task_log", headers={})
+        call.result.code = 416
+        call.result.content_type = "text/plain"
+        call.result.raw_data = ""
+        assert call.get_response() == ("", "text/plain")
+
+    def test_error_replaces_raw_data(self):
+        call = APICall("events.download_task_log", headers={})
+        call.result.raw_data = "data"
+        call.result.direct_passthrough = True
+        call.set_error_result(msg="failed", code=400)
+        content, content_type = call.get_response()
+        assert content_type == "application/json"
+        # the error response is compressed as usual
+        assert not call.result.direct_passthrough
+        assert json.loads(content)["meta"]["result_code"] == 400
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import unittest
+from unittest import mock
+
+from elasticsearch import RequestError
+
+from apierrors import errors
+from bll.event import EventBLL
+from bll.event.search_cursor import decode_cursor, encode_cursor
+
+
+def _hit(uid, timestamp, msg, highlight=None):
+    hit = {
+        "_source": dict(type="log", task="t1", timestamp=timestamp, msg=msg),
+        "sort": [timestamp, f"event#{uid}"],
+    }
+    if highlight:
+        hit["highlight"] = highlight
+    return hit
+
+
+def _search_result(*hits, total=None):
+    return {"hits": {"total": len(hits) if total is None else total, "hits": list(hits)}}
+
+
+class TestSearchTaskLog(unittest.TestCase):
+    def setUp(self):
+        self.es = mock.Mock()
+        self.es.indices.exists.return_value = True
+        self.event_bll = EventBLL(events_es=self.es)
+        self.event_bll.log_indexed = True
+
+    def search(self, query="loss", **kwargs):
+        return self.event_bll.search_task_log("c", "t1", query, **kwargs)
+
+    @property
+    def search_body(self):
+        return self.es.search.call_args[1]["body"]
+
+    def test_match(self):
+        self.es.search.return_value = _search_result()
+        for match, msg_query in (
+            ("phrase", {"match_phrase": {"msg": "loss"}}),
+            ("term", {"match": {"msg": {"query": "loss", "operator": "and"}}}),
+            ("regex", {"regexp": {"msg.raw": "loss"}}),
+        ):
+            self.search(match=match)
+            assert self.search_body["query"]["bool"]["must"] == [msg_query]
+            assert self.es.search.call_args[1]["routing"] == "t1"
+
+        with self.assertRaises(errors.bad_request.FieldsValueError):
+            self.search(match="fuzzy")
+
+    def test_filters(self):
+        self.es.search.return_value = _search_result()
+        self.search()
+        assert self.search_body["query"]["bool"]["filter"] == [{"term": {"task": "t1"}}]
+
+        self.search(levels=["error", "warning"], from_timestamp=100)
+        assert self.search_body["query"]["bool"]["filter"] == [
+            {"term": {"task": "t1"}},
+            {"terms": {"level": ["error", "warning"]}},
+            {"range": {"timestamp": {"gte": 100}}},
+        ]
+
+        self.search(from_timestamp=100, to_timestamp=200)
+        assert self.search_body["query"]["bool"]["filter"][-1] == {
+            "range": {"timestamp": {"gte": 100, "lte": 200}}
+        }
+
+    def test_highlight(self):
+        self.es.search.return_value = _search_result(
+            _hit("a", 1, "train loss 1", {"msg": ["train <em>loss</em> 1"]}),
+            _hit("b", 2, "val loss 2", {"msg.raw": ["<em>val loss 2</em>"]}),
+            _hit("c", 3, "loss"),
+        )
+        results, _, total = self.search()
+        assert total == 3
+        assert [r["event"]["msg"] for r in results] == ["train loss 1", "val loss 2", "loss"]
+        assert [r["highlight"] for r in results] == [
+            "train <em>loss</em> 1",
+            "<em>val loss 2</em>",
+            None,
+        ]
+        assert all(r["context_before"] == r["context_after"] == [] for r in results)
+        assert not self.es.msearch.called
+
+    def test_paging(self):
+        self.es.search.return_value = _search_result(
+            _hit("a", 1, "loss 1"), _hit("b", 1, "loss 2"), total=3
+        )
+        results, cursor, total = self.search(batch_size=2)
+        assert [r["event"]["msg"] for r in results] == ["loss 1", "loss 2"]
+        assert total == 3
+        assert self.search_body["size"] == 2
+        assert self.search_body["sort"] == [
+            {"timestamp": {"order": "asc"}},
+            {"_uid": {"order": "asc"}},
+        ]
+        assert "search_after" not in self.search_body
+        # the cursor follows the last hit, including its tiebreaker
+        assert decode_cursor(cursor) == [1, "event#b"]
+
+        self.es.search.return_value = _search_result(_hit("c", 2, "loss 3"), total=3)
+        results, next_cursor, _ = self.search(batch_size=2, cursor=cursor)
+        assert [r["event"]["msg"] for r in results] == ["loss 3"]
+        assert self.search_body["search_after"] == [1, "event#b"]
+
+        # once exhausted, the same cursor is returned
+        self.es.search.return_value = _search_result(total=3)
+        results, last_cursor, _ = self.search(batch_size=2, cursor=next_cursor)
+        assert results == [] and last_cursor == next_cursor
+
+        with self.assertRaises(errors.bad_request.FieldsValueError):
+            self.search(cursor="not a cursor")
+
+    def test_context_lines(self):
+        self.es.search.return_value = _search_result(_hit("b", 5, "loss"))
+        self.es.msearch.return_value = {
+            "responses": [
+                _search_result(_hit("a2", 4, "before 2"), _hit("a1", 3, "before 1")),
+                _search_result(_hit("c", 6, "after 1")),
+            ]
+        }
+        (result,), _, _ = self.search(context_lines=2)
+        assert [e["msg"] for e in result["context_before"]] == ["before 1", "before 2"]
+        assert [e["msg"] for e in result["context_after"]] == ["after 1"]
+
+        body = self.es.msearch.call_args[1]["body"]
+        headers, requests = body[::2], body[1::2]
+        assert all(h["routing"] == "t1" for h in headers)
+        assert [r["sort"][0]["timestamp"]["order"] for r in requests] == ["desc", "asc"]
+        assert all(r["search_after"] == [5, "event#b"] for r in requests)
+        assert all(r["size"] == 2 for r in requests)
+
+    def test_invalid_regex(self):
+        self.es.search.side_effect = RequestError(400, "search_phase_execution_exception", {})
+        with self.assertRaises(errors.bad_request.InvalidRegexError):
+            self.search(query="[", match="regex")
+
+    def test_missing_index(self):
+        self.es.indices.exists.return_value = False
+        cursor = encode_cursor([1, "event#a"])
+        assert self.search(cursor=cursor) == ([], cursor, 0)
+        assert not self.es.search.called
+
+
+if __name__ == "__main__":
+    unittest.main()
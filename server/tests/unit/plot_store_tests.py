@@ -0,0 +1,133 @@
+import gzip
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from bll.event import plot_store
+from bll.event.plot_store import BlobStore, LocalBlobStore, PlotStore
+
+
+class TestPlotStore(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.blobs = LocalBlobStore(self.path)
+        patch = mock.patch.object(PlotStore, "_add_ref")
+        self.add_ref = patch.start()
+        self.addCleanup(patch.stop)
+
+    def create_store(self, **kwargs) -> PlotStore:
+        return PlotStore(
+            store=self.blobs, **{"enabled": True, "min_size": 100, **kwargs}
+        )
+
+    @staticmethod
+    def plot_event(task="t1", size=1000):
+        return dict(task=task, type="plot", plot_str=json.dumps({"data": "x" * size}))
+
+    def test_offload_and_rehydrate(self):
+        store = self.create_store()
+        event = self.plot_event()
+        plot_str = event["plot_str"]
+        store.offload(event)
+
+        assert "plot_str" not in event
+        ref = event["plot_ref"]
+        assert ref["codec"] == "gzip" and ref["size"] == len(plot_str)
+        key = f"{ref['hash']}.gzip"
+        assert self.blobs.exists(key)
+        assert gzip.decompress(self.blobs.get(key)).decode() == plot_str
+        self.add_ref.assert_called_once_with("t1", key)
+
+        # read by another store instance, not from the bodies cache
+        self.create_store().rehydrate([event])
+        assert event["plot_str"] == plot_str and "plot_ref" not in event
+
+    def test_small_or_disabled_not_offloaded(self):
+        event = self.plot_event(size=10)
+        self.create_store().offload(event)
+        assert "plot_ref" not in event
+
+        event = self.plot_event()
+        self.create_store(enabled=False).offload(event)
+        assert "plot_ref" not in event
+
+    def test_no_task_not_offloaded(self):
+        event = self.plot_event(task=None)
+        self.create_store().offload(event)
+        assert "plot_ref" not in event and "plot_str" in event
+        assert not self.add_ref.called
+
+    def test_identical_plots_stored_once(self):
+        store = self.create_store()
+        with mock.patch.object(self.blobs, "put", wraps=self.blobs.put) as put:
+            events = [self.plot_event(task) for task in ("t1", "t1", "t2")]
+            for event in events:
+                store.offload(event)
+        assert put.call_count == 1
+        assert len({e["plot_ref"]["hash"] for e in events}) == 1
+        # a reference is recorded once per task
+        assert [c[0][0] for c in self.add_ref.call_args_list] == ["t1", "t2"]
+
+    def test_store_failure_keeps_body(self):
+        store = self.create_store()
+        event = self.plot_event()
+        with mock.patch.object(self.blobs, "put", side_effect=IOError("failed")):
+            store.offload(event)
+        assert "plot_str" in event and "plot_ref" not in event
+
+    def test_missing_blob(self):
+        event = dict(plot_ref=dict(hash="missing", codec="gzip", size=10))
+        self.create_store().rehydrate([event])
+        assert "plot_str" not in event
+
+    def test_compression_selection(self):
+        assert self.create_store().codec == "gzip"
+        with self.assertRaises(ValueError):
+            self.create_store(codec="lz4")
+        with mock.patch.object(plot_store, "zstandard", None):
+            assert self.create_store(codec="zstd").codec == "gzip"
+        if plot_store.zstandard:
+            store = self.create_store(codec="zstd")
+            event = self.plot_event()
+            plot_str = event["plot_str"]
+            store.offload(event)
+            assert event["plot_ref"]["codec"] == "zstd"
+            self.create_store().rehydrate([event])
+            assert event["plot_str"] == plot_str
+
+    def test_delete_task_blobs(self):
+        store = self.create_store()
+        shared, own = self.plot_event(), self.plot_event(size=2000)
+        for event in (shared, own):
+            store.offload(event)
+        shared_key, own_key = (f"{e['plot_ref']['hash']}.gzip" for e in (shared, own))
+
+        task_refs = mock.Mock()
+        task_refs.scalar.return_value = [shared_key, own_key]
+        other_refs = mock.Mock()
+        other_refs.distinct.return_value = [shared_key]
+
+        def objects(task=None, key__in=None):
+            return task_refs if task else other_refs
+
+        with mock.patch.object(plot_store.PlotBlobRef, "objects", side_effect=objects):
+            store.delete_task_blobs("t1")
+
+        task_refs.delete.assert_called_once()
+        assert self.blobs.exists(shared_key)
+        assert not self.blobs.exists(own_key)
+
+    def test_blob_store_interface(self):
+        with self.assertRaises(TypeError):
+            BlobStore()
+        self.blobs.put("abc", b"data")
+        self.blobs.delete("abc")
+        self.blobs.delete("abc")
+        assert self.blobs.get("abc") is None
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+from unittest import mock
+
+from bll.event.refresh_policy import RefreshPolicy, RefreshTracker
+
+
+class TestRefreshPolicy(unittest.TestCase):
+    def test_parse(self):
+        assert RefreshPolicy.parse(True) == RefreshPolicy.true
+        assert RefreshPolicy.parse("true") == RefreshPolicy.true
+        assert RefreshPolicy.parse("wait_for") == RefreshPolicy.wait_for
+        assert RefreshPolicy.parse(False) == RefreshPolicy.none
+        assert RefreshPolicy.parse(None) == RefreshPolicy.none
+        assert RefreshPolicy.parse("none") == RefreshPolicy.none
+        with self.assertRaises(ValueError):
+            RefreshPolicy.parse("sometimes")
+
+
+class TestRefreshTracker(unittest.TestCase):
+    def setUp(self):
+        self.es = mock.Mock()
+        self.tracker = RefreshTracker(self.es, interval_sec=60)
+
+    def refreshed_indices(self):
+        return [c[1]["index"] for c in self.es.indices.refresh.call_args_list]
+
+    def test_refresh_only_written_tasks(self):
+        self.tracker.writes_done("events-log-c", ["t1"], RefreshPolicy.none)
+
+        self.tracker.ensure_visible("events-log-c", ["t2"])
+        assert self.refreshed_indices() == []
+
+        self.tracker.ensure_visible("events-*-c", ["t1", "t2"])
+        assert self.refreshed_indices() == ["events-log-c"]
+
+        # already refreshed
+        self.tracker.ensure_visible("events-log-c", ["t1"])
+        assert self.refreshed_indices() == ["events-log-c"]
+
+    def test_refreshed_policies_are_not_tracked(self):
+        for policy in (RefreshPolicy.true, RefreshPolicy.wait_for):
+            self.tracker.writes_done("events-log-c", ["t1"], policy)
+        self.tracker.ensure_visible("events-log-c", ["t1"])
+        assert self.refreshed_indices() == []
+
+    def test_expired_writes_are_not_refreshed(self):
+        tracker = RefreshTracker(self.es, interval_sec=1)
+        with mock.patch("time.time", return_value=1000):
+            tracker.writes_done("events-log-c", ["t1"], RefreshPolicy.none)
+        with mock.patch("time.time", return_value=1002):
+            tracker.ensure_visible("events-log-c", ["t1"])
+        assert self.refreshed_indices() == []
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+from unittest import mock
+
+from bll.event import EventBLL
+from bll.event.scalar_rollup import ScalarRollup
+
+
+class TestScalarRollup(unittest.TestCase):
+    def setUp(self):
+        self.rollup = ScalarRollup(enabled=True, strides=[100, 10])
+
+    def _event(self, iteration, value, metric="loss"):
+        return dict(task="t1", metric=metric, variant="v", iter=iteration, value=value)
+
+    def test_select_stride(self):
+        # 1000 iterations: stride 100 gives 10 buckets, stride 10 gives 100 buckets
+        assert self.rollup.select_stride(0, 999, 10) == 100
+        assert self.rollup.select_stride(0, 999, 11) == 10
+        assert self.rollup.select_stride(0, 999, 100) == 10
+        assert self.rollup.select_stride(0, 999, 101) is None
+        assert self.rollup.select_stride(500, 999, 5) == 100
+        assert self.rollup.select_stride(0, 999, 0) is None
+        assert ScalarRollup(enabled=False, strides=[10]).select_stride(0, 999, 10) is None
+
+    def test_actions(self):
+        events = [self._event(i, float(i)) for i in range(5, 25)]
+        events.append(dict(task="t1", metric="loss", variant="v", iter=30))
+        actions = self.rollup.get_actions("rollup", events)
+        buckets = {
+            (a["upsert"]["stride"], a["upsert"]["iter"]): a["upsert"] for a in actions
+        }
+        assert set(buckets) == {(10, 0), (10, 10), (10, 20), (100, 0)}
+        bucket = buckets[(10, 10)]
+        assert (bucket["min"], bucket["max"], bucket["sum"], bucket["count"]) == (
+            10.0,
+            19.0,
+            145.0,
+            10,
+        )
+        assert (bucket["last_iter"], bucket["last_value"]) == (19, 19.0)
+        assert buckets[(100, 0)]["count"] == 20
+        assert all(a["_routing"] == "t1" for a in actions)
+        assert len({a["_id"] for a in actions}) == len(actions)
+
+    def test_reported_iteration_replaced(self):
+        actions = self.rollup.get_actions(
+            "rollup", [self._event(3, 1.0), self._event(4, 2.0), self._event(3, 5.0)]
+        )
+        bucket = next(a for a in actions if a["upsert"]["stride"] == 10)
+        assert bucket["upsert"]["count"] == 2
+        assert bucket["upsert"]["sum"] == 7.0
+        assert bucket["upsert"]["max"] == 5.0
+        # only the points of the batch are passed to the merge script, the bucket keeps the summary
+        assert bucket["script"]["params"] == {"points": [[3, 5.0], [4, 2.0]]}
+        assert "values" not in bucket["upsert"]
+
+    def test_disabled(self):
+        rollup = ScalarRollup(enabled=False)
+        assert rollup.get_actions("rollup", [self._event(1, 1.0)]) == []
+
+
+class TestRollupSeries(unittest.TestCase):
+    def setUp(self):
+        self.es = mock.Mock()
+        self.event_bll = EventBLL(events_es=self.es)
+        self.event_bll.scalar_rollup = ScalarRollup(enabled=True, strides=[100, 10])
+        self.event_bll.index_catalog = mock.Mock()
+        self.event_bll.refresh_tracker = mock.Mock()
+        self.last_iters = [("t1", 999)]
+        self.first_iters = [("t1", 0), ("t1", 5)]
+        for name, attr in (("Task", "last_iters"), ("TaskMetric", "first_iters")):
+            patch = mock.patch(f"bll.event.event_bll.{name}.objects")
+            objects = patch.start()
+            self.addCleanup(patch.stop)
+            objects.return_value.scalar.side_effect = (
+                lambda *_, attr=attr: getattr(self, attr)
+            )
+
+    def series(self, max_points=10, **kwargs):
+        return self.event_bll._get_scalar_rollup_series(
+            "c", ["t1"], max_points=max_points, **kwargs
+        )
+
+    def _rollup_result(self, first_iter=0):
+        buckets = [
+            {"key": i, "sum_val": {"value": 10.0}, "count_val": {"value": 10}}
+            for i in (0, 100)
+        ]
+        variants = {"buckets": [{"key": "v", "iters": {"buckets": buckets}}]}
+        metrics = {"buckets": [{"key": "loss", "variants": variants}]}
+        return {
+            "aggregations": {
+                "first": {"buckets": [{"key": "t1", "iter": {"value": first_iter}}]},
+                "in_range": {"tasks": {"buckets": [{"key": "t1", "metrics": metrics}]}},
+            }
+        }
+
+    def test_stride_from_task_last_iteration(self):
+        self.es.search.return_value = self._rollup_result()
+        assert self.series() == {"t1": {"loss": {"v": ([0, 100], [1.0, 1.0])}}}
+        # the raw events are not aggregated
+        assert self.es.search.call_count == 1
+        body = self.es.search.call_args[1]["body"]
+        assert {"term": {"stride": 100}} in body["query"]["bool"]["must"]
+
+        self.series(min_iter=500)
+        body = self.es.search.call_args[1]["body"]
+        assert {"term": {"stride": 10}} in body["query"]["bool"]["must"]
+
+        assert self.series(max_points=1001) is None
+
+    def test_not_covered(self):
+        # the task reported scalars before the rollup was enabled
+        self.es.search.return_value = self._rollup_result(first_iter=100)
+        assert self.series() is None
+
+        self.first_iters = []
+        assert self.series() is None
+
+
+if __name__ == "__main__":
+    unittest.main()
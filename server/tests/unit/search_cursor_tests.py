@@ -0,0 +1,27 @@
+import unittest
+
+from apierrors import errors
+from bll.event.search_cursor import decode_cursor, encode_cursor, is_cursor
+
+
+class TestSearchCursor(unittest.TestCase):
+    def test_round_trip(self):
+        values = [1546300800000, "event#abc-1", 0.5, 3]
+        cursor = encode_cursor(values)
+        assert is_cursor(cursor)
+        assert decode_cursor(cursor) == values
+        assert decode_cursor(encode_cursor([])) == []
+
+    def test_legacy_scroll_id(self):
+        assert not is_cursor("DnF1ZXJ5VGhlbkZldGNoBQAAAAAAAAAB")
+        assert not is_cursor("")
+        assert not is_cursor(None)
+
+    def test_invalid_cursor(self):
+        for cursor in ("c1.!!!", "c1.e30=", encode_cursor([[1]]), encode_cursor([None])):
+            with self.assertRaises(errors.bad_request.FieldsValueError):
+                decode_cursor(cursor)
+
+
+if __name__ == "__main__":
+    unittest.main()
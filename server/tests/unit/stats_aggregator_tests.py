@@ -0,0 +1,233 @@
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from pymongo.errors import BulkWriteError
+
+from bll.task import stats_aggregator
+from bll.task.stats_aggregator import (
+    MetricCatalogStats,
+    MetricStats,
+    TaskStatsAggregator,
+)
+
+
+class TestTaskStatsAggregator(unittest.TestCase):
+    def setUp(self):
+        self.aggregator = TaskStatsAggregator(flush_interval_sec=60)
+        self.aggregator._start_flusher = mock.Mock()
+        self.task_collection = mock.Mock()
+        self.task_collection.bulk_write.return_value.matched_count = 1
+        self.catalog_collection = mock.Mock()
+        patches = [
+            mock.patch.object(
+                stats_aggregator.Task, "_get_collection", return_value=self.task_collection
+            ),
+            mock.patch.object(
+                stats_aggregator.TaskMetric,
+                "_get_collection",
+                return_value=self.catalog_collection,
+            ),
+            mock.patch.object(
+                TaskStatsAggregator,
+                "_get_task_projects",
+                side_effect=lambda task_ids: {t: "p1" for t in task_ids},
+            ),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def add(self, task_id="t1", iteration=1, value=1.0, timestamp=1000):
+        event = dict(
+            metric="loss", variant="total", type="training_stats_scalar",
+            timestamp=timestamp, iter=iteration, value=value,
+        )
+        self.aggregator.add(
+            company_id="c",
+            task_id=task_id,
+            last_update=datetime.utcfromtimestamp(timestamp / 1000),
+            last_iteration=iteration,
+            last_events={"m": {"v": event}},
+            metric_stats={("m", "v"): MetricStats.from_value(iteration, value)},
+            metric_catalog={
+                ("training_stats_scalar", "loss", "total"): MetricCatalogStats(
+                    first_iter=iteration, last_iter=iteration, count=1
+                )
+            },
+        )
+
+    def written_updates(self, collection):
+        return [
+            op._doc
+            for call in collection.bulk_write.call_args_list
+            for op in call[0][0]
+        ]
+
+    def written_ops(self, collection):
+        return [op for call in collection.bulk_write.call_args_list for op in call[0][0]]
+
+    def test_coalesced_update(self):
+        self.add(iteration=1, value=3, timestamp=1000)
+        self.add(iteration=2, value=1, timestamp=2000)
+        self.aggregator.flush()
+
+        pull, update, last_event = self.written_ops(self.task_collection)
+        prefix = "last_metrics.m.v"
+        assert pull._doc == {"$pull": {f"{prefix}.last_values": {"iter": {"$in": [1, 2]}}}}
+        update = update._doc
+        assert update["$max"]["last_iteration"] == 2
+        assert update["$max"]["last_update"] == datetime.utcfromtimestamp(2)
+        assert update["$min"][f"{prefix}.min_value"] == 1
+        assert update["$max"][f"{prefix}.max_value"] == 3
+        assert "$set" not in update
+
+        # the whole last event entry is written only if the stored one is not newer
+        assert last_event._filter["$or"] == [
+            {f"{prefix}.timestamp": {"$lte": datetime.utcfromtimestamp(2)}},
+            {f"{prefix}.timestamp": {"$exists": False}},
+        ]
+        assert last_event._doc["$set"][f"{prefix}.timestamp"] == datetime.utcfromtimestamp(2)
+        assert last_event._doc["$set"][f"{prefix}.value"] == 1
+        assert last_event._doc["$set"][f"{prefix}.iter"] == 2
+
+        catalog_update, = self.written_updates(self.catalog_collection)
+        assert catalog_update["$inc"] == {"count": 2}
+        assert catalog_update["$set"] == {"project": "p1"}
+
+        stats = self.aggregator.get_stats()
+        assert stats["requests"] == 2 and stats["updates"] == 1
+        assert stats["coalescing_ratio"] == 2
+        assert stats["pending_tasks"] == 0
+
+    def test_reported_iteration_replaced(self):
+        self.add(iteration=1, value=3, timestamp=1000)
+        self.add(iteration=2, value=2, timestamp=2000)
+        self.add(iteration=1, value=1, timestamp=3000)
+        self.aggregator.flush()
+
+        pull, update, _ = self.written_updates(self.task_collection)
+        prefix = "last_metrics.m.v"
+        assert pull["$pull"][f"{prefix}.last_values"] == {"iter": {"$in": [1, 2]}}
+        assert update["$push"][f"{prefix}.last_values"]["$each"] == [
+            dict(iter=1, value=1),
+            dict(iter=2, value=2),
+        ]
+
+    def test_values_not_pushed_if_not_pulled(self):
+        self.add(iteration=1)
+        self.task_collection.bulk_write.side_effect = [Exception("failed")]
+        self.aggregator.flush()
+        assert self.task_collection.bulk_write.call_count == 1
+        pending = self.aggregator._pending[("c", "t1")]
+        assert pending.metric_stats[("m", "v")].last_values == [(1, 1.0)]
+        assert list(pending.last_events) == [("m", "v")]
+
+    def test_failed_last_event_is_retried(self):
+        self.add(iteration=1)
+        self.task_collection.bulk_write.side_effect = [
+            mock.Mock(),
+            mock.Mock(matched_count=1),
+            Exception("failed"),
+        ]
+        self.aggregator.flush()
+        pending = self.aggregator._pending[("c", "t1")]
+        # only the last event is retried, the written statistics are not applied again
+        assert list(pending.last_events) == [("m", "v")]
+        assert not pending.metric_stats and pending.last_iteration is None
+
+    def test_catalog_retried_on_project_lookup_failure(self):
+        self.add(iteration=1)
+        with mock.patch.object(
+            TaskStatsAggregator, "_get_task_projects", side_effect=Exception("failed")
+        ):
+            self.aggregator.flush()
+        assert not self.catalog_collection.bulk_write.called
+        pending = self.aggregator._pending[("c", "t1")]
+        assert list(pending.metric_catalog) == [("training_stats_scalar", "loss", "total")]
+        assert not pending.last_events
+
+    def test_resent_images_replaced(self):
+        self.aggregator.add(
+            company_id="c",
+            task_id="t1",
+            last_update=datetime.utcnow(),
+            metric_catalog={
+                ("training_debug_image", "samples", "input"): MetricCatalogStats(
+                    first_iter=0, last_iter=2, count=2, images={2: "b", 0: "a"}
+                )
+            },
+        )
+        self.aggregator.flush()
+
+        pull, push = self.written_updates(self.catalog_collection)
+        assert pull == {"$pull": {"images": {"iter": {"$in": [0, 2]}}}}
+        assert push["$push"]["images"]["$each"] == [
+            dict(iter=0, url="a"),
+            dict(iter=2, url="b"),
+        ]
+
+    def test_images_not_pushed_if_not_pulled(self):
+        self.aggregator.add(
+            company_id="c",
+            task_id="t1",
+            last_update=datetime.utcnow(),
+            metric_catalog={
+                ("training_debug_image", "samples", "input"): MetricCatalogStats(
+                    first_iter=0, last_iter=0, count=1, images={0: "a"}
+                )
+            },
+        )
+        self.catalog_collection.bulk_write.side_effect = [Exception("failed")]
+        self.aggregator.flush()
+        assert self.catalog_collection.bulk_write.call_count == 1
+        pending = self.aggregator._pending[("c", "t1")]
+        assert pending.metric_catalog[
+            ("training_debug_image", "samples", "input")
+        ].images == {0: "a"}
+
+    def test_failed_flush_is_retried(self):
+        self.add(iteration=1)
+        self.task_collection.bulk_write.side_effect = Exception("network error")
+        self.aggregator.flush()
+
+        self.add(iteration=2)
+        self.task_collection.bulk_write.side_effect = None
+        self.aggregator.flush()
+
+        failed_pull, pull, retried, last_event = self.written_updates(self.task_collection)
+        assert retried["$max"]["last_iteration"] == 2
+        assert last_event["$set"]["last_metrics.m.v.iter"] == 2
+        # the catalog was written by the first flush, so it is not retried
+        assert [u["$inc"] for u in self.written_updates(self.catalog_collection)] == [
+            {"count": 1},
+            {"count": 1},
+        ]
+
+    def test_partially_failed_flush(self):
+        self.add(task_id="t1")
+        self.add(task_id="t2")
+        self.task_collection.bulk_write.side_effect = [
+            mock.Mock(),
+            BulkWriteError({"writeErrors": [{"index": 1, "errmsg": "failed"}]}),
+            mock.Mock(),
+        ]
+        self.aggregator.flush()
+        assert list(self.aggregator._pending) == [("c", "t2")]
+        # the last event of the failed task is left for its retry
+        last_event = self.written_ops(self.task_collection)[-1]
+        assert last_event._filter["_id"] == "t1"
+        assert self.task_collection.bulk_write.call_args[0][0] == [last_event]
+
+    def test_retries_are_limited(self):
+        self.aggregator.max_flush_retries = 1
+        self.add()
+        self.task_collection.bulk_write.side_effect = Exception("failed")
+        self.aggregator.flush()
+        assert self.aggregator._pending
+        self.aggregator.flush()
+        assert not self.aggregator._pending
+
+
+if __name__ == "__main__":
+    unittest.main()
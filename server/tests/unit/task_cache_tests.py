@@ -0,0 +1,34 @@
+import unittest
+from unittest import mock
+
+from bll.task.task_cache import TaskExistenceCache
+
+
+class TestTaskExistenceCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = TaskExistenceCache(max_size=10, ttl_sec=5, negative_ttl_sec=1)
+
+    def test_lookup(self):
+        with mock.patch("time.time", return_value=1000):
+            self.cache.update("c", found=["t1"], missing=["t2"], allow_public=False)
+            assert self.cache.lookup("c", ["t1", "t2", "t3"], False) == ({"t2"}, {"t3"})
+            # cached per company and access
+            assert self.cache.lookup("c", ["t1"], True) == (set(), {"t1"})
+            assert self.cache.lookup("d", ["t1"], False) == (set(), {"t1"})
+
+    def test_expiration(self):
+        with mock.patch("time.time", return_value=1000):
+            self.cache.update("c", found=["t1"], missing=["t2"], allow_public=False)
+        with mock.patch("time.time", return_value=1002):
+            assert self.cache.lookup("c", ["t1", "t2"], False) == (set(), {"t2"})
+        with mock.patch("time.time", return_value=1006):
+            assert self.cache.lookup("c", ["t1", "t2"], False) == (set(), {"t1", "t2"})
+
+    def test_invalidate(self):
+        self.cache.update("c", found=["t1", "t2"], missing=[], allow_public=False)
+        self.cache.invalidate(["t1"])
+        assert self.cache.lookup("c", ["t1", "t2"], False) == (set(), {"t1"})
+
+
+if __name__ == "__main__":
+    unittest.main()